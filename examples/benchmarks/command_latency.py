@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request latency of command endpoints in spawn and persistent mode
+
+spawn starts a shell and a Python interpreter for every request; persistent
+sends each request to a warm examples/persistent_worker.py process.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+from uripoint import UriPointCLI
+from uripoint.dispatch import dispatch_request
+
+WORKER = f'{sys.executable} {os.path.join(ROOT, "examples", "persistent_worker.py")}'
+SPAWN = f'{sys.executable} -c "import json, os; print(json.dumps({{\'worker\': os.getpid()}}))"'
+
+def measure(cli: UriPointCLI, path: str, requests: int) -> list:
+    dispatch_request(cli.router, 8080, 'GET', path)  # warm up
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = dispatch_request(cli.router, 8080, 'GET', path)
+        timings.append(time.perf_counter() - start)
+        assert response.status == 200, response.body
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint command latency benchmark')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    cli = UriPointCLI()
+    cli.create_endpoint('http://localhost:8080/spawn', {'response': {}, 'command': SPAWN})
+    cli.create_endpoint('http://localhost:8080/persistent',
+                        {'response': {}, 'command': WORKER, 'exec_mode': 'persistent',
+                         'pool_size': 1})
+    try:
+        for mode in ('spawn', 'persistent'):
+            timings = measure(cli, f'/{mode}', args.requests)
+            print(f"{mode:>10}: median {statistics.median(timings) * 1000:8.3f} ms  "
+                  f"p99 {sorted(timings)[int(len(timings) * 0.99) - 1] * 1000:8.3f} ms")
+    finally:
+        cli.router.close_command_pools()
+
+if __name__ == '__main__':
+    main()
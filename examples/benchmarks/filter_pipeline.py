@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark StreamFilterRouter filtering with short filter chains
+
+Compares the compiled filter pipeline against the previous loop over
+self.filters.items() for chains of 1 to 5 filters, as typically used to
+validate, convert and scale sensor readings. "loop" and "apply" filter a
+message with the old loop and apply_filters(), "pipeline" calls a pipeline
+fetched once with get_filter_pipeline(). "old process" and "process" route
+and filter a message the way process() used to and through process().
+Each figure is the best of several runs.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint.router import StreamFilterRouter
+
+# Cheap filters, so the timings show the per-message dispatch overhead
+FILTERS = [
+    ('validate', lambda value: value if value == value else 0.0),
+    ('celsius', lambda value: value - 273.15),
+    ('clamp', lambda value: min(max(value, -50.0), 150.0)),
+    ('scale', lambda value: value * 10),
+    ('truncate', int),
+]
+
+def loop_filters(filters, data):
+    result = data
+    for filter_name, filter_func in filters.items():
+        result = filter_func(result)
+    return result
+
+def loop_process(router, uri, data):
+    """process() as it was before filters were compiled"""
+    pattern = router._match_pattern(uri)
+    if pattern is None:
+        return None
+    handler = router.routes.get(pattern)
+    if handler:
+        return handler(loop_filters(router.filters, data))
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint filter pipeline benchmark')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    reading = 293.15
+    uri = 'mqtt://broker/sensors/temp'
+    for count in range(1, len(FILTERS) + 1):
+        router = StreamFilterRouter(route_cache_size=16)
+        router.add_route('mqtt://broker/sensors/', float)
+        for name, func in FILTERS[:count]:
+            router.add_filter(name, func)
+        assert router.apply_filters(reading) == loop_filters(router.filters, reading)
+        assert router.process(uri, reading) == loop_process(router, uri, reading)
+
+        filters = router.filters
+        pipeline = router.get_filter_pipeline().run
+        results = {'loop': [], 'apply': [], 'pipeline': [], 'old process': [], 'process': []}
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                loop_filters(filters, reading)
+            results['loop'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                router.apply_filters(reading)
+            results['apply'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                pipeline(reading)
+            results['pipeline'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                loop_process(router, uri, reading)
+            results['old process'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                router.process(uri, reading)
+            results['process'].append(time.perf_counter() - start)
+        print(f"{count} filters: " + ', '.join(
+            f"{name} {min(times) / args.messages * 1e9:5.0f} ns/msg"
+            for name, times in results.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of request logging on serving throughput
+
+Compares three setups on the threading engine:
+  sync-debug  every per-request message written synchronously (the old print() behaviour)
+  queued      default access log through the background queue writer
+  off         logging not configured
+
+Logs go to stdout and results to stderr, so run it as e.g.
+  python examples/benchmarks/logging_overhead.py > /tmp/uripoint.log
+"""
+import argparse
+import http.client
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint import UriPointCLI
+from uripoint.access_log import access_logger, configure_logging, logger, shutdown_logging
+from uripoint.cli import EndpointHandler, EndpointTCPServer
+
+def setup_logging(mode: str) -> None:
+    package_logger = logging.getLogger('uripoint')
+    package_logger.handlers.clear()
+    package_logger.propagate = False
+    if mode == 'sync-debug':
+        package_logger.addHandler(logging.StreamHandler(sys.stdout))
+        logger.setLevel(logging.DEBUG)
+        access_logger.setLevel(logging.INFO)
+    elif mode == 'queued':
+        configure_logging()
+    else:
+        logger.setLevel(logging.WARNING)
+        access_logger.setLevel(logging.WARNING)
+
+def run_client(port: int, deadline: float, counts: list) -> None:
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    while time.time() < deadline:
+        conn.request('GET', '/api/status')
+        conn.getresponse().read()
+        done += 1
+    conn.close()
+    counts.append(done)
+
+def benchmark(mode: str, clients: int, duration: float, endpoints: int) -> float:
+    setup_logging(mode)
+    cli = UriPointCLI()
+    server = EndpointTCPServer(
+        ('127.0.0.1', 0),
+        lambda *args, **kwargs: EndpointHandler(*args, router=cli.router, **kwargs))
+    port = server.server_address[1]
+    for i in range(endpoints):
+        cli.create_endpoint(f'http://localhost:{port}/api/item{i}', {'response': {'id': i}})
+    cli.create_endpoint(f'http://localhost:{port}/api/status', {'response': {'status': 'OK'}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    counts = []
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=run_client, args=(port, deadline, counts))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    server.server_close()
+    shutdown_logging()
+    return sum(counts) / duration
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint logging overhead benchmark')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--endpoints', type=int, default=100,
+                        help='Extra endpoints registered on the port')
+    args = parser.parse_args()
+
+    for mode in ('sync-debug', 'queued', 'off'):
+        rps = benchmark(mode, args.clients, args.duration, args.endpoints)
+        print(f"{mode:>10}: {rps:>8.0f} req/s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark NumericFilter against per-message filters on IoT telemetry
+
+Readings follow the temperature sensor schema of
+examples/protocol_examples/mqtt_iot_example.py. Both paths convert Kelvin to
+Celsius, drop invalid readings, apply thresholds and smooth the temperature
+with a moving average:
+
+- per-message: process() once per reading through plain Python filters
+- per-item batch: process_many() with the same Python filters
+- vectorized: process_many() with a NumericFilter; the handler gets a
+  ColumnBatch, "vectorized+records" also converts it back to dicts
+
+Requires numpy.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint.filters import DROP
+from uripoint.router import StreamFilterRouter
+from uripoint.vectorized import NumericFilter
+
+URI = 'mqtt://localhost:1883/sensors/temperature'
+SCHEMA = {
+    'temperature': 'float',
+    'humidity': 'float',
+    'battery': 'int',
+    'timestamp': 'string'
+}
+WINDOW = 5
+
+def make_readings(count: int) -> list:
+    rng = random.Random(1)
+    readings = []
+    for i in range(count):
+        reading = {'temperature': rng.gauss(294.0, 3.0), 'humidity': rng.uniform(20, 110),
+                   'battery': rng.randint(0, 100), 'timestamp': f'2024-01-01T00:00:{i % 60:02d}'}
+        if i % 50 == 0:
+            reading['temperature'] = None
+        readings.append(reading)
+    return readings
+
+def per_item_filters() -> list:
+    window = deque(maxlen=WINDOW)
+
+    def convert(reading):
+        if reading['temperature'] is None:
+            return DROP
+        return dict(reading, temperature=reading['temperature'] - 273.15)
+
+    def validate(reading):
+        for field in ('temperature', 'humidity', 'battery'):
+            value = reading.get(field)
+            if value is None or not math.isfinite(value):
+                return DROP
+        return reading
+
+    def thresholds(reading):
+        if not 0 <= reading['humidity'] <= 100 or reading['battery'] < 10:
+            return DROP
+        return reading
+
+    def smooth(reading):
+        window.append(reading['temperature'])
+        return dict(reading, temperature=sum(window) / len(window))
+
+    return [('convert', convert), ('validate', validate),
+            ('thresholds', thresholds), ('smooth', smooth)]
+
+def build_router(vectorized: bool, handler) -> StreamFilterRouter:
+    router = StreamFilterRouter()
+    router.add_route(URI, handler)
+    if vectorized:
+        router.add_filter('numeric', NumericFilter(
+            SCHEMA, convert={'temperature': (1.0, -273.15)},
+            limits={'humidity': (0, 100), 'battery': (10, None)},
+            smooth={'temperature': WINDOW}))
+    else:
+        for name, func in per_item_filters():
+            router.add_filter(name, func)
+    return router
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint vectorized filter benchmark')
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    readings = make_readings(args.readings)
+    batches = [readings[i:i + args.batch] for i in range(0, len(readings), args.batch)]
+
+    def run_single(router):
+        return [router.process(URI, reading) for reading in readings]
+
+    def run_batches(router):
+        return [router.process_many(URI, batch) for batch in batches]
+
+    cases = [
+        ('per-message', build_router(False, lambda reading: reading), run_single),
+        ('per-item batch', build_router(False, lambda batch: batch), run_batches),
+        ('vectorized', build_router(True, lambda batch: batch), run_batches),
+        ('vectorized+records', build_router(True, lambda batch: batch.records()), run_batches),
+    ]
+    results = {}
+    for name, router, run in cases:
+        start = time.perf_counter()
+        results[name] = run(router)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18}: {elapsed / args.readings * 1e9:8.0f} ns/reading")
+
+    kept = sum(1 for reading in results['per-message'] if reading is not None)
+    assert kept == sum(len(batch) for batch in results['vectorized'] if batch is not None)
+    print(f"{kept} of {args.readings} readings kept")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark protocol handler lookup: shared registry versus a handler per call
+
+"factory" reproduces the old get_protocol_handler, which rebuilt the scheme
+table and created a new handler on every call; "registry" is the current
+lookup of one shared instance per protocol.
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint import protocols
+from uripoint.protocols import get_protocol_handler
+
+def factory_handler(protocol: str):
+    handlers = {
+        'http': protocols.HTTPHandler,
+        'https': protocols.HTTPHandler,
+        'rtsp': protocols.RTSPHandler,
+        'hls': protocols.HLSHandler,
+        'dash': protocols.DASHHandler,
+        'mqtt': protocols.MQTTHandler,
+        'ws': protocols.WebSocketHandler,
+        'wss': protocols.WebSocketHandler,
+        'redis': protocols.RedisHandler,
+        'smtp': protocols.SMTPHandler,
+        'amqp': protocols.AMQPHandler,
+        'dns': protocols.DNSHandler
+    }
+    handler_class = handlers.get(protocol)
+    if handler_class:
+        return handler_class()
+    return None
+
+def allocations(lookup, calls: int) -> float:
+    """Bytes allocated per call, keeping every result alive as a request would"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [lookup('http') for _ in range(calls)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    list_overhead = sys.getsizeof(kept)
+    return max(0.0, (after - before - list_overhead) / calls)
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint protocol handler lookup benchmark')
+    parser.add_argument('--calls', type=int, default=200000)
+    args = parser.parse_args()
+
+    for name, lookup in (('factory', factory_handler), ('registry', get_protocol_handler)):
+        seconds = timeit.timeit(lambda: lookup('http'), number=args.calls)
+        per_call = allocations(lookup, min(args.calls, 20000))
+        print(f"{name:>8}: {seconds / args.calls * 1e9:7.0f} ns/call  "
+              f"{per_call:6.1f} bytes retained/call")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark StreamFilterRouter.match_route with many routes
+
+Compares the compiled route table against the previous linear loop of
+re.match() calls over every pattern. Most routes are literal topics, as in
+MQTT/IoT deployments, with a share of regex patterns.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint.router import StreamFilterRouter
+
+def linear_match(routes, uri):
+    for pattern, handler in routes.items():
+        if re.match(pattern, uri):
+            return handler
+    return None
+
+def build_routes(count: int, regex_share: float) -> dict:
+    routes = {}
+    for i in range(count):
+        if i % int(1 / regex_share) == 0:
+            routes[rf'mqtt://broker/zone{i}/[a-z]+/\d+$'] = i
+        else:
+            routes[f'mqtt://broker/devices/{i}/telemetry'] = i
+    return routes
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint route matching benchmark')
+    parser.add_argument('--routes', type=int, default=10000)
+    parser.add_argument('--regex-share', type=float, default=0.1,
+                        help='Fraction of routes that are regex patterns')
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    routes = build_routes(args.routes, args.regex_share)
+    router = StreamFilterRouter()
+    for pattern, handler in routes.items():
+        router.add_route(pattern, handler)
+
+    rng = random.Random(1)
+    uris = []
+    for _ in range(args.lookups):
+        i = rng.randrange(args.routes)
+        uris.append(f'mqtt://broker/zone{i}/temp/42' if i % int(1 / args.regex_share) == 0
+                    else f'mqtt://broker/devices/{i}/telemetry/raw')
+    uris.append('mqtt://broker/unknown')
+
+    start = time.perf_counter()
+    router.match_route(uris[0])
+    compile_time = time.perf_counter() - start
+
+    for name, match in (('linear', lambda uri: linear_match(routes, uri)),
+                        ('compiled', router.match_route)):
+        lookups = uris if name == 'compiled' else uris[:max(1, len(uris) // 20)]
+        start = time.perf_counter()
+        for uri in lookups:
+            match(uri)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: {elapsed / len(lookups) * 1e6:10.1f} us/match")
+    print(f"route table compiled in {compile_time * 1000:.1f} ms for {args.routes} routes")
+
+    for uri in uris[:200]:
+        assert router.match_route(uri) == linear_match(routes, uri), uri
+
+if __name__ == '__main__':
+    main()
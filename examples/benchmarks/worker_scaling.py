@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark requests per second of `uripoint --serve` with 1..N worker processes
+
+Each run starts UriPointCLI.serve(workers=N) in a child process, drives it
+with several client processes for a fixed duration and reports throughput.
+
+Usage: python examples/benchmarks/worker_scaling.py [--workers 1 2 4] [--duration 5]
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from uripoint import UriPointCLI
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_server(port: int, workers: int, engine: str) -> None:
+    sys.stdout = open(os.devnull, 'w')
+    cli = UriPointCLI()
+    cli.create_endpoint(f'http://localhost:{port}/api/status',
+                        {'response': {'status': 'OK', 'items': list(range(50))}})
+    cli.serve(engine=engine, workers=workers)
+
+def run_client(port: int, duration: float, counter) -> None:
+    request = b'GET /api/status HTTP/1.0\r\nHost: localhost\r\n\r\n'
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+                sock.sendall(request)
+                while sock.recv(65536):
+                    pass
+            done += 1
+        except OSError:
+            pass
+    with counter.get_lock():
+        counter.value += done
+
+def wait_for_port(port: int, timeout: float = 10) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def benchmark(workers: int, clients: int, duration: float, engine: str) -> float:
+    port = free_port()
+    server = multiprocessing.Process(target=run_server, args=(port, workers, engine))
+    server.start()
+    try:
+        wait_for_port(port)
+        time.sleep(1)  # let every worker bind
+        counter = multiprocessing.Value('i', 0)
+        procs = [multiprocessing.Process(target=run_client, args=(port, duration, counter))
+                 for _ in range(clients)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        return counter.value / duration
+    finally:
+        # SIGINT lets the supervisor terminate its workers
+        os.kill(server.pid, signal.SIGINT)
+        server.join(10)
+        if server.is_alive():
+            server.terminate()
+
+def main():
+    parser = argparse.ArgumentParser(description='UriPoint worker scaling benchmark')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--engine', choices=['threading', 'asyncio'], default='threading')
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        rps = benchmark(workers, args.clients, args.duration, args.engine)
+        baseline = baseline or rps
+        print(f"{workers:>8} {rps:>10.0f} {rps / baseline:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
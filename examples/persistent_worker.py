@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Example worker for a command endpoint with ``exec_mode: persistent``
+
+UriPoint starts this script once per pool slot and keeps it running. Each
+request arrives on stdin as one JSON line; the response is one line on stdout.
+
+    uripoint --uri http://localhost:9000/api/report \
+        --data '{"response": {}, "command": "python3 examples/persistent_worker.py",
+                 "exec_mode": "persistent", "pool_size": 4}'
+"""
+import json
+import os
+import sys
+import time
+
+def handle(request):
+    """
+    Build the response for one request
+
+    :param request: Dict with the endpoint uri and path, the request method and
+                    the values of any path template parameters
+    :return: JSON-serializable response
+    """
+    return {
+        'path': request['path'],
+        'method': request['method'],
+        'params': request.get('params', {}),
+        'worker': os.getpid(),
+        'time': time.time(),
+    }
+
+def main():
+    # Expensive setup (imports, models, connections) happens once, here
+    for line in sys.stdin:
+        request = json.loads(line)
+        sys.stdout.write(json.dumps(handle(request)) + '\n')
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,12 @@ setup(
         'requests>=2.28.0'
     ],
     extras_require={
+        'brotli': [
+            'brotli>=1.0.9'
+        ],
+        'numpy': [
+            'numpy>=1.22'
+        ],
         'dev': [
             'pytest>=7.0.0',
             'pytest-cov>=4.0.0',
@@ -0,0 +1,71 @@
+"""
+Tests for UriPoint request logging
+"""
+import io
+import json
+import logging
+import pytest
+from uripoint.access_log import (
+    access_logger,
+    configure_logging,
+    log_access,
+    logger,
+    shutdown_logging
+)
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    yield stream
+    shutdown_logging()
+    package_logger = logging.getLogger('uripoint')
+    package_logger.handlers.clear()
+    package_logger.propagate = True
+    logger.setLevel(logging.NOTSET)
+    access_logger.setLevel(logging.NOTSET)
+
+def test_logging_silent_by_default():
+    assert not access_logger.isEnabledFor(logging.INFO)
+    assert not logger.isEnabledFor(logging.DEBUG)
+
+def test_access_log_line(log_stream):
+    configure_logging(stream=log_stream)
+    log_access('127.0.0.1', 'GET', '/api/status', 200, 16, 0.0015)
+    logger.debug("not written at the default level")
+    shutdown_logging()
+
+    lines = log_stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert '127.0.0.1 "GET /api/status" 200 16 1.50ms' in lines[0]
+
+def test_access_log_json_and_levels(log_stream):
+    configure_logging(level='DEBUG', json_format=True, stream=log_stream)
+    log_access('10.0.0.1', 'POST', '/api/items', 201, 2, 0.01)
+    logger.debug("Found matching endpoint: %s", 'http://localhost:8080/api/items')
+    shutdown_logging()
+
+    access, debug = [json.loads(line) for line in log_stream.getvalue().splitlines()]
+    assert access['method'] == 'POST' and access['status'] == 201
+    assert access['logger'] == 'uripoint.access'
+    assert debug['level'] == 'DEBUG'
+    assert debug['message'] == 'Found matching endpoint: http://localhost:8080/api/items'
+
+def test_access_log_sampling_keeps_errors(log_stream):
+    configure_logging(sample_rate=0.0, stream=log_stream)
+    for _ in range(100):
+        log_access('127.0.0.1', 'GET', '/api/status', 200, 16, 0.001)
+    log_access('127.0.0.1', 'GET', '/missing', 404, 0, 0.001)
+    shutdown_logging()
+
+    lines = log_stream.getvalue().splitlines()
+    assert len(lines) == 1 and '/missing' in lines[0]
+
+def test_access_log_disabled(log_stream):
+    configure_logging(access_log=False, stream=log_stream)
+    log_access('127.0.0.1', 'GET', '/api/status', 200, 16, 0.001)
+    shutdown_logging()
+    assert log_stream.getvalue() == ''
+
+def test_invalid_sample_rate():
+    with pytest.raises(ValueError):
+        configure_logging(sample_rate=1.5)
@@ -0,0 +1,316 @@
+"""
+Tests for command endpoint execution support
+"""
+import json
+import threading
+import time
+import pytest
+from uripoint import UriPointCLI, commands
+from uripoint.commands import (
+    CommandError,
+    CommandExecutor,
+    CommandRejected,
+    CommandResultCache,
+    CommandTimeout,
+    PersistentCommandPool
+)
+from uripoint.dispatch import dispatch_request
+from uripoint.router import StreamFilterRouter
+
+class Result:
+    def __init__(self, status, value=None):
+        self.status = status
+        self.value = value
+
+def test_command_cache_memoizes_within_ttl():
+    cache = CommandResultCache(60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return Result(200, len(calls))
+
+    assert cache.get(compute).value == 1
+    assert cache.get(compute).value == 1
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.invalidate()
+    assert cache.get(compute).value == 2
+
+def test_command_cache_does_not_store_errors():
+    cache = CommandResultCache(60)
+    results = [Result(500), Result(200)]
+    assert cache.get(lambda: results.pop(0)).status == 500
+    assert cache.get(lambda: results.pop(0)).status == 200
+    assert not results
+
+def test_command_cache_coalesces_concurrent_misses():
+    cache = CommandResultCache(60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return Result(200)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+
+def test_command_cache_serves_stale_while_revalidating():
+    cache = CommandResultCache(0.05)
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return Result(200, len(calls))
+
+    assert cache.get(compute).value == 1
+    time.sleep(0.1)
+    # Expired: the stale result comes back at once while one refresh runs
+    assert cache.get(compute).value == 1
+    assert cache.get(compute).value == 1
+    release.set()
+    deadline = time.time() + 5
+    while cache.get(compute).value != 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get(compute).value == 2
+    assert len(calls) == 2
+
+def test_command_cache_stale_limit():
+    cache = CommandResultCache(0.05, stale=0)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return Result(200, len(calls))
+
+    assert cache.get(compute).value == 1
+    time.sleep(0.1)
+    assert cache.get(compute).value == 2
+
+@pytest.mark.parametrize('config', [
+    {'cache_ttl': 0},
+    {'cache_ttl': 'soon'},
+    {'cache_ttl': True},
+    {'cache_ttl': 10, 'cache_stale': -1},
+])
+def test_command_cache_rejects_invalid_config(config):
+    router = StreamFilterRouter()
+    with pytest.raises(ValueError):
+        router.add_endpoint('http://localhost:8080/api/run',
+                            {'response': {}, 'command': 'echo hi', **config})
+
+def test_cached_command_endpoint():
+    cli = UriPointCLI()
+    uri = 'http://localhost:8080/api/now'
+    cli.create_endpoint(uri, {'response': {}, 'command': 'date +%s%N', 'cache_ttl': 60})
+    cache = cli.router.get_command_cache(uri)
+    assert cache is not None
+
+    first = dispatch_request(cli.router, 8080, 'GET', '/api/now')
+    second = dispatch_request(cli.router, 8080, 'GET', '/api/now')
+    assert first.status == 200
+    assert second is first
+    assert dispatch_request(cli.router, 8080, 'GET', '/api/now',
+                            {'if-none-match': first.etag}).status == 304
+
+    # Re-registering replaces the cache; endpoints without cache_ttl have none
+    cli.create_endpoint(uri, {'response': {}, 'command': 'date +%s%N'})
+    assert cli.router.get_command_cache(uri) is None
+    cli.router.delete_endpoint(uri)
+    assert cli.router.get_command_cache(uri) is None
+
+def test_executor_runs_command():
+    executor = CommandExecutor(max_workers=2)
+    assert executor.run('echo hello') == 'hello\n'
+    with pytest.raises(CommandError):
+        executor.run('exit 3')
+    stats = executor.stats()
+    assert (stats['completed'], stats['failed'], stats['running']) == (1, 1, 0)
+
+def test_executor_timeout_kills_command():
+    executor = CommandExecutor()
+    start = time.time()
+    with pytest.raises(CommandTimeout):
+        executor.run('sleep 5; echo done', timeout=0.2)
+    assert time.time() - start < 2
+    assert executor.stats()['timed_out'] == 1
+
+def test_executor_rejects_when_queue_full():
+    executor = CommandExecutor(max_workers=1, max_queue=1, queue_timeout=5)
+    threads = [threading.Thread(target=executor.run, args=('sleep 0.5',)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while executor.stats()['queued'] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(CommandRejected) as error:
+        executor.run('echo late')
+    assert error.value.status == 503
+    for thread in threads:
+        thread.join(5)
+    stats = executor.stats()
+    assert (stats['completed'], stats['rejected'], stats['max_queued']) == (2, 1, 1)
+    assert stats['max_wait'] > 0.2
+
+def test_executor_queue_timeout():
+    executor = CommandExecutor(max_workers=1, queue_timeout=0.1)
+    thread = threading.Thread(target=executor.run, args=('sleep 0.5',))
+    thread.start()
+    time.sleep(0.1)
+    with pytest.raises(CommandRejected):
+        executor.run('echo late')
+    thread.join(5)
+    assert executor.run('echo ok') == 'ok\n'
+
+def test_executor_per_endpoint_limit():
+    executor = CommandExecutor(max_workers=4)
+    thread = threading.Thread(target=executor.run, args=('sleep 0.5',),
+                              kwargs={'key': 'a', 'max_concurrency': 1})
+    thread.start()
+    time.sleep(0.1)
+    with pytest.raises(CommandRejected) as error:
+        executor.run('echo a', key='a', max_concurrency=1)
+    assert error.value.status == 429
+    assert executor.run('echo b', key='b', max_concurrency=1) == 'b\n'
+    thread.join(5)
+
+def test_command_endpoint_limits(monkeypatch):
+    monkeypatch.setattr(commands, '_executor', CommandExecutor(max_workers=1, max_queue=0))
+    cli = UriPointCLI()
+    cli.create_endpoint('http://localhost:8080/api/slow',
+                        {'response': {}, 'command': 'sleep 5', 'timeout': 0.2})
+    cli.create_endpoint('http://localhost:8080/api/fast', {'response': {}, 'command': 'echo hi'})
+
+    response = dispatch_request(cli.router, 8080, 'GET', '/api/slow')
+    assert response.status == 504
+
+    thread = threading.Thread(target=dispatch_request, args=(cli.router, 8080, 'GET', '/api/slow'))
+    thread.start()
+    time.sleep(0.05)
+    response = dispatch_request(cli.router, 8080, 'GET', '/api/fast')
+    assert response.status == 503
+    assert b'Retry-After: 1' in response.head
+    thread.join(5)
+
+@pytest.mark.parametrize('config', [{'timeout': 0}, {'max_concurrency': 0}, {'max_concurrency': 1.5}])
+def test_command_limits_reject_invalid_config(config):
+    router = StreamFilterRouter()
+    with pytest.raises(ValueError):
+        router.add_endpoint('http://localhost:8080/api/run',
+                            {'response': {}, 'command': 'echo hi', **config})
+
+def test_executor_stream():
+    executor = CommandExecutor(max_workers=1)
+    stream = executor.stream('echo one; echo two', chunk_size=4)
+    assert executor.stats()['running'] == 1
+    assert all(len(chunk) <= 4 for chunk in stream)
+    assert stream.returncode == 0
+    assert executor.stats()['running'] == 0
+    assert executor.stats()['completed'] == 1
+
+    stream = executor.stream('echo partial; sleep 5', timeout=0.2)
+    assert b''.join(stream) == b'partial\n'
+    assert stream.timed_out
+    assert executor.stats()['timed_out'] == 1
+
+    # Closing a stream that was never read still frees its slot
+    executor.stream('sleep 5').close()
+    assert executor.run('echo free') == 'free\n'
+
+def test_streamed_endpoint_cannot_be_cached():
+    router = StreamFilterRouter()
+    with pytest.raises(ValueError):
+        router.add_endpoint('http://localhost:8080/api/run',
+                            {'response': {}, 'command': 'echo hi', 'stream': True, 'cache_ttl': 5})
+
+WORKER = ('python3 -c "import json, os, sys\n'
+          'for line in sys.stdin:\n'
+          '    request = json.loads(line)\n'
+          '    if request[\'path\'] == \'/crash\': sys.exit(1)\n'
+          '    print(json.dumps([os.getpid(), request[\'path\']]), flush=True)"')
+
+def test_persistent_pool_reuses_processes():
+    pool = PersistentCommandPool(WORKER, size=1)
+    try:
+        first = json.loads(pool.request({'path': '/a'}))
+        second = json.loads(pool.request({'path': '/b'}))
+        assert first[1] == '/a' and second[1] == '/b'
+        assert first[0] == second[0]
+
+        with pytest.raises(CommandError):
+            pool.request({'path': '/crash'})
+        assert pool.restarts == 1
+        assert json.loads(pool.request({'path': '/c'}))[0] != first[0]
+    finally:
+        pool.close()
+
+def test_persistent_pool_timeout():
+    pool = PersistentCommandPool('sleep 5', size=1, timeout=0.2)
+    try:
+        start = time.time()
+        with pytest.raises(CommandTimeout):
+            pool.request({'path': '/'})
+        assert time.time() - start < 2
+        assert pool.restarts == 1
+    finally:
+        pool.close()
+
+def test_persistent_command_endpoint():
+    cli = UriPointCLI()
+    uri = 'http://localhost:8080/api/worker'
+    cli.create_endpoint(uri, {'response': {}, 'command': WORKER,
+                              'exec_mode': 'persistent', 'pool_size': 2})
+    pool = cli.router.get_command_pool(uri)
+    assert pool is not None
+    try:
+        response = dispatch_request(cli.router, 8080, 'GET', '/api/worker')
+        assert response.status == 200
+        assert json.loads(response.body)[1] == '/api/worker'
+    finally:
+        cli.router.delete_endpoint(uri)
+    assert cli.router.get_command_pool(uri) is None
+
+def test_persistent_endpoint_receives_template_params():
+    cli = UriPointCLI()
+    uri = 'http://localhost:8080/sessions/{user_id}'
+    cli.create_endpoint(uri, {'response': {}, 'exec_mode': 'persistent', 'pool_size': 1,
+                              'command': 'python3 -c "import json, sys\n'
+                                         'for line in sys.stdin:\n'
+                                         '    print(json.dumps(json.loads(line)[\'params\']), flush=True)"'})
+    try:
+        response = dispatch_request(cli.router, 8080, 'GET', '/sessions/42?verbose=1#top')
+        assert json.loads(response.body) == {'user_id': '42'}
+    finally:
+        cli.router.delete_endpoint(uri)
+
+@pytest.mark.parametrize('config', [
+    {'exec_mode': 'fork'},
+    {'exec_mode': 'persistent', 'pool_size': 0},
+    {'exec_mode': 'persistent', 'stream': True},
+])
+def test_persistent_mode_rejects_invalid_config(config):
+    router = StreamFilterRouter()
+    with pytest.raises(ValueError):
+        router.add_endpoint('http://localhost:8080/api/run',
+                            {'response': {}, 'command': 'echo hi', **config})
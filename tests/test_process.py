@@ -3,7 +3,7 @@ import time
 import multiprocessing
 import threading
 import socket
-from uripoint.process import ManagedProcess
+from uripoint.process import ManagedProcess, ProcessManager
 from uripoint.process_utils import check_existing_processes, get_free_port, kill_existing_processes
 
 def test_managed_process_multiprocessing():
@@ -99,3 +99,22 @@ def test_process_error_handling():
     
     with pytest.raises(ValueError):
         process.join()
+
+def test_process_manager_restart():
+    """Test restarting a managed process that has exited"""
+    counter = multiprocessing.Value('i', 0)
+
+    def increment_counter(counter):
+        with counter.get_lock():
+            counter.value += 1
+
+    manager = ProcessManager()
+    assert manager.start_process('worker', increment_counter, counter)
+    manager.get_process('worker').join()
+    assert manager.list_processes() == {'worker': False}
+
+    assert manager.restart_process('worker')
+    manager.get_process('worker').join()
+    assert counter.value == 2
+    assert manager.restart_process('missing') is False
+    manager.cleanup()
@@ -2,7 +2,8 @@
 Tests for protocol implementations
 """
 import pytest
-from uripoint import UriPointCLI
+from uripoint import UriPointCLI, ProtocolHandler, get_protocol_handler, register_protocol
+from uripoint.protocols import _handlers
 
 def test_mqtt_endpoint():
     cli = UriPointCLI()
@@ -112,3 +113,30 @@ def test_endpoint_validation():
             uri='smtp://smtp.example.com:587/mail',
             data={}  # Missing required TLS setting
         )
+
+def test_protocol_handlers_are_shared():
+    handler = get_protocol_handler('http')
+    assert handler is get_protocol_handler('http')
+    assert get_protocol_handler('https') is not None
+    assert get_protocol_handler('invalid') is None
+
+def test_register_protocol():
+    class CoAPHandler(ProtocolHandler):
+        def validate_config(self, config):
+            return 'resource' in config
+
+        def connect(self):
+            return True
+
+    register_protocol('CoAP', CoAPHandler)
+    try:
+        assert isinstance(get_protocol_handler('coap'), CoAPHandler)
+        assert get_protocol_handler('CoAP') is get_protocol_handler('coap')
+        cli = UriPointCLI()
+        cli.create_endpoint(uri='coap://localhost:5683/sensors', data={'resource': 'temp'})
+        assert cli.get_endpoint('coap://localhost:5683/sensors') is not None
+    finally:
+        _handlers.pop('coap', None)
+
+    with pytest.raises(TypeError):
+        register_protocol('bogus', object)
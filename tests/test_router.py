@@ -1,6 +1,12 @@
+import asyncio
+import pickle
 import pytest
+import re
+import threading
 import os
 from uripoint.router import StreamFilterRouter, get_url_parts, extract_query_params, convert_file_path
+from uripoint.endpoint import Endpoint
+from uripoint.filters import DROP, FilterPipeline, batch_filter, per_item, stream_filter
 
 def test_stream_filter_router():
     # Create router
@@ -91,3 +97,442 @@ def test_router_error_handling():
     # Test processing with no filters
     result = router.apply_filters('test')
     assert result == 'test'
+
+def test_endpoint_route_index():
+    router = StreamFilterRouter()
+    router.add_endpoint('http://localhost:8080/api/status', {'response': {'status': 'OK'}})
+    router.add_endpoint('http://localhost:8080/api/items',
+                        {'response': [], 'methods': ['get', 'POST']})
+    router.add_endpoint('http://localhost:8081/api/status', {'response': {'status': 'OK'}})
+
+    assert router.find_endpoint(8080, '/api/status')['uri'] == 'http://localhost:8080/api/status'
+    assert router.find_endpoint(8081, '/api/status')['port'] == 8081
+    assert router.find_endpoint(8080, '/api/status', 'POST') is None
+    assert router.find_endpoint(8080, '/api/items', 'post') is not None
+    assert sorted(router.get_path_methods(8080, '/api/items')) == ['GET', 'POST']
+    assert router.get_path_methods(8082, '/api/status') == []
+
+    # Re-registering replaces the indexed methods
+    router.add_endpoint('http://localhost:8080/api/items', {'response': [], 'methods': ['PUT']})
+    assert router.get_path_methods(8080, '/api/items') == ['PUT']
+
+    assert router.delete_endpoint('http://localhost:8080/api/status') is True
+    assert router.find_endpoint(8080, '/api/status') is None
+    assert router.delete_endpoint('http://localhost:8080/api/status') is False
+    assert router.find_endpoint(8081, '/api/status') is not None
+
+    # Endpoints on different hosts share the path entry of a port
+    router.add_endpoint('http://localhost:8080/api/shared', {'response': 'a'})
+    router.add_endpoint('http://127.0.0.1:8080/api/shared', {'response': 'b', 'methods': ['POST']})
+    assert router.find_endpoint(8080, '/api/shared')['hostname'] == 'localhost'
+    assert router.find_endpoint(8080, '/api/shared', 'POST')['hostname'] == '127.0.0.1'
+    assert router.delete_endpoint('http://localhost:8080/api/shared') is True
+    assert router.find_endpoint(8080, '/api/shared') is None
+    assert router.get_path_methods(8080, '/api/shared') == ['POST']
+
+def test_route_table_matches_like_re_match():
+    patterns = [
+        'mqtt://broker/sensors/temp',
+        r'^mqtt://broker/sensors/.*',
+        'mqtt://broker/sensors',
+        r'mqtt://broker/(?P<room>\w+)/light',
+        r'(a)\1',
+        r'(?i)HTTP://api/',
+        'http://api/v1',
+        r'http://api/v[0-9]+/users$',
+        r'http://api/v1\.0',
+        r'mqtt://broker/sensor?s/hum',
+        r'mqtt://broker/a\|b|mqtt://x',
+        '',
+    ]
+    uris = [
+        'mqtt://broker/sensors/temp/1', 'mqtt://broker/sensors', 'mqtt://broker/sensorsX',
+        'mqtt://broker/kitchen/light', 'aa', 'http://api/v2/users', 'http://api/v1.0/x',
+        'http://API/v1', 'mqtt://broker/sensor/hum', 'mqtt://broker/a|b', 'mqtt://x/1',
+        'nothing', '',
+    ]
+    for count in range(1, len(patterns) + 1):
+        router = StreamFilterRouter()
+        for i, pattern in enumerate(patterns[:count]):
+            router.add_route(pattern, i)
+        for uri in uris:
+            expected = next((i for i, pattern in enumerate(patterns[:count])
+                             if re.match(pattern, uri)), None)
+            assert router.match_route(uri) == expected, (count, uri)
+
+    # Patterns added after the table was compiled are matched the same way
+    router = StreamFilterRouter()
+    for count, pattern in enumerate(patterns, 1):
+        router.add_route(pattern, count - 1)
+        table = router._route_table
+        for uri in uris:
+            expected = next((i for i, pattern in enumerate(patterns[:count])
+                             if re.match(pattern, uri)), None)
+            assert router.match_route(uri) == expected, (count, uri)
+        assert table is None or router._route_table is table
+
+def test_route_table_updated_on_add_route():
+    router = StreamFilterRouter()
+    router.add_route('/api/status', 'status')
+    assert router.match_route('/api/users') is None
+    router.add_route(r'/api/\w+', 'any')
+    assert router.match_route('/api/users') == 'any'
+    router.add_route('/api/status', 'replaced')
+    assert router.match_route('/api/status') == 'replaced'
+
+def test_path_template_endpoints():
+    router = StreamFilterRouter()
+    router.add_endpoint('redis://redis:6379/sessions/{user_id}', {'type': 'hash'})
+    router.add_endpoint('redis://redis:6379/sessions/active', {'type': 'set'})
+    router.add_endpoint('http://localhost:8080/users/{id}/posts/{post_id}',
+                        {'response': {}, 'methods': ['GET', 'DELETE']})
+
+    endpoint, params = router.resolve_endpoint('redis://redis:6379/sessions/42')
+    assert endpoint['path'] == '/sessions/{user_id}'
+    assert params == {'user_id': '42'}
+    # Exact paths win over templates
+    endpoint, params = router.resolve_endpoint('redis://redis:6379/sessions/active')
+    assert endpoint['config'] == {'type': 'set'} and params == {}
+    assert router.resolve_endpoint('redis://redis:6379/sessions/') is None
+    assert router.resolve_endpoint('redis://redis:6379/sessions/1/extra') is None
+    # Query strings and fragments are not part of the captured parameters
+    assert router.resolve_endpoint('redis://redis:6379/sessions/42?ttl=60#x')[1] == {'user_id': '42'}
+    # The protocol and hostname are part of the match
+    assert router.resolve_endpoint('mqtt://other:6379/sessions/42') is None
+    assert router.resolve_endpoint('http://evil.example:6379/sessions/42') is None
+    assert router.resolve_endpoint('redis://other:6379/sessions/active') is None
+    assert router.resolve_endpoint('amqp://redis:6379/sessions/active') is None
+
+    endpoint, params = router.match_endpoint(8080, '/users/a%20b/posts/7', 'delete')
+    assert params == {'id': 'a b', 'post_id': '7'}
+    assert router.find_endpoint(8080, '/users/1/posts/2', 'POST') is None
+    assert sorted(router.get_path_methods(8080, '/users/1/posts/2')) == ['DELETE', 'GET']
+
+    router.delete_endpoint('redis://redis:6379/sessions/{user_id}')
+    assert router.resolve_endpoint('redis://redis:6379/sessions/42') is None
+    assert router.resolve_endpoint('redis://redis:6379/sessions/active') is not None
+
+def test_path_template_validation():
+    router = StreamFilterRouter()
+    with pytest.raises(ValueError):
+        router.add_endpoint('redis://redis:6379/sessions/{user-id}', {})
+    with pytest.raises(ValueError):
+        router.add_endpoint('redis://redis:6379/pairs/{id}/{id}', {})
+    router.add_endpoint('redis://redis:6379/items/{item_id}', {})
+    with pytest.raises(ValueError):
+        router.add_endpoint('redis://redis:6379/items/{name}', {})
+    assert router.resolve_endpoint('redis://redis:6379/items/9')[1] == {'item_id': '9'}
+
+def test_route_cache():
+    router = StreamFilterRouter(route_cache_size=2)
+    router.add_route('mqtt://broker/sensors/', 'sensors')
+    assert router.route_cache_info() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 2}
+
+    # The first lookup compiles the table and is cached like any other
+    assert router.match_route('mqtt://broker/sensors/1') == 'sensors'
+    assert router.match_route('mqtt://broker/sensors/1') == 'sensors'
+    assert router.match_route('mqtt://broker/sensors/1') == 'sensors'
+    assert router.match_route('mqtt://broker/other') is None
+    assert router.match_route('mqtt://broker/other') is None
+    info = router.route_cache_info()
+    assert (info['hits'], info['misses'], info['size']) == (3, 2, 2)
+
+    # Least recently used entries are evicted
+    router.match_route('mqtt://broker/sensors/2')
+    router.match_route('mqtt://broker/sensors/2')
+    assert router.route_cache_info()['size'] == 2
+
+    # add_route invalidates cached resolutions, including misses
+    router.add_route('mqtt://broker/other', 'other')
+    assert router.route_cache_info()['size'] == 0
+    assert router.match_route('mqtt://broker/other') == 'other'
+    assert router.match_route('mqtt://broker/other') == 'other'
+    assert router.route_cache_info()['size'] == 1
+
+    # Routes changed without add_route() are picked up and drop the cache
+    router.routes['mqtt://broker/'] = 'broker'
+    assert router.match_route('mqtt://broker/x') == 'broker'
+    assert router.route_cache_info()['size'] == 0
+    assert router.match_route('mqtt://broker/other') == 'other'
+
+    assert StreamFilterRouter().route_cache_info() is None
+
+def test_filter_ordering_and_drop():
+    router = StreamFilterRouter()
+    calls = []
+
+    def tag(name):
+        def filter_func(data):
+            calls.append(name)
+            return data + [name]
+        return filter_func
+
+    router.add_filter('last', tag('last'), order=10)
+    router.add_filter('first', tag('first'), order=-1)
+    router.add_filter('middle', tag('middle'))
+    assert router.apply_filters([]) == ['first', 'middle', 'last']
+
+    # A filter returning DROP stops the chain and the handler
+    router.add_filter('drop_short', lambda data: DROP if len(data) < 3 else data, order=5)
+    router.add_route('mqtt://broker/sensors', lambda data: data)
+    calls.clear()
+    assert router.apply_filters([]) is DROP
+    assert calls == ['first', 'middle']
+    assert router.process('mqtt://broker/sensors/1', []) is None
+    assert router.process('mqtt://broker/sensors/1', ['x']) == ['x', 'first', 'middle', 'last']
+
+    assert router.remove_filter('drop_short') is True
+    assert router.remove_filter('drop_short') is False
+    assert router.process('mqtt://broker/sensors/1', []) == ['first', 'middle', 'last']
+
+def test_per_route_filters():
+    router = StreamFilterRouter()
+    router.add_route('mqtt://broker/temp', lambda data: data)
+    router.add_route('mqtt://broker/hum', lambda data: data)
+    router.add_filter('round', round)
+    router.add_filter('to_fahrenheit', lambda c: c * 9 / 5 + 32, order=-1,
+                      routes=['mqtt://broker/temp'])
+
+    assert router.process('mqtt://broker/temp/1', 20.2) == 68
+    assert router.process('mqtt://broker/hum/1', 40.6) == 41
+    assert router.apply_filters(20.2) == 20
+    assert router.apply_filters(20.2, 'mqtt://broker/temp') == 68
+
+    # Replacing a filter keeps the compiled pipelines current
+    router.add_filter('round', lambda value: round(value, 1))
+    assert router.process('mqtt://broker/hum/1', 40.66) == 40.7
+    # So does replacing a route handler
+    router.add_route('mqtt://broker/hum', lambda data: -data)
+    assert router.process('mqtt://broker/hum/1', 40.66) == -40.7
+
+def test_filter_pipeline():
+    pipeline = FilterPipeline([('double', lambda x: x * 2), ('drop_big', lambda x: DROP if x > 10 else x),
+                               ('negate', lambda x: -x)])
+    assert pipeline.names == ['double', 'drop_big', 'negate']
+    assert len(pipeline) == 3
+    assert pipeline(2) == -4
+    assert pipeline(6) is DROP
+    assert FilterPipeline([])('data') == 'data'
+
+def test_process_many():
+    router = StreamFilterRouter()
+    batches = []
+    router.add_route('mqtt://broker/temp', lambda batch: batches.append(batch) or len(batch))
+
+    calls = []
+
+    @batch_filter
+    def drop_outliers(batch):
+        calls.append(len(batch))
+        return [value for value in batch if -50 <= value <= 150]
+
+    router.add_filter('celsius', lambda kelvin: kelvin - 273)
+    router.add_filter('outliers', drop_outliers)
+    router.add_filter('skip_zero', lambda value: DROP if value == 0 else value)
+
+    readings = (kelvin for kelvin in [293, 1000, 273, 300])
+    assert router.process_many('mqtt://broker/temp/1', readings) == 2
+    assert batches == [[20, 27]]
+    # The batch filter ran once for the whole batch
+    assert calls == [4]
+
+    assert router.process_many('mqtt://broker/temp/1', [273]) is None
+    assert router.process_many('mqtt://broker/temp/1', []) is None
+    assert router.process_many('mqtt://broker/other', [293]) is None
+
+    # In single-message processing batch filters see a batch of one
+    router.add_route('mqtt://broker/single', lambda value: value)
+    assert router.process('mqtt://broker/single/1', 293) == 20
+    assert router.process('mqtt://broker/single/1', 1000) is None
+
+def test_per_item_adapter():
+    adapted = per_item(lambda value: DROP if value < 0 else value * 2)
+    assert adapted([1, -1, 2]) == [2, 4]
+    pipeline = FilterPipeline([('double', adapted), ('sum', batch_filter(lambda batch: [sum(batch)]))],
+                              mode='batch')
+    assert pipeline([1, 2]) == [6]
+    assert pipeline([-1]) is DROP
+
+def test_aprocess():
+    router = StreamFilterRouter()
+    threads = []
+
+    async def fetch_handler(data):
+        await asyncio.sleep(0.01)
+        return {'fetched': data}
+
+    def blocking_handler(data):
+        threads.append(threading.current_thread())
+        return {'stored': data}
+
+    async def enrich(data):
+        await asyncio.sleep(0)
+        return DROP if data < 0 else data + 1
+
+    router.add_route('mqtt://broker/fetch', fetch_handler)
+    router.add_route('mqtt://broker/store', blocking_handler)
+    router.add_filter('double', lambda data: data * 2)
+    router.add_filter('enrich', enrich)
+
+    async def run():
+        single = await router.aprocess('mqtt://broker/store/1', 1)
+        fanned_out = await router.aprocess_all(
+            [('mqtt://broker/fetch/%d' % i, i) for i in range(50)]
+            + [('mqtt://broker/fetch/x', -1), ('mqtt://broker/other', 1)], concurrency=20)
+        return single, fanned_out
+
+    single, fanned_out = asyncio.run(run())
+    assert single == {'stored': 3}
+    assert threads and threads[0] is not threading.main_thread()
+    assert fanned_out[:3] == [{'fetched': 1}, {'fetched': 3}, {'fetched': 5}]
+    assert fanned_out[-2:] == [None, None]
+
+    # The sync path refuses coroutine filters instead of passing coroutines on
+    with pytest.raises(TypeError):
+        router.process('mqtt://broker/store/1', 1)
+
+def test_aprocess_async_batch_filter():
+    router = StreamFilterRouter()
+    router.add_route('mqtt://broker/readings', lambda data: data)
+
+    @batch_filter
+    async def double(batch):
+        await asyncio.sleep(0)
+        return [value * 2 for value in batch if value >= 0]
+
+    router.add_filter('double', double)
+    # In single-message processing the filter gets a batch of one
+    assert asyncio.run(router.aprocess('mqtt://broker/readings', 21)) == 42
+    assert asyncio.run(router.aprocess('mqtt://broker/readings', -1)) is None
+
+def test_process_stream():
+    router = StreamFilterRouter()
+    consumed = []
+
+    def lines(count):
+        for i in range(count):
+            consumed.append(i)
+            yield f'{i},sensor{i % 3},{i * 1.5}'
+
+    @stream_filter
+    def parse_csv(chunks):
+        for line in chunks:
+            index, sensor, value = line.split(',')
+            yield {'index': int(index), 'sensor': sensor, 'value': float(value)}
+
+    @stream_filter
+    def running_total(rows):
+        total = 0.0
+        for row in rows:
+            total += row['value']
+            yield dict(row, total=total)
+
+    router.add_filter('parse', parse_csv, order=-1)
+    router.add_filter('only_sensor0', lambda row: row if row['sensor'] == 'sensor0' else DROP)
+    router.add_filter('total', running_total, order=1)
+    router.add_route('file:///exports/', lambda row: (row['index'], row['total']))
+
+    results = router.process_stream('file:///exports/readings.csv', lines(10 ** 9))
+    # Nothing is read until the iterator is consumed, and then only as needed
+    assert consumed == []
+    assert next(results) == (0, 0.0)
+    assert next(results) == (3, 4.5)
+    assert consumed == [0, 1, 2, 3]
+
+    @stream_filter
+    def count_rows(rows):
+        yield sum(1 for _ in rows)
+
+    router.add_route('file:///counts/', count_rows)
+    assert list(router.process_stream('file:///counts/a.csv', (f'{i},sensor0,1' for i in range(5)))) == [5]
+    assert router.process_stream('file:///other', []) is None
+
+    # Stream filters also work on single messages and batches
+    assert router.process('file:///exports/one.csv', '3,sensor0,2.0') == (3, 2.0)
+    assert router.process('file:///exports/one.csv', '4,sensor1,2.0') is None
+
+def test_endpoint_record():
+    router = StreamFilterRouter()
+    config = {'response': {'status': 'OK'}, 'methods': ['GET']}
+    router.add_endpoint('http://localhost:8080/api/status', config)
+    router.add_endpoint('http://localhost:8080/api/health', {'response': {}})
+    endpoint = router.endpoints['http://localhost:8080/api/status']
+
+    assert isinstance(endpoint, Endpoint)
+    assert endpoint['path'] == endpoint.path == '/api/status'
+    assert endpoint.get('port') == 8080 and endpoint.get('params') is None
+    assert dict(endpoint) == {'uri': 'http://localhost:8080/api/status', 'protocol': 'http',
+                              'hostname': 'localhost', 'port': 8080, 'path': '/api/status',
+                              'config': config}
+    assert dict(endpoint, params={'id': '1'})['params'] == {'id': '1'}
+    # Hostnames are shared between endpoints
+    assert endpoint.hostname is router.endpoints['http://localhost:8080/api/health'].hostname
+
+    # The config is a read-only view
+    assert endpoint['config'] == config
+    with pytest.raises(TypeError):
+        endpoint['config']['methods'] = ['POST']
+    with pytest.raises(TypeError):
+        endpoint['path'] = '/other'
+    with pytest.raises(KeyError):
+        endpoint['data']
+
+    assert pickle.loads(pickle.dumps(endpoint)) == endpoint
+
+def test_endpoint_secondary_indexes():
+    router = StreamFilterRouter()
+    router.add_endpoint('http://localhost:8080/a', {'response': {}})
+    router.add_endpoint('http://api.local:8080/b', {'response': {}})
+    router.add_endpoint('mqtt://localhost:1883/sensors', {'topic': 'sensors', 'qos': 1})
+    router.add_endpoint('redis://localhost/cache', {'type': 'string'})
+
+    uris = lambda endpoints: [endpoint.uri for endpoint in endpoints]
+    assert uris(router.endpoints_by_port(8080)) == ['http://localhost:8080/a', 'http://api.local:8080/b']
+    assert uris(router.endpoints_by_port(None)) == ['redis://localhost/cache']
+    assert uris(router.endpoints_by_protocol('mqtt')) == ['mqtt://localhost:1883/sensors']
+    assert len(router.endpoints_by_hostname('localhost')) == 3
+    assert router.endpoints_by_protocol('amqp') == []
+    assert router.endpoint_ports() == [8080, 1883, None]
+    assert uris(router.query_endpoints(protocol='http', hostname='localhost')) == ['http://localhost:8080/a']
+    assert uris(router.query_endpoints(port=None)) == ['redis://localhost/cache']
+    assert len(router.query_endpoints()) == 4
+
+    # Re-registering and deleting keep the indexes in step
+    router.add_endpoint('http://localhost:8080/a', {'response': {'v': 2}})
+    assert router.endpoints_by_port(8080)[0]['config'] == {'response': {'v': 2}}
+    router.delete_endpoint('mqtt://localhost:1883/sensors')
+    assert router.endpoints_by_protocol('mqtt') == []
+    assert router.endpoint_ports() == [8080, None]
+
+def test_add_endpoints_bulk():
+    router = StreamFilterRouter()
+    router.add_endpoint('redis://redis:6379/items/{item_id}', {'type': 'hash'})
+    errors = router.add_endpoints([
+        ('http://localhost:8080/api/status', {'response': {'status': 'OK'}}),
+        ('http://localhost:8080/api/broken', {'methods': ['GET']}),
+        ('gopher://localhost/menu', {}),
+        ('mqtt://localhost:1883/sensors', {'topic': 'sensors', 'qos': 7}),
+        ('redis://redis:6379/items/{name}', {'type': 'hash'}),
+        ('mqtt://localhost:1883/sensors', {'topic': 'sensors', 'qos': 1}),
+    ])
+    assert sorted(errors) == ['gopher://localhost/menu', 'http://localhost:8080/api/broken',
+                              'redis://redis:6379/items/{name}']
+    assert 'Invalid configuration for protocol http' in errors['http://localhost:8080/api/broken']
+    # A later valid entry for the same URI replaces the earlier invalid one
+    assert router.endpoints_by_protocol('mqtt')[0]['config']['qos'] == 1
+
+    # An invalid later entry is reported and the earlier one is not registered
+    errors = router.add_endpoints([
+        ('mqtt://localhost:1884/alerts', {'topic': 'alerts', 'qos': 1}),
+        ('mqtt://localhost:1884/alerts', {'topic': 'alerts', 'qos': 7}),
+    ])
+    assert list(errors) == ['mqtt://localhost:1884/alerts']
+    assert router.endpoints_by_port(1884) == []
+    assert router.find_endpoint(8080, '/api/status')['port'] == 8080
+
+    # Static responses of bulk-added endpoints are prepared on first use
+    response = router.get_prepared_response('http://localhost:8080/api/status')
+    assert response.body == b'{"status": "OK"}'
+    assert router.get_prepared_response('http://localhost:8080/api/status') is response
+    router.add_endpoint('http://localhost:8080/api/status', {'response': {'status': 'NEW'}})
+    assert router.get_prepared_response('http://localhost:8080/api/status').body == b'{"status": "NEW"}'
@@ -0,0 +1,591 @@
+"""
+Tests for the UriPoint serving engines
+"""
+import concurrent.futures
+import gzip
+import socket
+import http.client
+import json
+import pickle
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from uripoint import UriPointCLI, commands
+from uripoint import cli as cli_module
+from uripoint.async_server import AsyncEndpointServer
+from uripoint.cli import EndpointHandler, EndpointTCPServer, ReusePortTCPServer
+from uripoint.dispatch import (
+    DISCARD_CHUNK_SIZE,
+    brotli,
+    compute_etag,
+    dispatch_request,
+    encode_response,
+    evaluate_conditional,
+    negotiate_encoding
+)
+
+def start_threaded(cli, **options):
+    server = EndpointTCPServer(
+        ('127.0.0.1', 0),
+        lambda *args, **kwargs: EndpointHandler(*args, router=cli.router, **options, **kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+def start_async(cli, **options):
+    if 'timeout' in options:
+        options['keepalive_timeout'] = options.pop('timeout')
+    server = AsyncEndpointServer(cli.router, host='127.0.0.1', **options)
+    port = server.bind(0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, port
+
+def request(port, path, method='GET'):
+    req = urllib.request.Request(f'http://127.0.0.1:{port}{path}', method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+@pytest.fixture(params=[start_threaded, start_async], ids=['threading', 'asyncio'])
+def engine(request):
+    servers = []
+
+    def start(cli, **options):
+        server, port = request.param(cli, **options)
+        servers.append(server)
+        return port
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def served(engine):
+    cli = UriPointCLI()
+    return cli, engine(cli)
+
+def test_static_endpoint(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/status',
+                        {'response': {'status': 'OK'}, 'methods': ['GET', 'POST']})
+
+    assert request(port, '/api/status') == (200, b'{"status": "OK"}')
+    assert request(port, '/api/status', 'POST')[0] == 200
+    assert request(port, '/api/status', 'DELETE')[0] == 405
+    assert request(port, '/missing')[0] == 404
+
+def test_head_request(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/status', {'response': {'status': 'OK'}})
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('HEAD', '/api/status')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.headers['Content-Length'] == '16'
+    assert response.read() == b''
+    conn.request('HEAD', '/missing')
+    response = conn.getresponse()
+    assert response.status == 404
+    assert response.read() == b''
+    sock = conn.sock
+
+    # No body was sent, so the next response on the connection is parsed intact
+    conn.request('GET', '/api/status')
+    assert conn.getresponse().read() == b'{"status": "OK"}'
+    assert conn.sock is sock
+    conn.close()
+
+    cli.create_endpoint(f'http://localhost:{port}/api/tail',
+                        {'response': {}, 'command': 'sleep 5', 'stream': True})
+    start = time.time()
+    assert request(port, '/api/tail', 'HEAD') == (200, b'')
+    assert time.time() - start < 2
+
+def test_delete_endpoint_while_serving(served):
+    cli, port = served
+    for name in ('a', 'b', 'c'):
+        cli.create_endpoint(f'http://localhost:{port}/api/{name}', {'response': {'name': name}})
+    assert request(port, '/api/a')[0] == 200
+
+    assert cli.delete_endpoint(f'http://localhost:{port}/api/a') is True
+    assert cli.delete_endpoint(f'http://localhost:{port}/api/a') is False
+    assert request(port, '/api/a')[0] == 404
+    assert cli.delete_endpoints([f'http://localhost:{port}/api/b', f'http://localhost:{port}/api/x']) \
+        == [f'http://localhost:{port}/api/b']
+    assert request(port, '/api/b')[0] == 404
+    assert request(port, '/api/c') == (200, b'{"name": "c"}')
+    assert [e['uri'] for e in cli.list_endpoints()] == [f'http://localhost:{port}/api/c']
+
+def test_options_preflight(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/items',
+                        {'response': [], 'methods': ['GET', 'PUT']})
+
+    req = urllib.request.Request(f'http://127.0.0.1:{port}/api/items', method='OPTIONS')
+    with urllib.request.urlopen(req, timeout=5) as response:
+        assert response.status == 200
+        assert response.headers['Access-Control-Allow-Methods'] == 'GET, PUT'
+    assert request(port, '/missing', 'OPTIONS')[0] == 404
+
+def test_async_slow_command_does_not_block():
+    cli = UriPointCLI()
+    server, port = start_async(cli)
+    try:
+        cli.create_endpoint(f'http://localhost:{port}/slow',
+                            {'response': {}, 'command': 'sleep 1'})
+        cli.create_endpoint(f'http://localhost:{port}/fast', {'response': {'ok': True}})
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            slow = executor.submit(request, port, '/slow')
+            time.sleep(0.1)
+            start = time.time()
+            fast = [executor.submit(request, port, '/fast') for _ in range(3)]
+            assert all(f.result()[0] == 200 for f in fast)
+            assert time.time() - start < 0.5
+            assert slow.result()[0] == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_async_head_of_command_endpoint_does_not_block():
+    cli = UriPointCLI()
+    server, port = start_async(cli)
+    try:
+        cli.create_endpoint(f'http://localhost:{port}/slow',
+                            {'response': {}, 'command': 'sleep 1'})
+        cli.create_endpoint(f'http://localhost:{port}/fast', {'response': {'ok': True}})
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            slow = executor.submit(request, port, '/slow', 'HEAD')
+            time.sleep(0.1)
+            start = time.time()
+            assert request(port, '/fast')[0] == 200
+            assert time.time() - start < 0.5
+            assert slow.result() == (200, b'')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_async_command_requests_use_executor_limits(monkeypatch):
+    # More slots than the loop's default executor has threads on any host
+    executor = commands.CommandExecutor(max_workers=40, max_queue=0)
+    monkeypatch.setattr(commands, '_executor', executor)
+    cli = UriPointCLI()
+    server, port = start_async(cli)
+    try:
+        cli.create_endpoint(f'http://localhost:{port}/slow',
+                            {'response': {}, 'command': 'sleep 1'})
+        with concurrent.futures.ThreadPoolExecutor(max_workers=41) as pool:
+            start = time.time()
+            results = list(pool.map(lambda _: request(port, '/slow'), range(40)))
+            assert time.time() - start < 1.9
+            assert all(status == 200 for status, _ in results)
+
+            # A request beyond max_workers + max_queue is refused at once
+            slow = [pool.submit(request, port, '/slow') for _ in range(40)]
+            time.sleep(0.3)
+            start = time.time()
+            assert request(port, '/slow')[0] == 503
+            assert time.time() - start < 0.5
+            assert all(f.result()[0] == 200 for f in slow)
+        assert executor.stats()['rejected'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_async_quiet_streams_hold_no_thread(monkeypatch):
+    executor = commands.CommandExecutor(max_workers=8, max_queue=0)
+    monkeypatch.setattr(commands, '_executor', executor)
+    cli = UriPointCLI()
+    server, port = start_async(cli)
+    socks = []
+    try:
+        cli.create_endpoint(f'http://localhost:{port}/tail',
+                            {'response': {}, 'command': 'echo start; sleep 2; echo end',
+                             'stream': True})
+        cli.create_endpoint(f'http://localhost:{port}/echo',
+                            {'response': {}, 'command': 'echo hi'})
+        for _ in range(5):
+            sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+            sock.sendall(b'GET /tail HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            read_until(sock, b'start\n')
+            socks.append(sock)
+
+        assert server._blocking == 0
+        start = time.time()
+        assert request(port, '/echo') == (200, b'hi\n')
+        assert time.time() - start < 1
+        for sock in socks:
+            assert read_until(sock, b'0\r\n\r\n').endswith(b'0\r\n\r\n')
+    finally:
+        for sock in socks:
+            sock.close()
+        server.shutdown()
+        server.server_close()
+
+def test_async_many_concurrent_connections():
+    cli = UriPointCLI()
+    server, port = start_async(cli)
+    try:
+        cli.create_endpoint(f'http://localhost:{port}/api/status', {'response': {'status': 'OK'}})
+        with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
+            results = list(executor.map(lambda _: request(port, '/api/status'), range(500)))
+        assert all(status == 200 for status, _ in results)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_serve_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        UriPointCLI().serve(engine='gevent')
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='SO_REUSEPORT unsupported')
+def test_reuse_port_servers_share_port():
+    cli = UriPointCLI()
+    handler = lambda *args, **kwargs: EndpointHandler(*args, router=cli.router, **kwargs)
+    first = ReusePortTCPServer(('127.0.0.1', 0), handler)
+    port = first.server_address[1]
+    second = ReusePortTCPServer(('127.0.0.1', port), handler)
+    async_server = AsyncEndpointServer(cli.router, host='127.0.0.1', reuse_port=True)
+    try:
+        assert async_server.bind(port) == port
+    finally:
+        async_server.server_close()
+        second.server_close()
+        first.server_close()
+
+def test_serve_rejects_invalid_workers():
+    with pytest.raises(ValueError):
+        UriPointCLI().serve(workers=0)
+
+@pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='SO_REUSEPORT unsupported')
+def test_worker_target_is_picklable(monkeypatch):
+    started = []
+
+    class RecordingManager:
+        def start_process(self, name, target, *args):
+            # spawn and forkserver pickle the target and its arguments
+            started.append(pickle.loads(pickle.dumps((target, args))))
+
+        def list_processes(self):
+            raise KeyboardInterrupt
+
+        def cleanup(self):
+            pass
+
+    monkeypatch.setattr(cli_module, 'ProcessManager', RecordingManager)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    cli = UriPointCLI()
+    cli.create_endpoint('http://localhost:8080/api/status', {'response': {'status': 'OK'}})
+    cli.serve(workers=2)
+
+    assert len(started) == 2
+    target, (engine, endpoints, *_) = started[0]
+    assert engine == 'threading'
+    assert endpoints == [('http://localhost:8080/api/status', {'response': {'status': 'OK'}})]
+
+def test_keep_alive_reuses_connection(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/status',
+                        {'response': {'status': 'OK'}, 'methods': ['GET', 'POST']})
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/status')
+    response = conn.getresponse()
+    assert response.read() == b'{"status": "OK"}'
+    assert response.headers['Content-Length'] == '16'
+    sock = conn.sock
+
+    # A request body must be consumed so the next request parses correctly
+    conn.request('POST', '/api/status', body=b'{"ignored": true}')
+    assert conn.getresponse().read() == b'{"status": "OK"}'
+    conn.request('GET', '/missing')
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 404
+    assert conn.sock is sock
+    conn.close()
+
+def test_request_body_size_limit(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/status',
+                        {'response': {'status': 'OK'}, 'methods': ['GET', 'POST']})
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('POST', '/api/status', body=b'x' * (3 * DISCARD_CHUNK_SIZE + 1))
+    assert conn.getresponse().read() == b'{"status": "OK"}'
+    conn.request('GET', '/api/status')
+    assert conn.getresponse().read() == b'{"status": "OK"}'
+    conn.close()
+
+    # Refused without reading the announced body
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(f'POST /api/status HTTP/1.1\r\nHost: localhost\r\n'
+                     f'Content-Length: {10 ** 10}\r\n\r\n'.encode())
+        data = read_until(sock, b'\x00')
+    assert data.startswith(b'HTTP/1.1 413 ')
+    assert b'Connection: close' in data
+
+def test_pipelined_requests_answered_in_order(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/a', {'response': 'a'})
+    cli.create_endpoint(f'http://localhost:{port}/b', {'response': 'b'})
+
+    pipeline = b''.join(f'GET /{path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode()
+                        for path in ('a', 'b', 'a'))
+    pipeline += b'GET /b HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(pipeline)
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    bodies = [part.split(b'\r\n\r\n', 1)[1][:3] for part in data.split(b'HTTP/1.1 200')[1:]]
+    assert bodies == [b'"a"', b'"b"', b'"a"', b'"b"']
+
+def test_max_requests_closes_connection(engine):
+    cli = UriPointCLI()
+    port = engine(cli, max_requests=2)
+    cli.create_endpoint(f'http://localhost:{port}/api/status', {'response': {}})
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/status')
+    response = conn.getresponse()
+    response.read()
+    assert response.headers.get('Connection', '').lower() != 'close'
+    conn.request('GET', '/api/status')
+    response = conn.getresponse()
+    response.read()
+    assert response.headers['Connection'] == 'close'
+    conn.close()
+
+def test_idle_connection_times_out(engine):
+    cli = UriPointCLI()
+    port = engine(cli, timeout=0.2)
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        start = time.time()
+        assert sock.recv(1024) == b''
+        assert time.time() - start < 2
+
+def test_static_responses_prepared_once():
+    cli = UriPointCLI()
+    uri = 'http://localhost:8080/api/status'
+    cli.create_endpoint(uri, {'response': {'status': 'OK'}})
+    # Prepared on the first request rather than at registration
+    assert uri not in cli.router._responses
+    prepared = cli.router.get_prepared_response(uri)
+    assert prepared.body == b'{"status": "OK"}'
+    assert prepared.head.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert b'Content-Length: 16\r\n' in prepared.head
+
+    # Served as-is until the config changes
+    assert dispatch_request(cli.router, 8080, 'GET', '/api/status') is prepared
+    cli.create_endpoint(uri, {'response': {'status': 'DEGRADED'}})
+    assert cli.router.get_prepared_response(uri) is not prepared
+    assert dispatch_request(cli.router, 8080, 'GET', '/api/status').body == b'{"status": "DEGRADED"}'
+
+    cli.create_endpoint('http://localhost:8080/api/uptime', {'response': {}, 'command': 'uptime'})
+    assert cli.router.get_prepared_response('http://localhost:8080/api/uptime') is None
+
+    raw = encode_response(prepared, keep_alive=True)
+    head, body = raw.split(b'\r\n\r\n', 1)
+    assert body == prepared.body
+    assert b'\r\nDate: ' in head and head.endswith(b'Connection: keep-alive')
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding('gzip, deflate') == 'gzip'
+    assert negotiate_encoding('gzip;q=0, identity') is None
+    assert negotiate_encoding('deflate') is None
+    assert negotiate_encoding('*') in ('gzip', 'br')
+    if brotli is not None:
+        assert negotiate_encoding('gzip, br') == 'br'
+        assert negotiate_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+
+def test_compressed_variants(served):
+    cli, port = served
+    items = [{'id': i, 'name': f'item-{i}'} for i in range(200)]
+    cli.create_endpoint(f'http://localhost:{port}/api/items', {'response': items})
+    cli.create_endpoint(f'http://localhost:{port}/api/small', {'response': {'ok': True}})
+    prepared = cli.router.get_prepared_response(f'http://localhost:{port}/api/items')
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/items', headers={'Accept-Encoding': 'gzip'})
+    response = conn.getresponse()
+    body = response.read()
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(gzip.decompress(body)) == items
+    assert len(body) < len(prepared.body)
+    # The variant is compressed once and reused
+    assert prepared.variant('gzip') is prepared.variant('gzip')
+
+    conn.request('GET', '/api/items')
+    response = conn.getresponse()
+    assert response.headers['Content-Encoding'] is None
+    assert json.loads(response.read()) == items
+
+    conn.request('GET', '/api/small', headers={'Accept-Encoding': 'gzip'})
+    response = conn.getresponse()
+    assert response.headers['Content-Encoding'] is None
+    assert response.read() == b'{"ok": true}'
+    conn.close()
+
+def test_conditional_requests(served):
+    cli, port = served
+    uri = f'http://localhost:{port}/api/status'
+    cli.create_endpoint(uri, {'response': {'status': 'OK'}})
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/status')
+    response = conn.getresponse()
+    response.read()
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert etag.startswith('"') and last_modified
+
+    conn.request('GET', '/api/status', headers={'If-None-Match': f'"other", W/{etag}'})
+    response = conn.getresponse()
+    assert response.status == 304
+    assert response.read() == b''
+    assert response.headers['ETag'] == etag
+
+    conn.request('GET', '/api/status', headers={'If-Modified-Since': last_modified})
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 304
+
+    # If-None-Match wins over If-Modified-Since
+    conn.request('GET', '/api/status',
+                 headers={'If-None-Match': '"stale"', 'If-Modified-Since': last_modified})
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == b'{"status": "OK"}'
+
+    # A config change produces a new ETag
+    cli.create_endpoint(uri, {'response': {'status': 'DEGRADED'}})
+    conn.request('GET', '/api/status', headers={'If-None-Match': etag})
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.headers['ETag'] != etag
+    response.read()
+    conn.close()
+
+def test_command_output_etag(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/echo',
+                        {'response': {}, 'command': 'echo hello'})
+    status, body = request(port, '/api/echo')
+    assert (status, body) == (200, b'hello\n')
+    etag = compute_etag(body)
+    req = urllib.request.Request(f'http://127.0.0.1:{port}/api/echo',
+                                 headers={'If-None-Match': etag})
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(req, timeout=5)
+    assert error.value.code == 304
+
+def test_compressed_variant_etag():
+    cli = UriPointCLI()
+    cli.create_endpoint('http://localhost:8080/api/items', {'response': list(range(1000))})
+    prepared = cli.router.get_prepared_response('http://localhost:8080/api/items')
+    compressed = prepared.variant('gzip')
+    assert compressed.etag != prepared.etag
+    assert compressed.etag.endswith('-gzip"')
+    assert evaluate_conditional(compressed, {'if-none-match': compressed.etag}).status == 304
+    assert evaluate_conditional(compressed, {'if-none-match': prepared.etag}).status == 200
+
+def read_until(sock, marker, timeout=5):
+    sock.settimeout(timeout)
+    data = b''
+    while marker not in data:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def test_streamed_command_output(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/tail',
+                        {'response': {}, 'command': 'echo first; sleep 1; echo second',
+                         'stream': True})
+    cli.create_endpoint(f'http://localhost:{port}/api/status', {'response': {'status': 'OK'}})
+
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        start = time.time()
+        sock.sendall(b'GET /api/tail HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        data = read_until(sock, b'first\n')
+        # The first line arrives before the command finishes
+        assert time.time() - start < 0.9
+        assert b'Transfer-Encoding: chunked' in data
+        assert b'Content-Length' not in data.split(b'\r\n\r\n')[0]
+        data += read_until(sock, b'0\r\n\r\n')
+        assert data.endswith(b'0\r\n\r\n')
+
+        # The connection stays usable after the chunked body
+        sock.sendall(b'GET /api/status HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        assert read_until(sock, b'"OK"}').endswith(b'{"status": "OK"}')
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/tail')
+    assert conn.getresponse().read() == b'first\nsecond\n'
+    conn.close()
+
+def test_streamed_output_for_http10_client(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/tail',
+                        {'response': {}, 'command': 'echo hello', 'stream': True})
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(b'GET /api/tail HTTP/1.0\r\n\r\n')
+        data = read_until(sock, b'\x00')
+    head, _, body = data.partition(b'\r\n\r\n')
+    assert b'Transfer-Encoding' not in head
+    assert b'Connection: close' in head
+    assert body == b'hello\n'
+
+def test_streamed_command_stopped_on_disconnect(served, monkeypatch):
+    executor = commands.CommandExecutor()
+    monkeypatch.setattr(commands, '_executor', executor)
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/yes',
+                        {'response': {}, 'command': 'yes', 'stream': True})
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(b'GET /api/yes HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_until(sock, b'y\n')
+    deadline = time.time() + 5
+    while executor.stats()['running'] and time.time() < deadline:
+        time.sleep(0.05)
+    assert executor.stats()['running'] == 0
+
+@pytest.mark.parametrize('config', [
+    {'command': 'echo partial; exit 3'},
+    {'command': 'echo partial; sleep 3', 'timeout': 1},
+], ids=['exit-status', 'timeout'])
+def test_failed_stream_is_not_terminated(served, config):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/api/tail',
+                        {'response': {}, 'stream': True, **config})
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(b'GET /api/tail HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        # Read until the server closes the connection
+        data = read_until(sock, b'\x00')
+    head, _, body = data.partition(b'\r\n\r\n')
+    assert b'Transfer-Encoding: chunked' in head
+    assert body == b'8\r\npartial\n\r\n'
+
+def test_path_template_endpoint(served):
+    cli, port = served
+    cli.create_endpoint(f'http://localhost:{port}/users/{{user_id}}',
+                        {'response': {'user': 'any'}})
+    assert request(port, '/users/42') == (200, b'{"user": "any"}')
+    assert request(port, '/users/42', 'POST')[0] == 405
+    assert request(port, '/users/42/extra')[0] == 404
+    assert request(port, '/users/42?verbose=1#top') == (200, b'{"user": "any"}')
+    assert request(port, '/users?id=42')[0] == 404
@@ -0,0 +1,79 @@
+import math
+import pytest
+from uripoint.router import StreamFilterRouter
+from uripoint.vectorized import ColumnBatch, NumericFilter, numeric_fields
+
+np = pytest.importorskip('numpy')
+
+SCHEMA = {
+    'temperature': 'float',
+    'humidity': 'float',
+    'battery': 'int',
+    'timestamp': 'string'
+}
+
+def test_numeric_fields():
+    assert numeric_fields(SCHEMA) == {'temperature': float, 'humidity': float, 'battery': int}
+    assert numeric_fields({'on': 'boolean', 'name': 'string'}) == {'on': bool}
+
+def test_column_batch_round_trip():
+    readings = [
+        {'temperature': 21.5, 'humidity': 40, 'battery': 90, 'timestamp': 't1', 'id': 'a'},
+        {'temperature': None, 'humidity': 'n/a', 'battery': 80, 'timestamp': 't2'},
+    ]
+    batch = ColumnBatch.from_records(readings, SCHEMA)
+    assert len(batch) == 2
+    assert batch['temperature'][0] == 21.5 and math.isnan(batch['temperature'][1])
+    assert batch['timestamp'].tolist() == ['t1', 't2']
+    assert batch.records() == [
+        {'temperature': 21.5, 'humidity': 40.0, 'battery': 90, 'timestamp': 't1', 'id': 'a'},
+        {'temperature': None, 'humidity': None, 'battery': 80, 'timestamp': 't2'},
+    ]
+    assert batch[1]['battery'] == 80
+    assert list(batch.select(np.array([False, True])))[0]['timestamp'] == 't2'
+
+def test_numeric_filter():
+    numeric = NumericFilter(SCHEMA, convert={'temperature': (1.8, 32)},
+                            limits={'humidity': (0, 100), 'battery': (10, None)})
+    kept = numeric([
+        {'temperature': 20, 'humidity': 50, 'battery': 90},
+        {'temperature': 25, 'humidity': 150, 'battery': 90},
+        {'temperature': 25, 'humidity': 50, 'battery': 5},
+        {'temperature': float('inf'), 'humidity': 50, 'battery': 90},
+        {'humidity': 50, 'battery': 90},
+        {'temperature': 30, 'humidity': 60, 'battery': 70},
+    ])
+    assert [reading['temperature'] for reading in kept] == [68.0, 86.0]
+
+    lenient = NumericFilter(SCHEMA, drop_invalid=False)
+    assert len(lenient([{'temperature': None}, {'temperature': 1}])) == 2
+
+    with pytest.raises(ValueError):
+        NumericFilter(SCHEMA, limits={'timestamp': (0, 1)})
+    with pytest.raises(ValueError):
+        NumericFilter(SCHEMA, smooth={'temperature': 0})
+    with pytest.raises(ValueError):
+        NumericFilter.from_config({'topic': 'sensors/temperature'})
+
+def test_smoothing_carries_across_batches():
+    numeric = NumericFilter({'value': 'float'}, smooth={'value': 3})
+    first = numeric([{'value': v} for v in (3, 6, 9)])
+    assert first['value'].tolist() == [3.0, 4.5, 6.0]
+    second = numeric([{'value': 12}])
+    assert second['value'].tolist() == [9.0]
+
+def test_numeric_filter_in_router():
+    router = StreamFilterRouter()
+    config = {'topic': 'sensors/temperature', 'qos': 1, 'schema': SCHEMA}
+    router.add_endpoint('mqtt://localhost:1883/sensors/temperature', config)
+    router.add_route('mqtt://localhost:1883/sensors/temperature', lambda batch: batch)
+    router.add_filter('numeric', NumericFilter.from_config(config, limits={'battery': (20, None)}))
+    router.add_filter('tag', lambda reading: dict(reading, unit='C'))
+
+    result = router.process_many('mqtt://localhost:1883/sensors/temperature',
+                                 [{'temperature': 20.5, 'humidity': 40, 'battery': 50},
+                                  {'temperature': 21.0, 'humidity': 40, 'battery': 10},
+                                  {'temperature': 21.0, 'battery': 50}])
+    assert result == [{'temperature': 20.5, 'humidity': 40.0, 'battery': 50, 'unit': 'C'}]
+    assert router.process('mqtt://localhost:1883/sensors/temperature',
+                          {'temperature': 19.0, 'humidity': 40, 'battery': 5}) is None
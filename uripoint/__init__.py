@@ -4,6 +4,9 @@ UriPoint - A flexible Python library for managing network endpoints
 
 from .cli import UriPointCLI
 from .router import StreamFilterRouter, get_url_parts, extract_query_params
+from .endpoint import Endpoint
+from .filters import DROP, FilterPipeline, batch_filter, per_item, stream_filter
+from .vectorized import ColumnBatch, NumericFilter
 from .protocols import (
     ProtocolHandler,
     MQTTHandler,
@@ -12,6 +15,7 @@ from .protocols import (
     AMQPHandler,
     DNSHandler,
     get_protocol_handler,
+    register_protocol,
     validate_endpoint_config,
     create_protocol_connection
 )
@@ -19,8 +23,16 @@ from .protocols import (
 __all__ = [
     'UriPointCLI',
     'StreamFilterRouter',
+    'Endpoint',
     'get_url_parts',
     'extract_query_params',
+    'DROP',
+    'FilterPipeline',
+    'batch_filter',
+    'per_item',
+    'stream_filter',
+    'ColumnBatch',
+    'NumericFilter',
     'ProtocolHandler',
     'MQTTHandler',
     'RedisHandler',
@@ -28,6 +40,7 @@ __all__ = [
     'AMQPHandler',
     'DNSHandler',
     'get_protocol_handler',
+    'register_protocol',
     'validate_endpoint_config',
     'create_protocol_connection'
 ]
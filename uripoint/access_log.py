@@ -0,0 +1,153 @@
+"""
+Request logging for UriPoint servers
+
+Per-request messages go through the standard ``logging`` module instead of
+``print``: debug details on ``uripoint.server`` and one structured line per
+request on ``uripoint.access``. Nothing is written unless logging is
+configured; configure_logging() installs a queue so the request path only
+enqueues records and a background thread does the I/O.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Optional, TextIO
+
+logger = logging.getLogger('uripoint.server')
+access_logger = logging.getLogger('uripoint.access')
+
+ACCESS_FORMAT = '[%(asctime)s] %(client)s "%(method)s %(path)s" %(status)s %(size)s %(duration_ms).2fms'
+ACCESS_FIELDS = ('client', 'method', 'path', 'status', 'size', 'duration_ms')
+
+# Fraction of successful requests written to the access log; errors are always logged
+_sample_rate = 1.0
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def log_access(client: str, method: str, path: str, status: int, size: int,
+               duration: float) -> None:
+    """
+    Record one served request
+
+    :param client: Client address
+    :param method: HTTP method
+    :param path: Request path
+    :param status: Response status code
+    :param size: Response body size in bytes
+    :param duration: Seconds spent serving the request
+    """
+    if not access_logger.isEnabledFor(logging.INFO):
+        return
+    if status < 400 and _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return
+    access_logger.info('%s "%s %s" %s %s', client, method, path, status, size, extra={
+        'client': client,
+        'method': method,
+        'path': path,
+        'status': status,
+        'size': size,
+        'duration_ms': duration * 1000,
+    })
+
+class JSONAccessFormatter(logging.Formatter):
+    """Format records as JSON lines, with access fields when present"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        if hasattr(record, 'status'):
+            entry.update((field, getattr(record, field)) for field in ACCESS_FIELDS)
+        else:
+            entry['message'] = record.getMessage()
+        return json.dumps(entry)
+
+class _AccessFormatter(logging.Formatter):
+    """Use ACCESS_FORMAT for access records and a plain format for the rest"""
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s %(name)s: %(message)s')
+        self._access = logging.Formatter(ACCESS_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        if hasattr(record, 'status'):
+            return self._access.format(record)
+        return super().format(record)
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging(level: str = 'WARNING', access_log: bool = True,
+                      sample_rate: float = 1.0, stream: Optional[TextIO] = None,
+                      json_format: bool = False,
+                      queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """
+    Route UriPoint logs through a bounded queue drained by a background thread
+
+    :param level: Level for uripoint.server messages; DEBUG restores the old
+                  per-request details
+    :param access_log: Write one line per request to uripoint.access
+    :param sample_rate: Fraction of successful requests to log
+    :param stream: Output stream, stdout by default
+    :param json_format: Write JSON lines instead of text
+    :param queue_size: Records buffered before new ones are dropped
+    :return: The started QueueListener; call shutdown_logging() to flush on exit
+    """
+    global _sample_rate, _listener
+    if not 0.0 <= sample_rate <= 1.0:
+        raise ValueError(f"Invalid sample rate: {sample_rate}")
+    _sample_rate = sample_rate
+    shutdown_logging()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JSONAccessFormatter() if json_format else _AccessFormatter())
+    log_queue = queue.Queue(queue_size)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    package_logger = logging.getLogger('uripoint')
+    for existing in list(package_logger.handlers):
+        if isinstance(existing, _DroppingQueueHandler):
+            package_logger.removeHandler(existing)
+    package_logger.addHandler(_DroppingQueueHandler(log_queue))
+    package_logger.propagate = False
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    access_logger.setLevel(logging.INFO if access_log else logging.CRITICAL + 1)
+
+    listener.start()
+    _listener = listener
+    return listener
+
+def shutdown_logging() -> None:
+    """
+    Flush queued records and stop the background writer started by configure_logging()
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _restart_listener_after_fork() -> None:
+    """Give a forked worker its own queue and writer thread; threads do not survive fork"""
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(_listener.queue.maxsize)
+    for handler in logging.getLogger('uripoint').handlers:
+        if isinstance(handler, _DroppingQueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,365 @@
+"""
+Asyncio serving engine for UriPoint
+
+Serves every bound port from a single event loop, so one slow ``command``
+endpoint does not stall other clients and idle keep-alive connections cost
+no thread.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from .access_log import log_access, logger
+from .commands import STREAM_CHUNK_SIZE, CommandStream, get_command_executor
+from .dispatch import (
+    DISCARD_CHUNK_SIZE,
+    LAST_CHUNK,
+    MAX_REQUEST_BODY,
+    EndpointResponse,
+    dispatch_request,
+    encode_chunk,
+    encode_response,
+    error_response,
+    is_blocking,
+    preflight_response,
+    request_path
+)
+
+ENDPOINT_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH'))
+MAX_HEADERS = 100
+MAX_LINE = 65536
+
+class AsyncEndpointServer:
+    """
+    Serve router endpoints on one or more ports from a single asyncio event loop
+
+    Mirrors the ``socketserver`` API used by ``UriPointCLI`` (``serve_forever``,
+    ``shutdown``, ``server_close``) so both engines are managed the same way.
+
+    Command endpoints run on a thread pool of their own with one thread per
+    slot of the command executor (``max_workers + max_queue``), so its
+    queue limit and metrics apply; requests beyond that are answered with
+    503 on the loop instead of waiting for a thread.
+    """
+    request_queue_size = 1024
+
+    def __init__(self, router, host: str = '', reuse_port: bool = False,
+                 keepalive_timeout: float = 5.0, max_requests: int = 100):
+        self.router = router
+        self.host = host
+        self.reuse_port = reuse_port
+        # Seconds an idle connection is kept open, and requests served on one
+        # connection before it is closed (0 for no limit)
+        self.keepalive_timeout = keepalive_timeout
+        self.max_requests = max_requests
+        self.sockets: Dict[int, socket.socket] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._shutdown_request = False
+        self._stopped = threading.Event()
+        # Thread pool for command requests, sized for _threads_for
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._threads_for = None
+        self._threads_size = 0
+        # Command requests handed to the pool and not finished yet
+        self._blocking = 0
+
+    def bind(self, port: int) -> int:
+        """
+        Bind a listening socket for a port; connections queue until serve_forever() runs
+
+        :param port: Port to bind, 0 for any free port
+        :return: Bound port
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, port))
+            sock.listen(self.request_queue_size)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        bound_port = sock.getsockname()[1]
+        self.sockets[bound_port] = sock
+        return bound_port
+
+    def serve_forever(self) -> None:
+        """
+        Run the event loop until shutdown() is called
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        with self._lock:
+            if self._shutdown_request:
+                loop.close()
+                self._stopped.set()
+                return
+            self._loop = loop
+            self._stopped.clear()
+
+        try:
+            servers = []
+            for port, sock in self.sockets.items():
+                handler = functools.partial(self._handle_connection, port=port)
+                servers.append(loop.run_until_complete(asyncio.start_server(
+                    handler, sock=sock, backlog=self.request_queue_size, limit=MAX_LINE)))
+            loop.run_forever()
+
+            for server in servers:
+                server.close()
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        finally:
+            with self._lock:
+                self._loop = None
+            loop.close()
+            if self._threads is not None:
+                self._threads.shutdown(wait=False)
+                self._threads = self._threads_for = None
+            self._stopped.set()
+
+    def shutdown(self) -> None:
+        """
+        Stop the event loop and wait for serve_forever() to return
+        """
+        with self._lock:
+            self._shutdown_request = True
+            loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            self._stopped.wait()
+
+    def server_close(self) -> None:
+        """
+        Close all listening sockets
+        """
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets.clear()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter, port: int) -> None:
+        """
+        Serve requests on one connection in order until it closes, idles out
+        or reaches max_requests
+        """
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else '-'
+        served = 0
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                                                     self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    return
+                if request is None:
+                    return
+
+                served += 1
+                started = time.perf_counter()
+                if isinstance(request, EndpointResponse):
+                    method, path, response, keep_alive = '-', '-', request, False
+                    chunked = True
+                else:
+                    method, path, version, headers = request
+                    keep_alive = _wants_keep_alive(version, headers)
+                    chunked = version == 'HTTP/1.1'
+                    logger.debug("Received %s request for: %s", method, path)
+                    response = await self._dispatch(method, path, port, headers)
+                if self.max_requests and served >= self.max_requests:
+                    keep_alive = False
+
+                head_only = method == 'HEAD'
+                if response.chunks is not None and not head_only:
+                    writer.write(encode_response(response, keep_alive and chunked, chunked=chunked))
+                    size, complete = await self._write_chunks(writer, response.chunks, chunked)
+                    # HTTP/1.0 clients read the raw body until the connection closes,
+                    # and an incomplete chunked body is ended the same way
+                    keep_alive = keep_alive and chunked and complete
+                else:
+                    if response.chunks is not None:
+                        # Only the headers are sent, so the command is stopped right away
+                        await asyncio.get_running_loop().run_in_executor(None, response.chunks.close)
+                    writer.write(encode_response(response, keep_alive, head_only=head_only,
+                                                 chunked=chunked))
+                    size = 0 if head_only else len(response.body)
+                await writer.drain()
+                log_access(client, method, path, response.status, size,
+                           time.perf_counter() - started)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_chunks(self, writer: asyncio.StreamWriter, chunks,
+                            chunked: bool) -> Tuple[int, bool]:
+        """
+        Relay a streamed body, waiting for the client to drain each chunk
+        before reading the next
+
+        Command output is read from its pipe by the event loop, so a quiet
+        stream such as a log tail holds no thread while it waits. The last
+        chunk is only written if the command succeeded.
+
+        :return: (body bytes written, whether the body is complete)
+        """
+        loop = asyncio.get_running_loop()
+        pipe = await self._open_pipe(chunks)
+        size = 0
+        finished = False
+        try:
+            while True:
+                if pipe is not None:
+                    data = await pipe[0].read(STREAM_CHUNK_SIZE)
+                else:
+                    data = await self._next_chunk(chunks)
+                if not data:
+                    break
+                size += len(data)
+                writer.write(encode_chunk(data) if chunked else data)
+                await writer.drain()
+            # The command's outcome is only known once it has exited
+            await loop.run_in_executor(None, chunks.finish)
+            finished = True
+        finally:
+            if pipe is not None:
+                pipe[1].close()
+            if not finished:
+                # Closing early, e.g. when the client went away, stops the command
+                await loop.run_in_executor(None, chunks.close)
+        complete = not (isinstance(chunks, CommandStream) and chunks.failed)
+        if complete and chunked:
+            writer.write(LAST_CHUNK)
+        return size, complete
+
+    async def _open_pipe(self, chunks) -> Optional[Tuple[asyncio.StreamReader, asyncio.BaseTransport]]:
+        """
+        Watch a command's stdout from the event loop
+
+        :return: (reader, transport), or None where the loop cannot watch pipes
+        """
+        if os.name != 'posix' or not isinstance(chunks, CommandStream):
+            return None
+        loop = asyncio.get_running_loop()
+        # A duplicate, so closing the transport leaves the stream's own pipe to it
+        pipe = os.fdopen(os.dup(chunks.fileno()), 'rb', buffering=0)
+        reader = asyncio.StreamReader(limit=STREAM_CHUNK_SIZE)
+        try:
+            transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        except (NotImplementedError, OSError, ValueError):
+            pipe.close()
+            return None
+        return reader, transport
+
+    async def _next_chunk(self, chunks) -> Optional[bytes]:
+        """Read the next chunk of a stream on a command thread"""
+        threads = self._command_threads()
+        self._blocking += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(threads, next, chunks, None)
+        finally:
+            self._blocking -= 1
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """
+        Read one request head and discard its body
+
+        :return: (method, path, version, headers), an error response for
+                 malformed requests, or None if the client closed the connection
+        """
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return None
+            words = request_line.decode('iso-8859-1').rstrip('\r\n').split()
+            if len(words) != 3 or not words[2].startswith('HTTP/'):
+                return error_response(400, "Bad request syntax")
+            method, path, version = words
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(headers) >= MAX_HEADERS:
+                    return error_response(431, "Too many headers")
+                name, _, value = line.decode('iso-8859-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError):
+            return error_response(431, "Line too long")
+
+        if 'transfer-encoding' in headers:
+            # Without a length the next request boundary is unknown
+            headers['connection'] = 'close'
+        else:
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                return error_response(400, "Bad Content-Length")
+            if length > MAX_REQUEST_BODY:
+                return error_response(413, "Request body too large")
+            while length > 0:
+                length -= len(await reader.readexactly(min(length, DISCARD_CHUNK_SIZE)))
+        return method, path, version, headers
+
+    async def _dispatch(self, method: str, path: str, port: int,
+                        headers: Dict[str, str]) -> EndpointResponse:
+        if method == 'OPTIONS':
+            return preflight_response(self.router, port, path)
+        if method not in ENDPOINT_METHODS:
+            return error_response(501, f"Unsupported method ({method!r})")
+
+        info = None
+        if self.router:
+            endpoint_path = request_path(path)
+            info = self.router.find_endpoint(port, endpoint_path, method)
+            if info is None and method == 'HEAD':
+                # Answered like GET, see dispatch_request
+                info = self.router.find_endpoint(port, endpoint_path, 'GET')
+        if info is not None and is_blocking(info):
+            threads = self._command_threads()
+            if self._blocking >= self._threads_size:
+                rejected = get_command_executor().reject()
+                return error_response(rejected.status, str(rejected), [('Retry-After', '1')])
+            self._blocking += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    threads, dispatch_request, self.router, port, method, path, headers)
+            finally:
+                self._blocking -= 1
+        return dispatch_request(self.router, port, method, path, headers)
+
+    def _command_threads(self) -> concurrent.futures.ThreadPoolExecutor:
+        """
+        Get the thread pool for command requests, replacing it when
+        configure_command_executor() installed a new command executor
+        """
+        executor = get_command_executor()
+        if self._threads_for is not executor:
+            if self._threads is not None:
+                self._threads.shutdown(wait=False)
+            self._threads_size = executor.max_workers + executor.max_queue
+            self._threads = concurrent.futures.ThreadPoolExecutor(
+                self._threads_size, thread_name_prefix='uripoint-command')
+            self._threads_for = executor
+        return self._threads
+
+def _wants_keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        return connection != 'close'
+    return connection == 'keep-alive'
@@ -1,108 +1,219 @@
 """
 CLI interface for UriPoint
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import http.server
+from http import HTTPStatus
+import socket
 import socketserver
 import threading
+import time
 import json
+from .access_log import log_access, logger
+from .process import ProcessManager
 from .router import StreamFilterRouter, get_url_parts
-from .protocols import get_protocol_handler
+from .async_server import AsyncEndpointServer
+from .commands import CommandStream, configure_command_executor, get_command_executor
+from .dispatch import (
+    DISCARD_CHUNK_SIZE,
+    LAST_CHUNK,
+    MAX_REQUEST_BODY,
+    SERVER_NAME,
+    EndpointResponse,
+    dispatch_request,
+    encode_chunk,
+    encode_response,
+    error_response,
+    preflight_response
+)
 
 class EndpointHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, router=None, **kwargs):
+    # HTTP/1.1 keeps connections open between requests; pipelined requests
+    # are read from the buffered rfile and answered in order
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    # Seconds an idle persistent connection is kept open
+    timeout = 5.0
+    # Requests served on one connection before it is closed, 0 for no limit
+    max_requests = 100
+
+    def __init__(self, *args, router=None, timeout=None, max_requests=None, **kwargs):
         self.router = router
+        if timeout is not None:
+            self.timeout = timeout
+        if max_requests is not None:
+            self.max_requests = max_requests
+        self.requests_served = 0
+        self.request_started = time.perf_counter()
         super().__init__(*args, **kwargs)
 
     def log_message(self, format, *args):
-        """Override to provide more detailed logging"""
-        print(f"[{self.log_date_time_string()}] {format%args}")
+        """Route http.server messages (timeouts, malformed requests) to the server logger"""
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def log_request(self, code='-', size='-'):
+        """Write the request to the access log"""
+        status = code.value if isinstance(code, HTTPStatus) else code
+        log_access(self.client_address[0], self.command or '-', getattr(self, 'path', '-'), int(status),
+                   size if isinstance(size, int) else 0,
+                   time.perf_counter() - self.request_started)
+
+    def parse_request(self):
+        """Parse the request and close the connection once max_requests is reached"""
+        self.request_started = time.perf_counter()
+        if not super().parse_request():
+            return False
+        self.requests_served += 1
+        if self.max_requests and self.requests_served >= self.max_requests:
+            self.close_connection = True
+        return True
+
+    def discard_request_body(self) -> bool:
+        """
+        Read and drop the request body so the next request on the connection
+        starts at the right offset
+        
+        :return: False if an error response was sent instead
+        """
+        if 'Transfer-Encoding' in self.headers:
+            # Without a length the next request boundary is unknown
+            self.close_connection = True
+            return True
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            self.send_endpoint_response(error_response(400, "Bad Content-Length"))
+            return False
+        if length > MAX_REQUEST_BODY:
+            self.close_connection = True
+            self.send_endpoint_response(error_response(413, "Request body too large"))
+            return False
+        while length > 0:
+            data = self.rfile.read(min(length, DISCARD_CHUNK_SIZE))
+            if not data:
+                self.close_connection = True
+                break
+            length -= len(data)
+        return True
+
+    def version_string(self):
+        return SERVER_NAME
+
+    def send_endpoint_response(self, response: EndpointResponse, head_only: bool = False) -> None:
+        """
+        Write a dispatched response to the client in a single write
+        
+        :param response: Response to send
+        :param head_only: Send the headers without the body, for HEAD requests
+        """
+        if response.chunks is not None:
+            if not head_only:
+                self.send_streamed_response(response)
+                return
+            # Only the headers are sent, so the command is stopped right away
+            response.chunks.close()
+        self.wfile.write(encode_response(response, not self.close_connection, head_only=head_only,
+                                         chunked=self.request_version == 'HTTP/1.1'))
+        self.log_request(response.status, 0 if head_only else len(response.body))
+
+    def send_streamed_response(self, response: EndpointResponse) -> None:
+        """
+        Write a streamed response chunk by chunk as its data is produced
+        
+        HTTP/1.0 clients get the raw body and the connection is closed to end it.
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        if not chunked:
+            self.close_connection = True
+        size = 0
+        try:
+            self.wfile.write(encode_response(response, not self.close_connection, chunked=chunked))
+            for data in response.chunks:
+                size += len(data)
+                self.wfile.write(encode_chunk(data) if chunked else data)
+            if isinstance(response.chunks, CommandStream) and response.chunks.failed:
+                # Without the last chunk the client can tell the body was cut short
+                self.close_connection = True
+            elif chunked:
+                self.wfile.write(LAST_CHUNK)
+        except OSError:
+            # Client went away; closing the stream stops the command
+            self.close_connection = True
+        finally:
+            response.chunks.close()
+        self.log_request(response.status, size)
 
     def handle_endpoint(self):
         """Handle endpoint request for any HTTP method"""
-        if self.router:
-            # Get endpoint that matches the path
-            endpoints = self.router.get_endpoints()
-            print(f"Available endpoints: {[info['path'] for info in endpoints.values()]}")
-            
-            for uri, info in endpoints.items():
-                if info['path'] == self.path:
-                    print(f"Found matching endpoint: {uri}")
-                    # Handle based on protocol
-                    handler = get_protocol_handler(info['protocol'])
-                    if handler:
-                        try:
-                            response = handler.handle_request(info, method=self.command)
-                            print(f"Handler response: {response}")
-                            self.send_response(200)
-                            self.send_header('Content-type', 'application/json')
-                            
-                            # Add CORS headers
-                            self.send_header('Access-Control-Allow-Origin', '*')
-                            self.send_header('Access-Control-Allow-Methods', 
-                                          ', '.join(info.get('config', {}).get('methods', ['GET'])))
-                            
-                            self.end_headers()
-                            self.wfile.write(response.encode())
-                            return True
-                        except ValueError as e:
-                            print(f"Method not allowed: {str(e)}")
-                            self.send_error(405, str(e))
-                            return True
-                        except Exception as e:
-                            print(f"Error handling request: {str(e)}")
-                            self.send_error(500, str(e))
-                            return True
-
-        print(f"No endpoint found for path: {self.path}")
-        self.send_error(404, "Endpoint not found")
+        if not self.discard_request_body():
+            return True
+        response = dispatch_request(self.router, self.server.server_address[1],
+                                    self.command, self.path, self.headers)
+        self.send_endpoint_response(response, head_only=self.command == 'HEAD')
         return True
 
     def do_GET(self):
         """Handle GET requests"""
-        print(f"\nReceived GET request for: {self.path}")
+        logger.debug("Received GET request for: %s", self.path)
+        self.handle_endpoint()
+
+    def do_HEAD(self):
+        """Handle HEAD requests like GET, sending only the headers"""
+        logger.debug("Received HEAD request for: %s", self.path)
         self.handle_endpoint()
 
     def do_POST(self):
         """Handle POST requests"""
-        print(f"\nReceived POST request for: {self.path}")
+        logger.debug("Received POST request for: %s", self.path)
         self.handle_endpoint()
 
     def do_PUT(self):
         """Handle PUT requests"""
-        print(f"\nReceived PUT request for: {self.path}")
+        logger.debug("Received PUT request for: %s", self.path)
         self.handle_endpoint()
 
     def do_DELETE(self):
         """Handle DELETE requests"""
-        print(f"\nReceived DELETE request for: {self.path}")
+        logger.debug("Received DELETE request for: %s", self.path)
         self.handle_endpoint()
 
     def do_PATCH(self):
         """Handle PATCH requests"""
-        print(f"\nReceived PATCH request for: {self.path}")
+        logger.debug("Received PATCH request for: %s", self.path)
         self.handle_endpoint()
 
     def do_OPTIONS(self):
         """Handle OPTIONS requests"""
-        print(f"\nReceived OPTIONS request for: {self.path}")
-        if self.router:
-            endpoints = self.router.get_endpoints()
-            for uri, info in endpoints.items():
-                if info['path'] == self.path:
-                    methods = info.get('config', {}).get('methods', ['GET'])
-                    self.send_response(200)
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.send_header('Access-Control-Allow-Methods', ', '.join(methods))
-                    self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-                    self.end_headers()
-                    return
-        self.send_error(404, "Endpoint not found")
+        logger.debug("Received OPTIONS request for: %s", self.path)
+        if not self.discard_request_body():
+            return
+        response = preflight_response(self.router, self.server.server_address[1], self.path)
+        self.send_endpoint_response(response)
+
+class EndpointTCPServer(socketserver.ThreadingTCPServer):
+    """Thread-per-connection server, so one persistent connection cannot block a port"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ReusePortTCPServer(EndpointTCPServer):
+    """EndpointTCPServer that lets several worker processes bind the same port"""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
 
 class UriPointCLI:
-    def __init__(self):
-        self.router = StreamFilterRouter()
+    def __init__(self, route_cache_size: int = 0):
+        """
+        :param route_cache_size: Size of the router's URI -> handler LRU cache
+                                 used by publish(), 0 to disable
+        """
+        self.router = StreamFilterRouter(route_cache_size=route_cache_size)
         self.servers = {}
+        # Keep-alive settings for both serving engines
+        self.keepalive_timeout = EndpointHandler.timeout
+        self.max_keepalive_requests = EndpointHandler.max_requests
     
     def create_endpoint(self, uri: str, data: Dict[str, Any]) -> bool:
         """
@@ -117,21 +228,57 @@ class UriPointCLI:
         except ValueError as e:
             raise ValueError(f"Failed to create endpoint: {str(e)}")
     
-    def list_endpoints(self) -> List[Dict[str, Any]]:
+    def create_endpoints(self, endpoints: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
         """
-        List all registered endpoints
+        Create many endpoints at once, see StreamFilterRouter.add_endpoints
         
+        :param endpoints: (uri, data) pairs
+        :return: URI -> error message for the endpoints that could not be created
+        """
+        return {uri: f"Failed to create endpoint: {error}"
+                for uri, error in self.router.add_endpoints(endpoints).items()}
+    
+    def delete_endpoint(self, uri: str) -> bool:
+        """
+        Delete an endpoint; running servers stop serving it immediately
+        
+        :param uri: URI of the endpoint
+        :return: True if the endpoint existed
+        """
+        return self.router.delete_endpoint(uri)
+    
+    def delete_endpoints(self, uris: Iterable[str]) -> List[str]:
+        """
+        Delete many endpoints at once
+        
+        :param uris: URIs of the endpoints
+        :return: URIs of the endpoints that existed and were deleted
+        """
+        return self.router.delete_endpoints(uris)
+    
+    def list_endpoints(self, protocol: Optional[str] = None, hostname: Optional[str] = None,
+                       port: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        List registered endpoints, optionally only those matching the given
+        protocol, hostname and port
+        
+        :param protocol: Only list endpoints of this protocol
+        :param hostname: Only list endpoints on this host
+        :param port: Only list endpoints on this port
         :return: List of endpoint configurations
         """
-        endpoints = self.router.get_endpoints()
+        filters = {'protocol': protocol, 'hostname': hostname}
+        if port is not None:
+            filters['port'] = port
         return [
             {
-                'protocol': info['protocol'],
-                'hostname': info['hostname'],
-                'port': info['port'],
-                'path': info['path']
+                'uri': info.uri,
+                'protocol': info.protocol,
+                'hostname': info.hostname,
+                'port': info.port,
+                'path': info.path
             }
-            for info in endpoints.values()
+            for info in self.router.query_endpoints(**filters)
         ]
     
     def get_endpoint(self, uri: str) -> Optional[Dict[str, Any]]:
@@ -144,6 +291,16 @@ class UriPointCLI:
         endpoints = self.router.get_endpoints()
         return endpoints.get(uri)
     
+    def resolve_endpoint(self, uri: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        Find the endpoint serving a concrete URI, including templated endpoints
+        such as redis://redis:6379/sessions/{user_id}
+        
+        :param uri: URI to resolve
+        :return: (endpoint configuration, path parameters) if found
+        """
+        return self.router.resolve_endpoint(uri)
+    
     def publish(self, uri: str, data: Any) -> bool:
         """
         Publish data to an endpoint
@@ -153,46 +310,120 @@ class UriPointCLI:
         :return: Success status
         """
         return bool(self.router.process(uri, data))
+
+    async def apublish(self, uri: str, data: Any) -> bool:
+        """
+        Publish data to an endpoint from a coroutine, see StreamFilterRouter.aprocess
+        
+        :param uri: URI of the endpoint
+        :param data: Data to publish
+        :return: Success status
+        """
+        return bool(await self.router.aprocess(uri, data))
     
     def subscribe(self, uri: str, callback: callable) -> bool:
         """
         Subscribe to an endpoint
         
         :param uri: URI of the endpoint
-        :param callback: Callback function for received data
+        :param callback: Callback function for received data; a coroutine
+                         function is awaited by apublish
         :return: Success status
         """
         pattern = get_url_parts(uri)['path']
         self.router.add_route(pattern, callback)
         return True
     
-    def serve(self) -> None:
+    def serve(self, engine: str = 'threading', workers: int = 1) -> None:
         """
         Start serving all endpoints
-        """
-        endpoints = self.router.get_endpoints()
-        print(f"\nRegistered endpoints: {[info['path'] for info in endpoints.values()]}")
         
+        :param engine: 'threading' for a thread-per-connection server per port, or 'asyncio'
+                       to serve every port from a single event loop
+        :param workers: Number of worker processes; above 1 each worker binds
+                        the same ports with SO_REUSEPORT and the kernel spreads
+                        connections across them
+        """
+        if engine not in ('threading', 'asyncio'):
+            raise ValueError(f"Unknown serving engine: {engine}")
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers}")
+
         # Group endpoints by port
-        port_groups = {}
-        for uri, info in endpoints.items():
-            port = info.get('port', 80)
-            if port not in port_groups:
-                port_groups[port] = []
-            port_groups[port].append(info)
-        
-        # Create servers for each port
+        port_groups = {port: self.router.endpoints_by_port(port)
+                       for port in self.router.endpoint_ports()}
+        print(f"\nRegistered endpoints: {[info.path for group in port_groups.values() for info in group]}")
+        
+        if workers > 1:
+            self._serve_workers(engine, port_groups, workers)
+            return
+
+        self._start_servers(engine, port_groups)
+        
+        print("\nAll servers started. Press Ctrl+C to stop.")
+        
+        # Keep main thread running
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop_servers()
+
+    def _start_servers(self, engine: str, port_groups: Dict[int, List[Dict[str, Any]]],
+                       reuse_port: bool = False) -> None:
+        if engine == 'asyncio':
+            self._start_async_servers(port_groups, reuse_port)
+        else:
+            self._start_threaded_servers(port_groups, reuse_port)
+
+    def _serve_workers(self, engine: str, port_groups: Dict[int, List[Dict[str, Any]]],
+                       workers: int) -> None:
+        """
+        Start worker processes sharing the ports and restart any that exit
+        
+        Workers get the endpoint configurations rather than this CLI, so they
+        start under the spawn and forkserver methods as well as fork.
+        """
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError("Worker mode requires SO_REUSEPORT, which this platform lacks")
+
+        endpoints = [(info.uri, dict(info.config))
+                     for group in port_groups.values() for info in group]
+        executor = get_command_executor()
+        limits = (executor.max_workers, executor.max_queue, executor.queue_timeout,
+                  executor.timeout)
+        manager = ProcessManager()
+        for index in range(workers):
+            manager.start_process(f'worker-{index}', _run_worker, engine, endpoints,
+                                  self.keepalive_timeout, self.max_keepalive_requests, limits)
+        print(f"\nStarted {workers} worker processes. Press Ctrl+C to stop.")
+
+        try:
+            while True:
+                time.sleep(1)
+                for name, alive in manager.list_processes().items():
+                    if not alive:
+                        print(f"Worker {name} exited, restarting")
+                        manager.restart_process(name)
+        except KeyboardInterrupt:
+            manager.cleanup()
+
+    def _start_threaded_servers(self, port_groups: Dict[int, List[Dict[str, Any]]],
+                                reuse_port: bool = False) -> None:
+        """
+        Start a socketserver in its own thread for each port
+        """
+        server_class = ReusePortTCPServer if reuse_port else EndpointTCPServer
         for port, endpoints in port_groups.items():
             def create_handler(*args, **kwargs):
-                return EndpointHandler(*args, router=self.router, **kwargs)
+                return EndpointHandler(*args, router=self.router,
+                                       timeout=self.keepalive_timeout,
+                                       max_requests=self.max_keepalive_requests, **kwargs)
             
             try:
-                server = socketserver.TCPServer(('', port), create_handler)
+                server = server_class(('', port), create_handler)
                 print(f"\nStarting server on port {port}")
-                print(f"Endpoints on port {port}:")
-                for endpoint in endpoints:
-                    methods = endpoint.get('config', {}).get('methods', ['GET'])
-                    print(f"  {endpoint['path']} [{', '.join(methods)}]")
+                _print_port_endpoints(port, endpoints)
                 
                 # Start server in a new thread
                 thread = threading.Thread(target=server.serve_forever)
@@ -202,23 +433,69 @@ class UriPointCLI:
                 self.servers[port] = server
             except Exception as e:
                 print(f"Failed to start server on port {port}: {str(e)}")
-        
-        print("\nAll servers started. Press Ctrl+C to stop.")
-        
-        # Keep main thread running
-        try:
-            while True:
-                import time
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.stop_servers()
+
+    def _start_async_servers(self, port_groups: Dict[int, List[Dict[str, Any]]],
+                             reuse_port: bool = False) -> None:
+        """
+        Bind every port and serve them all from one asyncio event loop thread
+        """
+        server = AsyncEndpointServer(self.router, reuse_port=reuse_port,
+                                     keepalive_timeout=self.keepalive_timeout,
+                                     max_requests=self.max_keepalive_requests)
+        for port, endpoints in port_groups.items():
+            try:
+                server.bind(port)
+                print(f"\nStarting asyncio server on port {port}")
+                _print_port_endpoints(port, endpoints)
+                self.servers[port] = server
+            except Exception as e:
+                print(f"Failed to start server on port {port}: {str(e)}")
+
+        if server.sockets:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
     
     def stop_servers(self) -> None:
         """
         Stop all running servers
         """
+        stopped = []
         for port, server in self.servers.items():
             print(f"Stopping server on port {port}")
+            # Ports served by the asyncio engine share one server
+            if any(server is other for other in stopped):
+                continue
             server.shutdown()
             server.server_close()
+            stopped.append(server)
         self.servers.clear()
+        self.router.close_command_pools()
+
+def _run_worker(engine: str, endpoints: List[Tuple[str, Dict[str, Any]]],
+                keepalive_timeout: float, max_requests: int, executor_limits: tuple) -> None:
+    """
+    Body of a worker process: rebuild the endpoints and serve all ports until interrupted
+    """
+    configure_command_executor(*executor_limits)
+    cli = UriPointCLI()
+    cli.keepalive_timeout = keepalive_timeout
+    cli.max_keepalive_requests = max_requests
+    for uri, error in cli.create_endpoints(endpoints).items():
+        print(f"Worker skipped {uri}: {error}")
+    port_groups = {port: cli.router.endpoints_by_port(port)
+                   for port in cli.router.endpoint_ports()}
+    cli._start_servers(engine, port_groups, reuse_port=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cli.stop_servers()
+
+def _print_port_endpoints(port: int, endpoints: List[Dict[str, Any]]) -> None:
+    print(f"Endpoints on port {port}:")
+    for endpoint in endpoints:
+        methods = endpoint.get('config', {}).get('methods', ['GET'])
+        print(f"  {endpoint['path']} [{', '.join(methods)}]")
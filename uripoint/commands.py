@@ -0,0 +1,635 @@
+"""
+Execution support for ``command`` endpoints
+"""
+import concurrent.futures
+import json
+import os
+import queue
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Optional
+from .access_log import logger
+
+# Most bytes of command output held in memory per streamed chunk
+STREAM_CHUNK_SIZE = 65536
+# spawn runs a shell per request; persistent reuses a warm process pool
+EXEC_MODES = ('spawn', 'persistent')
+
+class CommandError(RuntimeError):
+    """Command could not be run or finish; status is the HTTP status to answer with"""
+    status = 500
+
+class CommandRejected(CommandError):
+    """Command was refused because the executor or the endpoint is saturated"""
+    def __init__(self, message: str, status: int = 503):
+        super().__init__(message)
+        self.status = status
+
+class CommandTimeout(CommandError):
+    """Command ran longer than its timeout and was killed"""
+    status = 504
+
+class CommandExecutor:
+    """
+    Runs endpoint commands with bounded concurrency
+
+    At most ``max_workers`` commands run at once. Further requests wait in a
+    queue of at most ``max_queue`` entries for up to ``queue_timeout``
+    seconds; beyond that they are rejected with 503 instead of piling up
+    shells. An endpoint's ``max_concurrency`` caps its own running and
+    queued commands, answered with 429 when exceeded.
+    """
+    def __init__(self, max_workers: int = 8, max_queue: int = 64,
+                 queue_timeout: float = 10.0, timeout: Optional[float] = None):
+        if max_workers < 1:
+            raise ValueError(f"Invalid max_workers: {max_workers}")
+        if max_queue < 0:
+            raise ValueError(f"Invalid max_queue: {max_queue}")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._active = {}
+        self.running = 0
+        self.started = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def run(self, command: str, timeout: Optional[float] = None, key: Optional[str] = None,
+            max_concurrency: Optional[int] = None) -> str:
+        """
+        Run a shell command once a slot is free and return its stdout
+
+        :param command: Shell command
+        :param timeout: Seconds the command may run, the executor default if None
+        :param key: Endpoint the command belongs to, for max_concurrency
+        :param max_concurrency: Running and queued commands allowed for key
+        :return: Command stdout
+        :raises CommandRejected: If no slot is available in time
+        :raises CommandTimeout: If the command outlives its timeout
+        :raises CommandError: If the command fails
+        """
+        self._acquire(key, max_concurrency)
+        try:
+            return self._execute(command, self.timeout if timeout is None else timeout)
+        finally:
+            self._release(key)
+
+    def stream(self, command: str, timeout: Optional[float] = None, key: Optional[str] = None,
+               max_concurrency: Optional[int] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> 'CommandStream':
+        """
+        Start a shell command once a slot is free and stream its stdout
+
+        The slot is held until the returned stream is exhausted or closed.
+
+        :param command: Shell command
+        :param timeout: Seconds the command may run, the executor default if None
+        :param key: Endpoint the command belongs to, for max_concurrency
+        :param max_concurrency: Running and queued commands allowed for key
+        :param chunk_size: Most bytes read from stdout per chunk
+        :return: CommandStream yielding stdout as it is produced
+        :raises CommandRejected: If no slot is available in time
+        """
+        self._acquire(key, max_concurrency)
+        try:
+            stderr = tempfile.TemporaryFile()
+            try:
+                process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                           stderr=stderr, start_new_session=os.name == 'posix')
+            except BaseException:
+                stderr.close()
+                raise
+        except BaseException:
+            self._release(key)
+            raise
+        return CommandStream(self, process, stderr, self.timeout if timeout is None else timeout,
+                             key, chunk_size)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get executor metrics
+
+        :return: Running and queued counts, outcome counters and queue wait times
+        """
+        with self._cond:
+            return {
+                'running': self.running,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait': self.total_wait / self.started if self.started else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+    def reject(self, message: str = "Command queue is full") -> CommandRejected:
+        """
+        Count a request turned away before it reached the executor, e.g. by a
+        server whose threads for command requests are all busy
+
+        :param message: Reason given to the client
+        :return: CommandRejected to raise or answer with
+        """
+        with self._cond:
+            self.rejected += 1
+        return CommandRejected(message)
+
+    def _acquire(self, key: Optional[str], max_concurrency: Optional[int]) -> None:
+        start = time.monotonic()
+        with self._cond:
+            if max_concurrency is not None and self._active.get(key, 0) >= max_concurrency:
+                self.rejected += 1
+                raise CommandRejected(f"Too many concurrent requests for {key}", 429)
+            if self.running >= self.max_workers and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise CommandRejected("Command queue is full")
+            self._active[key] = self._active.get(key, 0) + 1
+            if self.running >= self.max_workers:
+                self.queued += 1
+                self.max_queued = max(self.max_queued, self.queued)
+                try:
+                    deadline = start + self.queue_timeout
+                    while self.running >= self.max_workers:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            self._release_key(key)
+                            raise CommandRejected("Timed out waiting for a command slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.running += 1
+            self.started += 1
+            waited = time.monotonic() - start
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def _release(self, key: Optional[str]) -> None:
+        with self._cond:
+            self.running -= 1
+            self._release_key(key)
+            self._cond.notify()
+
+    def _release_key(self, key: Optional[str]) -> None:
+        count = self._active.get(key, 0) - 1
+        if count > 0:
+            self._active[key] = count
+        else:
+            self._active.pop(key, None)
+
+    def _execute(self, command: str, timeout: Optional[float]) -> str:
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True,
+                                   start_new_session=os.name == 'posix')
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process(process)
+            with self._cond:
+                self.timed_out += 1
+            raise CommandTimeout(f"Command timed out after {timeout}s")
+        except BaseException:
+            _kill_process(process)
+            raise
+        if process.returncode != 0:
+            with self._cond:
+                self.failed += 1
+            raise CommandError(f"Command failed: {stderr}")
+        with self._cond:
+            self.completed += 1
+        return stdout
+
+def validate_command_config(config: Dict[str, Any]) -> None:
+    """
+    Check the execution limits of a command endpoint config
+
+    :param config: Endpoint configuration
+    :raises ValueError: If timeout, max_concurrency, exec_mode or pool_size is
+                        invalid, or streaming is combined with cache_ttl or
+                        persistent mode
+    """
+    if not isinstance(config, Mapping) or 'command' not in config:
+        return
+    timeout = config.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or
+                                not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise ValueError(f"Invalid timeout: {timeout}")
+    limit = config.get('max_concurrency')
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        raise ValueError(f"Invalid max_concurrency: {limit}")
+    if config.get('stream') and 'cache_ttl' in config:
+        raise ValueError("Streamed command output cannot be cached")
+    exec_mode = config.get('exec_mode', 'spawn')
+    if exec_mode not in EXEC_MODES:
+        raise ValueError(f"Invalid exec_mode: {exec_mode}")
+    if exec_mode == 'persistent':
+        if config.get('stream'):
+            raise ValueError("Persistent commands cannot stream their output")
+        size = config.get('pool_size', 2)
+        if isinstance(size, bool) or not isinstance(size, int) or size < 1:
+            raise ValueError(f"Invalid pool_size: {size}")
+
+class CommandStream:
+    """
+    Iterator over the stdout of a running command
+
+    Each chunk is returned as soon as the command writes it, so memory stays
+    bounded by chunk_size however much the command prints. Closing the stream
+    early, e.g. when the client disconnects, kills the command; either way
+    the executor slot is released exactly once.
+    """
+    def __init__(self, executor: CommandExecutor, process: subprocess.Popen, stderr,
+                 timeout: Optional[float], key: Optional[str], chunk_size: int):
+        self._executor = executor
+        self._process = process
+        self._stderr = stderr
+        self._key = key
+        self._chunk_size = chunk_size
+        self._closed = False
+        self.timed_out = False
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def __iter__(self) -> 'CommandStream':
+        return self
+
+    def __next__(self) -> bytes:
+        if self._closed:
+            raise StopIteration
+        data = self._process.stdout.read1(self._chunk_size)
+        if data:
+            return data
+        self.finish()
+        raise StopIteration
+
+    def fileno(self) -> int:
+        """
+        File descriptor of the command's stdout, for servers that wait for
+        output with an event loop instead of iterating in a thread
+        """
+        return self._process.stdout.fileno()
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    @property
+    def failed(self) -> bool:
+        """
+        Whether the command timed out or exited non-zero, once it has finished;
+        its output is then incomplete
+        """
+        return self.timed_out or bool(self._process.returncode)
+
+    def finish(self) -> None:
+        """
+        Wait for the command to exit after its output was read to the end,
+        then release its slot
+        """
+        if not self._closed:
+            self._process.wait()
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop the command if it is still running and release its slot
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._timer is not None:
+                self._timer.cancel()
+            if self._process.poll() is None:
+                _kill_process_group(self._process)
+            self._process.wait()
+            self._process.stdout.close()
+            self._record_outcome()
+        finally:
+            self._stderr.close()
+            self._executor._release(self._key)
+
+    def _expire(self) -> None:
+        self.timed_out = True
+        _kill_process_group(self._process)
+
+    def _record_outcome(self) -> None:
+        executor = self._executor
+        with executor._cond:
+            if self.timed_out:
+                executor.timed_out += 1
+            elif self._process.returncode == 0:
+                executor.completed += 1
+            else:
+                executor.failed += 1
+        if self.timed_out or self._process.returncode:
+            self._stderr.seek(0)
+            message = self._stderr.read(STREAM_CHUNK_SIZE).decode('utf-8', 'replace')
+            logger.error("Streamed command %s exited with %s: %s", self._key,
+                         'timeout' if self.timed_out else self._process.returncode, message)
+
+class PersistentCommandPool:
+    """
+    Warm pool of long-lived processes serving an ``exec_mode: persistent`` endpoint
+
+    Each process runs the endpoint's command once and then answers requests in
+    turn: the request is written to its stdin as one JSON line and the response
+    is the next line it writes to stdout. This saves the shell and interpreter
+    startup that spawn mode pays per request. Processes are started on the
+    first request, replaced when they die or time out, and at most ``size``
+    requests are served at once; others wait up to ``queue_timeout`` seconds.
+    """
+    def __init__(self, command: str, size: int = 2, timeout: Optional[float] = None,
+                 queue_timeout: float = 10.0):
+        self.command = command
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.restarts = 0
+        self._idle = queue.Queue()
+        self._processes = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional['PersistentCommandPool']:
+        """
+        Build a pool for a command endpoint with ``exec_mode: persistent``
+
+        :param config: Endpoint configuration
+        :return: PersistentCommandPool, or None for spawn-mode endpoints
+        """
+        if not isinstance(config, Mapping) or 'command' not in config:
+            return None
+        if config.get('exec_mode', 'spawn') != 'persistent':
+            return None
+        return cls(config['command'], config.get('pool_size', 2), config.get('timeout'))
+
+    def request(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        """
+        Send a request to an idle process and return its response line
+
+        :param payload: JSON-serializable request description
+        :param timeout: Seconds to wait for the response, the pool default if None
+        :return: Response line without its newline
+        :raises CommandRejected: If no process becomes idle in time
+        :raises CommandTimeout: If the process does not answer in time
+        :raises CommandError: If the process exits instead of answering
+        """
+        self.start()
+        try:
+            process = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise CommandRejected("No persistent worker available")
+        timeout = self.timeout if timeout is None else timeout
+        healthy = False
+        timer = None
+        expired = threading.Event()
+        try:
+            if timeout is not None:
+                def expire():
+                    expired.set()
+                    _kill_process_group(process)
+                timer = threading.Timer(timeout, expire)
+                timer.daemon = True
+                timer.start()
+            try:
+                process.stdin.write(json.dumps(payload).encode() + b'\n')
+                process.stdin.flush()
+                line = process.stdout.readline()
+            except (BrokenPipeError, ValueError):
+                line = b''
+            if expired.is_set():
+                raise CommandTimeout(f"Persistent command timed out after {timeout}s")
+            if not line.endswith(b'\n'):
+                raise CommandError("Persistent command exited without responding")
+            healthy = True
+            return line[:-1].decode('utf-8', 'replace')
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._checkin(process, healthy)
+
+    def start(self) -> None:
+        """
+        Start the pool's processes if they are not running yet
+        """
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+
+    def close(self) -> None:
+        """
+        Stop all processes; they see EOF on stdin and are killed if they linger
+
+        A later request starts the pool again.
+        """
+        with self._lock:
+            self._started = False
+            self._idle = queue.Queue()
+            processes, self._processes = self._processes, []
+        for process in processes:
+            _stop_process(process)
+
+    def _spawn(self) -> subprocess.Popen:
+        process = subprocess.Popen(self.command, shell=True, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   start_new_session=os.name == 'posix')
+        self._processes.append(process)
+        return process
+
+    def _checkin(self, process: subprocess.Popen, healthy: bool) -> None:
+        with self._lock:
+            if process not in self._processes:
+                # The pool was closed while this request was in flight
+                return
+            if not healthy or process.poll() is not None:
+                self._processes.remove(process)
+                _stop_process(process)
+                process = self._spawn()
+                self.restarts += 1
+            self._idle.put(process)
+
+def _stop_process(process: subprocess.Popen) -> None:
+    """Close a persistent process's stdin and kill it if it does not exit promptly"""
+    try:
+        process.stdin.close()
+    except OSError:
+        pass
+    try:
+        process.wait(timeout=1)
+    except subprocess.TimeoutExpired:
+        _kill_process_group(process)
+        process.wait()
+    process.stdout.close()
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _kill_process(process: subprocess.Popen) -> None:
+    """Kill a command together with anything its shell started"""
+    _kill_process_group(process)
+    process.communicate()
+
+_executor = CommandExecutor()
+
+def get_command_executor() -> CommandExecutor:
+    """
+    Get the executor shared by all command endpoints in this process
+    """
+    return _executor
+
+def configure_command_executor(max_workers: int = 8, max_queue: int = 64,
+                               queue_timeout: float = 10.0,
+                               timeout: Optional[float] = None) -> CommandExecutor:
+    """
+    Replace the shared command executor
+
+    :param max_workers: Commands allowed to run at once
+    :param max_queue: Requests allowed to wait for a free slot
+    :param queue_timeout: Seconds a request may wait before a 503
+    :param timeout: Default seconds a command may run before it is killed
+    :return: The new executor
+    """
+    global _executor
+    _executor = CommandExecutor(max_workers, max_queue, queue_timeout, timeout)
+    return _executor
+
+class CommandResultCache:
+    """
+    Memoizes the response of one command endpoint for ``cache_ttl`` seconds
+
+    Concurrent misses are coalesced into a single execution whose result every
+    waiting request receives. Once the TTL passes, the stale response keeps
+    being served while one background refresh runs; ``cache_stale`` bounds
+    how long past the TTL that is allowed (unbounded by default).
+    """
+    def __init__(self, ttl: float, stale: Optional[float] = None):
+        if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+            raise ValueError(f"Invalid cache_ttl: {ttl}")
+        if stale is not None and (isinstance(stale, bool) or
+                                  not isinstance(stale, (int, float)) or stale < 0):
+            raise ValueError(f"Invalid cache_stale: {stale}")
+        self.ttl = ttl
+        self.stale = stale
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0.0
+        self._inflight: Optional[concurrent.futures.Future] = None
+        self._refreshing = False
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional['CommandResultCache']:
+        """
+        Build a cache for an endpoint config with ``command`` and ``cache_ttl``
+
+        :param config: Endpoint configuration
+        :return: CommandResultCache, or None if the endpoint is not cached
+        """
+        if not isinstance(config, Mapping) or 'command' not in config or 'cache_ttl' not in config:
+            return None
+        return cls(config['cache_ttl'], config.get('cache_stale'))
+
+    def get(self, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached response, computing or refreshing it as needed
+
+        :param compute: Runs the command and returns its response; error
+                        responses (status >= 400) are passed on but not cached
+        :return: Response
+        """
+        now = time.monotonic()
+        value = self._value
+        if value is not None and now < self._expires:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            value = self._value
+            if value is not None and now < self._expires:
+                self.hits += 1
+                return value
+            if value is not None and (self.stale is None or now < self._expires + self.stale):
+                self.hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    thread = threading.Thread(target=self._refresh, args=(compute,))
+                    thread.daemon = True
+                    thread.start()
+                return value
+
+            self.misses += 1
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = concurrent.futures.Future()
+
+        if not leader:
+            return inflight.result()
+        try:
+            value = self._compute(compute)
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        else:
+            inflight.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight = None
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached response so the next request runs the command
+        """
+        with self._lock:
+            self._value = None
+            self._expires = 0.0
+
+    def _compute(self, compute: Callable[[], Any]) -> Any:
+        value = compute()
+        if getattr(value, 'status', 200) < 400:
+            with self._lock:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+        return value
+
+    def _refresh(self, compute: Callable[[], Any]) -> None:
+        try:
+            self._compute(compute)
+        except Exception:
+            # Keep serving the stale response; the next request retries
+            pass
+        finally:
+            with self._lock:
+                self._refreshing = False
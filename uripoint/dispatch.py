@@ -0,0 +1,466 @@
+"""
+Transport-independent request dispatch for UriPoint endpoints
+"""
+import email.utils
+import functools
+import gzip
+import hashlib
+import html
+import time
+from collections.abc import Mapping
+from http import HTTPStatus
+from http.server import DEFAULT_ERROR_MESSAGE, DEFAULT_ERROR_CONTENT_TYPE
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .access_log import logger
+from .commands import CommandError, CommandRejected, get_command_executor
+from .protocols import get_protocol_handler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SERVER_NAME = 'UriPoint'
+# Static bodies smaller than this are always sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+# Request bodies are only read to be discarded, in pieces of at most
+# DISCARD_CHUNK_SIZE bytes; longer ones are refused with 413
+MAX_REQUEST_BODY = 1024 * 1024
+DISCARD_CHUNK_SIZE = 65536
+
+_COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=9)}
+if brotli is not None:
+    _COMPRESSORS['br'] = brotli.compress
+# Preferred first when the client accepts several encodings equally
+_ENCODING_PREFERENCE = tuple(encoding for encoding in ('br', 'gzip') if encoding in _COMPRESSORS)
+
+class EndpointResponse:
+    """
+    Response produced for an endpoint request, independent of the serving engine
+
+    The status line and fixed headers are serialized once and cached, so a
+    prepared static response costs a single buffer join per request.
+    Responses carrying an ETag can answer conditional requests with not_modified().
+    Streamed responses carry an iterator of body chunks instead of a body; the
+    server frames them with encode_chunk() and must close() the iterator.
+    """
+    __slots__ = ('status', 'headers', 'body', 'message', 'etag', 'last_modified',
+                 'chunks', '_head', '_variants', '_not_modified')
+
+    def __init__(self, status: int, headers: Optional[List[Tuple[str, str]]] = None,
+                 body: bytes = b'', message: Optional[str] = None,
+                 etag: Optional[str] = None, last_modified: Optional[float] = None,
+                 chunks: Optional[Iterator[bytes]] = None):
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+        self.message = message
+        self.etag = etag
+        self.last_modified = last_modified
+        self.chunks = chunks
+        self._head = None
+        self._variants = None
+        self._not_modified = None
+
+    @property
+    def is_error(self) -> bool:
+        return self.status >= 400
+
+    @property
+    def head(self) -> bytes:
+        """
+        Status line, Server, fixed headers, validators and Content-Length
+        (omitted for streamed responses), CRLF-terminated
+        """
+        if self._head is None:
+            try:
+                reason = HTTPStatus(self.status).phrase
+            except ValueError:
+                reason = ''
+            lines = [f"HTTP/1.1 {self.status} {reason}", f"Server: {SERVER_NAME}"]
+            lines.extend(f"{name}: {value}" for name, value in self.headers)
+            if self.etag is not None:
+                lines.append(f"ETag: {self.etag}")
+            if self.last_modified is not None:
+                lines.append(f"Last-Modified: {email.utils.formatdate(self.last_modified, usegmt=True)}")
+            if self.status != 304 and self.chunks is None:
+                lines.append(f"Content-Length: {len(self.body)}")
+            self._head = ('\r\n'.join(lines) + '\r\n').encode('latin-1', 'strict')
+        return self._head
+
+    def variant(self, encoding: str) -> 'EndpointResponse':
+        """
+        Get this response compressed with a content encoding, compressing on
+        first use and reusing the result afterwards
+
+        :param encoding: 'gzip', or 'br' when brotli is installed
+        :return: Compressed response, or self if compression does not shrink the body
+        """
+        variants = self._variants
+        if variants is None:
+            variants = self._variants = {}
+        response = variants.get(encoding)
+        if response is None:
+            body = _COMPRESSORS[encoding](self.body)
+            if len(body) < len(self.body):
+                etag = None
+                if self.etag is not None:
+                    # A strong ETag must differ between content codings
+                    etag = '"%s-%s"' % (self.etag.strip('"'), encoding)
+                response = EndpointResponse(self.status,
+                                            self.headers + [('Content-Encoding', encoding)],
+                                            body, etag=etag, last_modified=self.last_modified)
+                response.head
+            else:
+                response = self
+            variants[encoding] = response
+        return response
+
+    def not_modified(self) -> 'EndpointResponse':
+        """
+        Get the 304 Not Modified response for this response, built once
+        """
+        if self._not_modified is None:
+            response = EndpointResponse(304, self.headers, etag=self.etag,
+                                        last_modified=self.last_modified)
+            response.head
+            self._not_modified = response
+        return self._not_modified
+
+def compute_etag(body: bytes) -> str:
+    """
+    Compute a strong ETag for a response body
+
+    :param body: Response body
+    :return: Quoted entity tag
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def evaluate_conditional(response: EndpointResponse, headers=None) -> EndpointResponse:
+    """
+    Answer If-None-Match / If-Modified-Since with 304 when the client's copy is current
+
+    :param response: Response that would be sent
+    :param headers: Request headers; lower-case keys are looked up
+    :return: The response, or its 304 Not Modified counterpart
+    """
+    if headers is None or response.status != 200 or response.etag is None:
+        return response
+
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-None-Match takes precedence and uses weak comparison
+        if if_none_match.strip() == '*':
+            return response.not_modified()
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == response.etag:
+                return response.not_modified()
+        return response
+
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since and response.last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return response
+        if int(response.last_modified) <= since:
+            return response.not_modified()
+    return response
+
+_CONNECTION_HEADERS = {True: b'Connection: keep-alive\r\n\r\n', False: b'Connection: close\r\n\r\n'}
+_CHUNKED_HEADER = b'Transfer-Encoding: chunked\r\n'
+# Terminates a chunked body
+LAST_CHUNK = b'0\r\n\r\n'
+_date_cache = (0, b'')
+
+def _date_header() -> bytes:
+    """Date header line, formatted at most once per second"""
+    global _date_cache
+    now = int(time.time())
+    cached = _date_cache
+    if cached[0] != now:
+        cached = (now, f"Date: {email.utils.formatdate(now, usegmt=True)}\r\n".encode('ascii'))
+        _date_cache = cached
+    return cached[1]
+
+def encode_response(response: EndpointResponse, keep_alive: bool,
+                    head_only: bool = False, chunked: bool = True) -> bytes:
+    """
+    Serialize a response into one buffer ready for a single write
+
+    For streamed responses only the head is returned; the chunks follow.
+
+    :param response: Response to serialize
+    :param keep_alive: Whether the connection stays open afterwards
+    :param head_only: Omit the body, e.g. for HEAD requests
+    :param chunked: Announce chunked framing for a streamed response; pass
+                    False for HTTP/1.0 clients and close the connection after
+    :return: Raw HTTP/1.1 response bytes
+    """
+    parts = [response.head, _date_header()]
+    if response.chunks is not None and chunked:
+        parts.append(_CHUNKED_HEADER)
+    parts.append(_CONNECTION_HEADERS[keep_alive])
+    if not head_only:
+        parts.append(response.body)
+    return b''.join(parts)
+
+def encode_chunk(data: bytes) -> bytes:
+    """
+    Frame one piece of a streamed body for Transfer-Encoding: chunked
+
+    :param data: Non-empty body piece
+    :return: Chunk bytes
+    """
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+@functools.lru_cache(maxsize=128)
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best available content encoding for an Accept-Encoding header
+
+    :param accept_encoding: Accept-Encoding header value
+    :return: Encoding name, or None to send the body as-is
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in _ENCODING_PREFERENCE:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def select_encoding(response: EndpointResponse, headers=None) -> EndpointResponse:
+    """
+    Choose the precompressed variant of a prepared response the client accepts
+
+    :param response: Prepared response
+    :param headers: Request headers; lower-case keys are looked up
+    :return: The response or one of its compressed variants
+    """
+    if headers is None or len(response.body) < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = negotiate_encoding(headers.get('accept-encoding'))
+    if encoding is None:
+        return response
+    return response.variant(encoding)
+
+def prepare_response(info: Dict[str, Any]) -> Optional[EndpointResponse]:
+    """
+    Render a static endpoint once so it can be served without running its handler
+
+    :param info: Endpoint info
+    :return: Response with its head serialized, or None if the endpoint runs a
+             command or cannot be rendered ahead of a request
+    """
+    if is_blocking(info):
+        return None
+    handler = get_protocol_handler(info['protocol'])
+    if not handler:
+        return None
+    try:
+        body = handler.handle_request(info).encode()
+    except Exception:
+        # Rendered per request instead, which reports the error to the client
+        return None
+    headers = _endpoint_headers(info)
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        headers.append(('Vary', 'Accept-Encoding'))
+    response = EndpointResponse(200, headers, body, etag=compute_etag(body),
+                                last_modified=time.time())
+    response.head  # serialize now rather than on the first request
+    return response
+
+def error_response(status: int, message: str,
+                   headers: Optional[List[Tuple[str, str]]] = None) -> EndpointResponse:
+    """
+    Create an error response with the same HTML body http.server would send
+
+    :param status: HTTP status code
+    :param message: Error message
+    :param headers: Extra headers, e.g. Retry-After
+    :return: EndpointResponse
+    """
+    try:
+        http_status = HTTPStatus(status)
+        short, explain = http_status.phrase, http_status.description
+    except ValueError:
+        short, explain = '???', ''
+    body = (DEFAULT_ERROR_MESSAGE % {
+        'code': status,
+        'message': html.escape(message or short, quote=False),
+        'explain': html.escape(explain, quote=False),
+    }).encode('UTF-8', 'replace')
+    return EndpointResponse(status, [('Content-Type', DEFAULT_ERROR_CONTENT_TYPE)] + (headers or []),
+                            body, message)
+
+def is_blocking(info: Dict[str, Any]) -> bool:
+    """
+    Check whether serving an endpoint may block, e.g. by running a command
+
+    :param info: Endpoint info
+    :return: True if the endpoint should be served off the event loop
+    """
+    config = info.get('config')
+    return isinstance(config, Mapping) and 'command' in config
+
+def is_streamed(info: Dict[str, Any]) -> bool:
+    """
+    Check whether an endpoint streams its command output as it is produced
+
+    :param info: Endpoint info
+    :return: True for command endpoints configured with ``stream: true``
+    """
+    config = info.get('config')
+    return isinstance(config, Mapping) and 'command' in config and bool(config.get('stream'))
+
+def _stream_endpoint(info: Dict[str, Any]) -> EndpointResponse:
+    config = info['config']
+    chunks = get_command_executor().stream(
+        config['command'],
+        timeout=config.get('timeout'),
+        key=info['uri'],
+        max_concurrency=config.get('max_concurrency'))
+    return EndpointResponse(200, _endpoint_headers(info), chunks=chunks)
+
+def render_endpoint(info: Dict[str, Any], method: str, pool=None) -> EndpointResponse:
+    """
+    Run the protocol handler for an endpoint and build its response
+
+    :param info: Endpoint info
+    :param method: HTTP method of the request
+    :param pool: PersistentCommandPool serving the endpoint's command, if any
+    :return: EndpointResponse
+    """
+    handler = get_protocol_handler(info['protocol'])
+    if not handler:
+        logger.debug("No handler for protocol: %s", info['protocol'])
+        return error_response(404, "Endpoint not found")
+
+    try:
+        if is_streamed(info):
+            return _stream_endpoint(info)
+        if pool is not None:
+            response = pool.request({'uri': info['uri'], 'method': method, 'path': info['path'],
+                                     'params': info.get('params', {})})
+        else:
+            response = handler.handle_request(info, method=method)
+        logger.debug("Handler response: %s", response)
+    except ValueError as e:
+        logger.debug("Method not allowed: %s", e)
+        return error_response(405, str(e))
+    except CommandRejected as e:
+        logger.warning("Rejected command for %s: %s", info['uri'], e)
+        return error_response(e.status, str(e), [('Retry-After', '1')])
+    except CommandError as e:
+        logger.error("Error handling request for %s: %s", info['uri'], e)
+        return error_response(e.status, str(e))
+    except Exception as e:
+        logger.error("Error handling request for %s: %s", info['uri'], e)
+        return error_response(500, str(e))
+
+    body = response.encode()
+    return EndpointResponse(200, _endpoint_headers(info), body, etag=compute_etag(body))
+
+def _endpoint_headers(info: Dict[str, Any]) -> List[Tuple[str, str]]:
+    return [
+        ('Content-type', 'application/json'),
+        # CORS headers
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Methods',
+         ', '.join(info.get('config', {}).get('methods', ['GET']))),
+    ]
+
+def request_path(target: str) -> str:
+    """
+    Strip the query string and fragment from a request target, leaving the
+    path endpoints are matched on
+
+    :param target: Request target, e.g. /sessions/42?verbose=1
+    :return: Path, e.g. /sessions/42
+    """
+    return target.partition('?')[0].partition('#')[0]
+
+def dispatch_request(router, port: Optional[int], method: str, path: str,
+                     headers=None) -> EndpointResponse:
+    """
+    Resolve and render the endpoint for a request
+
+    :param router: StreamFilterRouter holding the endpoints
+    :param port: Port the request arrived on
+    :param method: HTTP method; HEAD is answered like GET unless an endpoint
+                   accepts HEAD itself, and the server omits the body
+    :param path: Request target; its query string and fragment are ignored
+    :param headers: Request headers mapping, looked up with lower-case names
+    :return: EndpointResponse
+    """
+    path = request_path(path)
+    if router:
+        match = router.match_endpoint(port, path, method)
+        if match is None and method == 'HEAD':
+            method = 'GET'
+            match = router.match_endpoint(port, path, method)
+        if match is not None:
+            info, params = match
+            logger.debug("Found matching endpoint: %s", info['uri'])
+            prepared = router.get_prepared_response(info['uri'])
+            if prepared is not None:
+                response = select_encoding(prepared, headers)
+            else:
+                cache = router.get_command_cache(info['uri'])
+                pool = router.get_command_pool(info['uri'])
+                if params:
+                    # Handlers read path template parameters from the endpoint info;
+                    # the cache holds one result per endpoint, so it is bypassed
+                    info = dict(info, params=params)
+                    cache = None
+                if cache is not None:
+                    response = cache.get(lambda: render_endpoint(info, method, pool))
+                else:
+                    response = render_endpoint(info, method, pool)
+            if method == 'GET':
+                response = evaluate_conditional(response, headers)
+            return response
+        if router.get_path_methods(port, path):
+            logger.debug("Method %s not allowed for path: %s", method, path)
+            return error_response(405, "Method not allowed")
+
+    logger.debug("No endpoint found for path: %s", path)
+    return error_response(404, "Endpoint not found")
+
+def preflight_response(router, port: Optional[int], path: str) -> EndpointResponse:
+    """
+    Build the response to a CORS preflight (OPTIONS) request
+
+    :param router: StreamFilterRouter holding the endpoints
+    :param port: Port the request arrived on
+    :param path: Request target; its query string and fragment are ignored
+    :return: EndpointResponse
+    """
+    path = request_path(path)
+    if router:
+        methods = router.get_path_methods(port, path)
+        if methods:
+            return EndpointResponse(200, [
+                ('Access-Control-Allow-Origin', '*'),
+                ('Access-Control-Allow-Methods', ', '.join(methods)),
+                ('Access-Control-Allow-Headers', 'Content-Type'),
+            ])
+    return error_response(404, "Endpoint not found")
@@ -0,0 +1,77 @@
+"""
+Compact endpoint records for the StreamFilterRouter registry
+"""
+import sys
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Mapping keys, the same as those of the dicts endpoints replaced
+_KEYS = ('uri', 'protocol', 'hostname', 'port', 'path', 'config')
+_FIELDS = frozenset(_KEYS)
+# methods config -> upper-cased methods, shared by endpoints accepting the same ones
+_METHODS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+def endpoint_methods(config: Any) -> Tuple[str, ...]:
+    """
+    Get the upper-cased methods an endpoint config accepts, GET by default
+
+    :param config: Endpoint configuration
+    :return: Methods, as a tuple shared with other endpoints accepting the same ones
+    """
+    methods = config.get('methods') if isinstance(config, Mapping) else None
+    key = tuple(methods) if methods else ('GET',)
+    shared = _METHODS.get(key)
+    if shared is None:
+        shared = _METHODS.setdefault(key, tuple(sys.intern(method.upper()) for method in key))
+    return shared
+
+class Endpoint(Mapping):
+    """
+    A registered endpoint
+
+    Holds uri, protocol, hostname, port, path and config in slots instead of
+    a per-endpoint dict, with the protocol and hostname strings interned so
+    that endpoints on the same host share them. The config is a read-only
+    view of the registered configuration; ``methods`` holds the methods it
+    accepts, upper-cased, so lookups need not derive them from the config.
+
+    Endpoints are read-only mappings with the same keys as the dicts they
+    replace, so ``endpoint['path']``, ``endpoint.get('config', {})`` and
+    ``dict(endpoint)`` keep working; attribute access is the faster path.
+    """
+    __slots__ = ('uri', 'protocol', 'hostname', 'port', 'path', 'config', 'methods')
+
+    def __init__(self, uri: str, protocol: str, hostname: str, port: Optional[int],
+                 path: str, config: Dict[str, Any]):
+        self.uri = uri
+        self.protocol = sys.intern(protocol)
+        self.hostname = sys.intern(hostname)
+        self.port = port
+        self.path = path
+        self.config = config if isinstance(config, MappingProxyType) else MappingProxyType(config)
+        self.methods = endpoint_methods(config)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _FIELDS else default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_KEYS)
+
+    def __len__(self) -> int:
+        return len(_KEYS)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _FIELDS
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.uri!r})"
+
+    def __reduce__(self):
+        return (Endpoint, (self.uri, self.protocol, self.hostname, self.port, self.path,
+                           dict(self.config)))
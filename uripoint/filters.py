@@ -0,0 +1,312 @@
+"""
+Compiled filter pipelines for StreamFilterRouter
+"""
+import inspect
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+class _Drop:
+    """Type of DROP"""
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return 'DROP'
+
+# Returned by a filter to discard the message: later filters and the handler are skipped
+DROP = _Drop()
+
+# message: one message per run; batch: a list or array; stream: an iterable of chunks
+PIPELINE_MODES = ('message', 'batch', 'stream')
+
+def batch_filter(func: Callable) -> Callable:
+    """
+    Mark a filter as batch-capable
+
+    A batch filter is called with a whole batch (a list, or any sequence such
+    as an array) and returns the filtered batch, which may be shorter, or DROP
+    to discard all of it. In single-message processing it is called with a
+    batch of one.
+
+    :param func: Filter function taking and returning a batch
+    :return: The same function
+    """
+    func.batch = True
+    return func
+
+def is_batch_filter(func: Callable) -> bool:
+    """
+    Check whether a filter was marked with batch_filter
+    """
+    return getattr(func, 'batch', False) is True
+
+def per_item(func: Callable) -> Callable:
+    """
+    Adapt a per-message filter to batches
+
+    :param func: Filter function taking one message
+    :return: Batch filter applying func to every message and leaving out the
+             messages it drops
+    """
+    return batch_filter(lambda batch: [result for result in map(func, batch)
+                                       if result is not DROP])
+
+def stream_filter(func: Callable) -> Callable:
+    """
+    Mark a filter as a streaming stage
+
+    A stream filter is called once with an iterator of chunks (lines, rows,
+    segments) and returns an iterator, typically by being a generator
+    function, so it can consume and yield chunks lazily, merge or split them
+    and keep state across them. With process() and process_batch() it gets
+    an iterator over the single message or the batch.
+
+    :param func: Function taking and returning an iterator
+    :return: The same function
+    """
+    func.stream = True
+    return func
+
+def is_stream_filter(func: Callable) -> bool:
+    """
+    Check whether a filter was marked with stream_filter
+    """
+    return getattr(func, 'stream', False) is True
+
+def is_async_filter(func: Callable) -> bool:
+    """
+    Check whether a filter is a coroutine function, or an object whose
+    __call__ is one
+    """
+    return (inspect.iscoroutinefunction(func)
+            or inspect.iscoroutinefunction(getattr(func, '__call__', None)))
+
+def _single(func: Callable) -> Callable:
+    # Run a batch filter on one message
+    def run(data):
+        result = func([data])
+        if result is DROP or not len(result):
+            return DROP
+        return result[0]
+    return run
+
+def _asingle(func: Callable) -> Callable:
+    # Run a coroutine batch filter on one message
+    async def run(data):
+        result = await func([data])
+        if result is DROP or not len(result):
+            return DROP
+        return result[0]
+    return run
+
+def _first(func: Callable) -> Callable:
+    # Run a stream filter on one message
+    def run(data):
+        for result in func(iter((data,))):
+            return result
+        return DROP
+    return run
+
+class FilterPipeline:
+    """
+    A fixed chain of filters compiled into one function
+
+    The chain is turned into straight-line code calling each filter in turn
+    and stopping as soon as one returns DROP, so a message costs one call per
+    filter and no loop or lookup overhead.
+
+    A batch pipeline runs over a whole batch instead: batch filters get the
+    batch as it is, and each run of consecutive per-message filters is fused
+    into one pass over the batch. It stops once the batch is dropped or empty.
+
+    A stream pipeline takes an iterable of chunks and returns a lazy
+    iterator: stream filters are chained as generator stages and the other
+    filters are applied chunk by chunk, so only the chunks in flight are held
+    in memory.
+
+    Coroutine filters need ``arun``, which awaits them and runs each stretch
+    of plain filters between them as one compiled call.
+    """
+    def __init__(self, filters: Iterable[Tuple[str, Callable]], mode: str = 'message'):
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Invalid pipeline mode: {mode}")
+        self.filters: List[Tuple[str, Callable]] = list(filters)
+        self.mode = mode
+        funcs = [func for _, func in self.filters]
+        self.is_async = any(is_async_filter(func) for func in funcs)
+        self.arun = None
+        if mode == 'batch':
+            self.run = _compile_batch(funcs)
+        elif mode == 'stream':
+            self.run = _compile_stream(funcs)
+        else:
+            funcs = [_first(func) if is_stream_filter(func)
+                     else (_asingle(func) if is_async_filter(func) else _single(func))
+                     if is_batch_filter(func) else func for func in funcs]
+            self.run = _compile(funcs)
+            self.arun = _compile_async(funcs)
+        if self.is_async:
+            self.run = _needs_await
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self.filters]
+
+    def __call__(self, data: Any) -> Any:
+        """
+        Run data through the chain
+
+        :param data: Message to filter, a batch for batch pipelines or an
+                     iterable of chunks for stream pipelines
+        :return: Filtered message or batch, or DROP; an iterator for stream pipelines
+        """
+        return self.run(data)
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+def _compile(funcs: List[Callable], stop: str = 'data is DROP') -> Callable[[Any], Any]:
+    if not funcs:
+        return lambda data: data
+    if len(funcs) == 1:
+        return funcs[0]
+    # Only generated identifiers reach the source; the filters are bound as globals
+    lines = ['def run(data):']
+    for index in range(len(funcs)):
+        lines.append(f'    data = f{index}(data)')
+        if index < len(funcs) - 1:
+            lines.append(f'    if {stop}: return DROP')
+    lines.append('    return data')
+    namespace = {f'f{index}': func for index, func in enumerate(funcs)}
+    namespace['DROP'] = DROP
+    exec('\n'.join(lines), namespace)
+    return namespace['run']
+
+def _needs_await(data: Any) -> Any:
+    raise TypeError("Filter pipeline has coroutine filters; use the async path")
+
+def _compile_async(funcs: List[Callable]) -> Callable[[Any], Any]:
+    stages = []
+    plain = []
+    for func in funcs + [None]:
+        if func is not None and not is_async_filter(func):
+            plain.append(func)
+            continue
+        if plain:
+            stages.append((_compile(plain), False))
+            plain = []
+        if func is not None:
+            stages.append((func, True))
+
+    async def arun(data):
+        for stage, is_async in stages:
+            data = stage(data)
+            if is_async:
+                data = await data
+            if data is DROP:
+                return DROP
+        return data
+    return arun
+
+def _compile_batch(funcs: List[Callable]) -> Callable[[Any], Any]:
+    stages = []
+    items = []
+    for func in funcs + [None]:
+        if func is not None and not is_batch_filter(func) and not is_stream_filter(func):
+            items.append(func)
+            continue
+        if items:
+            stages.append(per_item(_compile(items)))
+            items = []
+        if func is not None:
+            stages.append(_collect(func) if is_stream_filter(func) else func)
+    return _compile(stages, stop='data is DROP or not len(data)')
+
+def _collect(func: Callable) -> Callable:
+    # Run a stream filter over a batch
+    return lambda batch: list(func(iter(batch)))
+
+def _compile_stream(funcs: List[Callable]) -> Callable[[Iterable], Iterator]:
+    stages = []
+    items = []
+    for func in funcs + [None]:
+        if func is not None and not is_stream_filter(func):
+            items.append(_single(func) if is_batch_filter(func) else func)
+            continue
+        if items:
+            stages.append(_each(_compile(items)))
+            items = []
+        if func is not None:
+            stages.append(func)
+
+    def run(chunks):
+        chunks = iter(chunks)
+        for stage in stages:
+            chunks = stage(chunks)
+        return chunks
+    return run
+
+def _each(func: Callable) -> Callable[[Iterator], Iterator]:
+    # Apply a per-message chain to each chunk, leaving out dropped chunks
+    return lambda chunks: (result for result in map(func, chunks) if result is not DROP)
+
+class FilterSet:
+    """
+    Ordering and route scope of registered filters
+
+    Filters run in ascending ``order``, ties in registration order. A filter
+    limited to ``routes`` only runs for messages matched by one of those route
+    patterns; other filters run for every route. Pipelines are compiled per
+    route pattern on first use and rebuilt after any change.
+    """
+    def __init__(self):
+        # name -> (order, route patterns or None)
+        self._options: Dict[str, Tuple[int, Optional[frozenset]]] = {}
+        # (route, mode) -> pipeline
+        self._pipelines: Dict[Tuple[Optional[str], str], FilterPipeline] = {}
+        self._size = 0
+
+    def add(self, name: str, order: int = 0, routes: Optional[Iterable[str]] = None) -> None:
+        """
+        Record the ordering and scope of a filter
+
+        :param name: Filter name
+        :param order: Position in the chain; lower runs first
+        :param routes: Route patterns the filter is limited to, None for all
+        """
+        self._options[name] = (order, frozenset(routes) if routes is not None else None)
+        self._pipelines = {}
+
+    def remove(self, name: str) -> None:
+        """
+        Forget a filter's ordering and scope
+
+        :param name: Filter name
+        """
+        self._options.pop(name, None)
+        self._pipelines = {}
+
+    def pipeline(self, filters: Dict[str, Callable], route: Optional[str] = None,
+                 mode: str = 'message') -> FilterPipeline:
+        """
+        Get the compiled pipeline for a route
+
+        :param filters: Filter functions by name, in registration order
+        :param route: Matched route pattern, None for the filters that apply to all routes
+        :param mode: 'message', 'batch' or 'stream', see FilterPipeline
+        :return: FilterPipeline
+        """
+        pipeline = self._pipelines.get((route, mode))
+        if pipeline is not None and len(filters) == self._size:
+            return pipeline
+        if len(filters) != self._size:
+            # The filters dict was changed without add()/remove()
+            self._pipelines = {}
+            self._size = len(filters)
+        selected = []
+        for position, (name, func) in enumerate(filters.items()):
+            order, routes = self._options.get(name, (0, None))
+            if routes is None or route in routes:
+                selected.append((order, position, name, func))
+        selected.sort(key=lambda entry: entry[:2])
+        pipeline = FilterPipeline(((name, func) for _, _, name, func in selected), mode)
+        self._pipelines[route, mode] = pipeline
+        return pipeline
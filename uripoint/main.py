@@ -6,6 +6,8 @@ import json
 import yaml
 import os
 from typing import Dict, Any, List
+from .access_log import configure_logging, shutdown_logging
+from .commands import configure_command_executor
 from .cli import UriPointCLI
 
 def load_config() -> Dict[str, Any]:
@@ -53,14 +55,34 @@ def main():
     
     # Add arguments
     parser.add_argument('--uri', help='Full URI for endpoint')
-    parser.add_argument('--hostname', help='Hostname for endpoint')
+    parser.add_argument('--hostname', help='Hostname for endpoint; filters --list/--test')
     parser.add_argument('--path', help='Path for endpoint')
-    parser.add_argument('--protocol', help='Protocol for endpoint')
-    parser.add_argument('--port', type=int, help='Port for endpoint')
+    parser.add_argument('--protocol', help='Protocol for endpoint; filters --list/--test')
+    parser.add_argument('--port', type=int, help='Port for endpoint; filters --list/--test')
     parser.add_argument('--data', help='Configuration data for endpoint')
     parser.add_argument('--method', nargs='+', help='HTTP methods to allow (GET, POST, etc.)')
     parser.add_argument('--list', action='store_true', help='List all endpoints')
     parser.add_argument('--serve', action='store_true', help='Serve all endpoints')
+    parser.add_argument('--engine', choices=['threading', 'asyncio'], default='threading',
+                        help='Serving engine for --serve (default: threading)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for --serve, sharing ports via SO_REUSEPORT')
+    parser.add_argument('--keepalive-timeout', type=float,
+                        help='Seconds an idle keep-alive connection stays open')
+    parser.add_argument('--max-requests', type=int,
+                        help='Requests served per connection before it is closed (0 for no limit)')
+    parser.add_argument('--max-commands', type=int, default=8,
+                        help='Command endpoint processes allowed to run at once')
+    parser.add_argument('--command-queue', type=int, default=64,
+                        help='Command requests allowed to wait for a free slot before a 503')
+    parser.add_argument('--command-timeout', type=float,
+                        help='Default seconds a command may run before it is killed')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Server log level for --serve; DEBUG shows per-request details')
+    parser.add_argument('--no-access-log', action='store_true', help='Disable the access log')
+    parser.add_argument('--access-log-sample', type=float, default=1.0,
+                        help='Fraction of successful requests written to the access log')
+    parser.add_argument('--log-json', action='store_true', help='Write logs as JSON lines')
     parser.add_argument('--test', action='store_true', help='Test endpoints')
     parser.add_argument('--detach', nargs='*', help='Detach endpoints (specify URIs or omit for all)')
     
@@ -77,12 +99,14 @@ def main():
         return
     
     # Restore endpoints from config
-    for uri, data in config.get('endpoints', {}).items():
-        cli.create_endpoint(uri, data)
+    errors = cli.create_endpoints(config.get('endpoints', {}).items())
+    for uri, error in errors.items():
+        print(f"Skipping {uri}: {error}")
     
     if args.list:
         # List all endpoints
-        endpoints = cli.list_endpoints()
+        endpoints = cli.list_endpoints(protocol=args.protocol, hostname=args.hostname,
+                                       port=args.port)
         print("\nConfigured Endpoints:")
         for endpoint in endpoints:
             print(f"\nProtocol: {endpoint['protocol']}")
@@ -92,8 +116,7 @@ def main():
             
             # Show allowed methods for HTTP/HTTPS endpoints
             if endpoint['protocol'] in ['http', 'https']:
-                uri = f"{endpoint['protocol']}://{endpoint['hostname']}:{endpoint['port']}{endpoint['path']}"
-                endpoint_config = cli.get_endpoint(uri)
+                endpoint_config = cli.get_endpoint(endpoint['uri'])
                 if endpoint_config:
                     methods = endpoint_config.get('config', {}).get('methods', ['GET'])
                     print(f"Methods: {', '.join(methods)}")
@@ -102,18 +125,32 @@ def main():
     if args.serve:
         # Serve all endpoints
         print("\nStarting servers...")
+        if args.keepalive_timeout is not None:
+            cli.keepalive_timeout = args.keepalive_timeout
+        if args.max_requests is not None:
+            cli.max_keepalive_requests = args.max_requests
+        configure_logging(level=args.log_level,
+                          access_log=not args.no_access_log,
+                          sample_rate=args.access_log_sample,
+                          json_format=args.log_json)
+        configure_command_executor(max_workers=args.max_commands,
+                                   max_queue=args.command_queue,
+                                   timeout=args.command_timeout)
         try:
-            cli.serve()
+            cli.serve(engine=args.engine, workers=args.workers)
         except KeyboardInterrupt:
             print("\nShutting down servers...")
+        finally:
+            shutdown_logging()
         return
 
     if args.test:
         # Test endpoints
-        endpoints = cli.list_endpoints()
+        endpoints = cli.list_endpoints(protocol=args.protocol, hostname=args.hostname,
+                                       port=args.port)
         print("\nTesting Endpoints:")
         for endpoint in endpoints:
-            uri = f"{endpoint['protocol']}://{endpoint['hostname']}:{endpoint['port']}{endpoint['path']}"
+            uri = endpoint['uri']
             try:
                 result = cli.get_endpoint(uri)
                 status = "OK" if result else "Failed"
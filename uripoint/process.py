@@ -112,6 +112,24 @@ class ProcessManager:
                 return True
             return False
             
+    def restart_process(self, name: str) -> bool:
+        """
+        Replace a managed process with a fresh one running the same target
+        
+        :param name: Process name
+        :return: Success status
+        """
+        with self._lock:
+            process = self.processes.get(name)
+            if not process:
+                return False
+            if process.is_alive():
+                process.terminate()
+            replacement = ManagedProcess(process.target, *process.args, **process.kwargs)
+            self.processes[name] = replacement
+            replacement.start()
+            return True
+            
     def get_process(self, name: str) -> Optional[ManagedProcess]:
         """
         Get a process by name
@@ -1,10 +1,10 @@
 """
 Protocol handlers for UriPoint
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Type, Union
 from abc import ABC, abstractmethod
 import json
-import subprocess
+from .commands import CommandError, get_command_executor
 
 class ProtocolHandler(ABC):
     @abstractmethod
@@ -25,16 +25,14 @@ class ProtocolHandler(ABC):
         # If there's a command, execute it and return its output
         if 'command' in config:
             try:
-                result = subprocess.run(
+                return get_command_executor().run(
                     config['command'],
-                    shell=True,
-                    capture_output=True,
-                    text=True
+                    timeout=config.get('timeout'),
+                    key=endpoint_info.get('uri'),
+                    max_concurrency=config.get('max_concurrency')
                 )
-                if result.returncode == 0:
-                    return result.stdout
-                else:
-                    raise RuntimeError(f"Command failed: {result.stderr}")
+            except CommandError:
+                raise
             except Exception as e:
                 raise RuntimeError(f"Failed to execute command: {str(e)}")
         
@@ -198,29 +196,46 @@ class DNSHandler(ProtocolHandler):
     def connect(self) -> bool:
         return True
 
+# URI scheme -> shared handler instance; handlers keep no per-request state
+_handlers: Dict[str, ProtocolHandler] = {}
+
+def register_protocol(protocol: str, handler: Union[ProtocolHandler, Type[ProtocolHandler]]) -> None:
+    """
+    Register the handler for a URI scheme, replacing any existing one
+
+    The handler is created once and shared by every endpoint and request of the
+    protocol, so it must not keep per-request state.
+
+    :param protocol: URI scheme, e.g. 'coap'; schemes are case-insensitive
+    :param handler: ProtocolHandler subclass or instance
+    """
+    if isinstance(handler, type):
+        handler = handler()
+    if not isinstance(handler, ProtocolHandler):
+        raise TypeError(f"Protocol handler must be a ProtocolHandler, got {type(handler).__name__}")
+    _handlers[protocol.lower()] = handler
+
 def get_protocol_handler(protocol: str) -> Optional[ProtocolHandler]:
     """
-    Factory function to get the appropriate protocol handler
+    Get the shared handler registered for a protocol; schemes are case-insensitive
     """
-    handlers = {
-        'http': HTTPHandler,
-        'https': HTTPHandler,
-        'rtsp': RTSPHandler,
-        'hls': HLSHandler,
-        'dash': DASHHandler,
-        'mqtt': MQTTHandler,
-        'ws': WebSocketHandler,
-        'wss': WebSocketHandler,
-        'redis': RedisHandler,
-        'smtp': SMTPHandler,
-        'amqp': AMQPHandler,
-        'dns': DNSHandler
-    }
-    
-    handler_class = handlers.get(protocol)
-    if handler_class:
-        return handler_class()
-    return None
+    return _handlers.get(protocol.lower())
+
+for _protocol, _handler_class in (
+    ('http', HTTPHandler),
+    ('https', HTTPHandler),
+    ('rtsp', RTSPHandler),
+    ('hls', HLSHandler),
+    ('dash', DASHHandler),
+    ('mqtt', MQTTHandler),
+    ('ws', WebSocketHandler),
+    ('wss', WebSocketHandler),
+    ('redis', RedisHandler),
+    ('smtp', SMTPHandler),
+    ('amqp', AMQPHandler),
+    ('dns', DNSHandler)
+):
+    register_protocol(_protocol, _handler_class)
 
 def validate_endpoint_config(protocol: str, config: Dict[str, Any]) -> bool:
     """
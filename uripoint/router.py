@@ -1,15 +1,59 @@
+import asyncio
+import inspect
 import re
-from typing import Dict, Any, Callable, Optional
-from .protocols import validate_endpoint_config, create_protocol_connection
+import threading
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from .protocols import create_protocol_connection, get_protocol_handler
+from .dispatch import prepare_response
+from .routing import LRUCache, PathTemplateTrie, RouteTable, template_params
+from .endpoint import Endpoint
+from .filters import DROP, FilterPipeline, FilterSet, is_async_filter, is_stream_filter
+from .commands import CommandResultCache, PersistentCommandPool, validate_command_config
+
+# Marks a match_route cache miss; None is a valid cached result
+_MISSING = object()
+# Characters for which _split_uri defers to urlparse()
+_URI_SPECIAL = re.compile(r'[?#;\[\]\\\s]')
 
 class StreamFilterRouter:
     """
     A flexible router for handling and filtering stream-based communications
     """
-    def __init__(self):
+    def __init__(self, route_cache_size: int = 0):
+        """
+        :param route_cache_size: Number of URI -> handler resolutions to keep in
+                                 an LRU cache for match_route, 0 to disable
+        """
         self.routes = {}
+        # RouteTable compiled from self.routes on the first match, extended by add_route
+        self._route_table = None
+        self._route_cache = LRUCache(route_cache_size) if route_cache_size else None
+        # Bumped whenever routes change, so in-flight misses do not cache stale handlers
+        self._route_generation = 0
         self.filters = {}
+        # Ordering and route scope of self.filters, with the compiled pipelines
+        self._filter_set = FilterSet()
+        # route pattern -> (handler, message pipeline), dropped whenever routes
+        # or filters change, so process() needs a single lookup per message
+        self._compiled_routes = {}
         self.endpoints = {}
+        # port -> path -> endpoint, or method -> endpoint for paths several
+        # endpoints share; kept in step with self.endpoints
+        self._route_index = {}
+        # port -> PathTemplateTrie of method -> endpoint for templated paths
+        self._template_index = {}
+        # uri -> response prepared on first use, None for endpoints that run a command
+        self._responses = {}
+        # uri -> result cache for command endpoints configured with cache_ttl
+        self._command_caches = {}
+        # uri -> warm process pool for exec_mode: persistent command endpoints
+        self._command_pools = {}
+        # protocol / hostname / port -> uri -> endpoint, kept in step with self.endpoints
+        self._by_protocol = {}
+        self._by_hostname = {}
+        self._by_port = {}
+        self._lock = threading.RLock()
 
     def add_route(self, pattern: str, handler: Callable):
         """
@@ -18,16 +62,48 @@ class StreamFilterRouter:
         :param pattern: Regex pattern to match
         :param handler: Function to handle matched routes
         """
-        self.routes[pattern] = handler
+        with self._lock:
+            added = pattern not in self.routes
+            self.routes[pattern] = handler
+            if added:
+                # Replacing a handler keeps the pattern's place in the table
+                if self._route_table is not None:
+                    self._route_table.add(pattern)
+                self._invalidate_route_cache()
+            self._compiled_routes = {}
 
-    def add_filter(self, name: str, filter_func: Callable):
+    def add_filter(self, name: str, filter_func: Callable, order: int = 0,
+                   routes: Optional[List[str]] = None):
         """
         Add a filter for stream processing
         
+        A filter returning DROP discards the message: later filters and the
+        route handler are skipped.
+        
         :param name: Name of the filter
         :param filter_func: Function to apply filtering
+        :param order: Position in the chain, lower runs first; equal orders
+                      run in registration order
+        :param routes: Route patterns the filter is limited to, None for all routes
+        """
+        with self._lock:
+            self.filters[name] = filter_func
+            self._filter_set.add(name, order, routes)
+            self._compiled_routes = {}
+
+    def remove_filter(self, name: str) -> bool:
         """
-        self.filters[name] = filter_func
+        Remove a filter
+        
+        :param name: Name of the filter
+        :return: True if the filter was removed, False if it did not exist
+        """
+        with self._lock:
+            if self.filters.pop(name, None) is None:
+                return False
+            self._filter_set.remove(name)
+            self._compiled_routes = {}
+            return True
 
     def add_endpoint(self, uri: str, config: Dict[str, Any]) -> bool:
         """
@@ -39,25 +115,425 @@ class StreamFilterRouter:
         """
         parts = get_url_parts(uri)
         protocol = parts['scheme']
+        entry = self._prepare_endpoint(uri, protocol, parts['netloc'], parts['path'], config,
+                                       get_protocol_handler(protocol))
+        with self._lock:
+            previous_pool = self._register_endpoint(*entry)
+        if previous_pool is not None:
+            previous_pool.close()
+        
+        return create_protocol_connection(protocol)
+
+    def add_endpoints(self, endpoints: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+        """
+        Add many endpoints, e.g. when restoring a saved configuration
         
-        if not validate_endpoint_config(protocol, config):
+        Every endpoint is validated and prepared first, resolving each
+        protocol's handler once; the valid ones are then registered under a
+        single lock acquisition and each protocol connects once. Invalid
+        endpoints are skipped and reported instead of aborting the batch.
+        
+        :param endpoints: (uri, config) pairs, e.g. config['endpoints'].items();
+                          a later pair for the same URI replaces an earlier one,
+                          which is not registered even if the later one is invalid
+        :return: URI -> error message for the endpoints that were not added
+        """
+        # Only the last pair for each URI counts, in the order of those pairs
+        latest = {}
+        for uri, config in endpoints:
+            latest.pop(uri, None)
+            latest[uri] = config
+        errors = {}
+        handlers = {}
+        entries = []
+        for uri, config in latest.items():
+            try:
+                protocol, netloc, path = _split_uri(uri)
+                handler = handlers.get(protocol, _MISSING)
+                if handler is _MISSING:
+                    handler = handlers[protocol] = get_protocol_handler(protocol)
+                entries.append(self._prepare_endpoint(uri, protocol, netloc, path,
+                                                      config, handler))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                # Protocol validators may fail on malformed configs in any of these ways
+                errors[uri] = str(e) or type(e).__name__
+        previous_pools = []
+        with self._lock:
+            for entry in entries:
+                uri = entry[0].uri
+                try:
+                    previous_pool = self._register_endpoint(*entry)
+                except ValueError as e:
+                    errors[uri] = str(e)
+                    continue
+                if previous_pool is not None:
+                    previous_pools.append(previous_pool)
+        for pool in previous_pools:
+            pool.close()
+        for handler in handlers.values():
+            if handler is not None:
+                handler.connect()
+        return errors
+
+    def _prepare_endpoint(self, uri: str, protocol: str, netloc: str, path: str,
+                          config: Dict[str, Any], handler) -> tuple:
+        """
+        Validate an endpoint and build everything registering it needs
+
+        :return: (endpoint, command cache, command pool)
+        :raises ValueError: If the configuration is invalid
+        """
+        if handler is None or not handler.validate_config(config):
             raise ValueError(f"Invalid configuration for protocol {protocol}")
+        validate_command_config(config)
+        # Reject malformed path templates before touching the indexes
+        template_params(path)
+        hostname, port = _split_netloc(netloc)
+        endpoint = Endpoint(uri, protocol, hostname, port, path, config)
+        return (endpoint, CommandResultCache.from_config(config),
+                PersistentCommandPool.from_config(config))
+
+    def _register_endpoint(self, endpoint: Endpoint, command_cache,
+                           command_pool) -> Optional[PersistentCommandPool]:
+        """
+        Store a prepared endpoint and index it; call with the lock held
+
+        :return: Command pool of the replaced endpoint, to be closed by the caller
+        :raises ValueError: If the path template conflicts with a registered one
+        """
+        endpoint_id = endpoint.uri
+        previous = self.endpoints.get(endpoint_id)
+        if previous is not None:
+            self._unindex_endpoint(previous)
+        try:
+            self._index_endpoint(endpoint)
+        except ValueError:
+            if previous is not None:
+                self._index_endpoint(previous)
+            raise
+        self.endpoints[endpoint_id] = endpoint
+        # Protocol, hostname and port derive from the URI, so this replaces previous in place
+        self._index_attributes(endpoint)
+        self._responses.pop(endpoint_id, None)
+        if command_cache is not None:
+            self._command_caches[endpoint_id] = command_cache
+        else:
+            self._command_caches.pop(endpoint_id, None)
+        previous_pool = self._command_pools.pop(endpoint_id, None)
+        if command_pool is not None:
+            self._command_pools[endpoint_id] = command_pool
+        return previous_pool
+
+    def delete_endpoint(self, uri: str) -> bool:
+        """
+        Remove an endpoint from the registry, every index and the response and
+        command caches
         
-        endpoint_id = uri
-        netloc_parts = parts['netloc'].split(':')
-        hostname = netloc_parts[0]
-        port = int(netloc_parts[1]) if len(netloc_parts) > 1 else None
+        Servers look endpoints up per request, so running servers answer 404
+        for it from the next request on.
         
-        self.endpoints[endpoint_id] = {
-            'uri': uri,
-            'protocol': protocol,
-            'hostname': hostname,
-            'port': port,
-            'path': parts['path'],
-            'config': config
-        }
+        :param uri: URI of the endpoint
+        :return: True if the endpoint existed
+        """
+        return bool(self.delete_endpoints([uri]))
+
+    def delete_endpoints(self, uris: Iterable[str]) -> List[str]:
+        """
+        Remove many endpoints under a single lock acquisition, see delete_endpoint
         
-        return create_protocol_connection(protocol)
+        :param uris: URIs of the endpoints
+        :return: URIs of the endpoints that existed and were removed
+        """
+        deleted = []
+        pools = []
+        with self._lock:
+            for uri in uris:
+                endpoint = self.endpoints.pop(uri, None)
+                if endpoint is None:
+                    continue
+                self._unindex_endpoint(endpoint)
+                self._unindex_attributes(endpoint)
+                self._responses.pop(uri, None)
+                self._command_caches.pop(uri, None)
+                pool = self._command_pools.pop(uri, None)
+                if pool is not None:
+                    pools.append(pool)
+                deleted.append(uri)
+        for pool in pools:
+            pool.close()
+        return deleted
+
+    def endpoints_by_protocol(self, protocol: str) -> List[Endpoint]:
+        """
+        Get the endpoints of a protocol, in registration order
+        
+        :param protocol: URI scheme such as 'http' or 'mqtt'
+        :return: List of endpoints
+        """
+        with self._lock:
+            return list(self._by_protocol.get(protocol, {}).values())
+
+    def endpoints_by_hostname(self, hostname: str) -> List[Endpoint]:
+        """
+        Get the endpoints of a host, in registration order
+        
+        :param hostname: Hostname of the endpoint URIs
+        :return: List of endpoints
+        """
+        with self._lock:
+            return list(self._by_hostname.get(hostname, {}).values())
+
+    def endpoints_by_port(self, port: Optional[int]) -> List[Endpoint]:
+        """
+        Get the endpoints on a port, in registration order
+        
+        :param port: Port of the endpoint URIs, None for URIs without a port
+        :return: List of endpoints
+        """
+        with self._lock:
+            return list(self._by_port.get(port, {}).values())
+
+    def endpoint_ports(self) -> List[Optional[int]]:
+        """
+        Get the ports that have endpoints
+        
+        :return: List of ports, None standing for URIs without a port
+        """
+        with self._lock:
+            return list(self._by_port)
+
+    def query_endpoints(self, protocol: Optional[str] = None, hostname: Optional[str] = None,
+                       port: Any = _MISSING) -> List[Endpoint]:
+        """
+        Get the endpoints matching all of the given attributes
+        
+        Starts from the smallest matching index, so the cost follows the
+        number of candidates rather than the registry size.
+        
+        :param protocol: URI scheme, any if None
+        :param hostname: Hostname, any if None
+        :param port: Port, None for URIs without a port; any if omitted
+        :return: List of endpoints in registration order
+        """
+        with self._lock:
+            candidates = []
+            if protocol is not None:
+                candidates.append(self._by_protocol.get(protocol, {}))
+            if hostname is not None:
+                candidates.append(self._by_hostname.get(hostname, {}))
+            if port is not _MISSING:
+                candidates.append(self._by_port.get(port, {}))
+            if not candidates:
+                return list(self.endpoints.values())
+            smallest = min(candidates, key=len)
+            return [endpoint for uri, endpoint in smallest.items()
+                    if all(uri in index for index in candidates)]
+
+    def _index_attributes(self, endpoint: Endpoint) -> None:
+        for index, key in ((self._by_protocol, endpoint.protocol),
+                           (self._by_hostname, endpoint.hostname),
+                           (self._by_port, endpoint.port)):
+            bucket = index.get(key)
+            if bucket is None:
+                bucket = index[key] = {}
+            bucket[endpoint.uri] = endpoint
+
+    def _unindex_attributes(self, endpoint: Endpoint) -> None:
+        for index, key in ((self._by_protocol, endpoint.protocol),
+                           (self._by_hostname, endpoint.hostname),
+                           (self._by_port, endpoint.port)):
+            bucket = index.get(key)
+            if bucket is not None and bucket.get(endpoint.uri) is endpoint:
+                del bucket[endpoint.uri]
+                if not bucket:
+                    del index[key]
+
+    def find_endpoint(self, port: Optional[int], path: str,
+                      method: str = 'GET') -> Optional[Dict[str, Any]]:
+        """
+        Look up the endpoint serving a method and path on a port
+        
+        :param port: Port the request arrived on
+        :param path: Request path
+        :param method: HTTP method
+        :return: Endpoint info or None
+        """
+        entry = self._route_index.get(port, {}).get(path)
+        if entry:
+            return _select_endpoint(entry, method.upper())
+        match = self.match_endpoint(port, path, method)
+        return match[0] if match else None
+
+    def match_endpoint(self, port: Optional[int], path: str,
+                       method: Optional[str] = 'GET') -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        Look up the endpoint for a path, including path templates such as
+        ``/sessions/{user_id}``, together with the parameters it captures
+        
+        Exact paths take precedence over templates.
+        
+        :param port: Port the request arrived on
+        :param path: Request path
+        :param method: HTTP method, or None for an endpoint of any method
+        :return: (endpoint info, parameters by name) or None
+        """
+        match = self._lookup_path(port, path)
+        if match is None:
+            return None
+        entry, params = match
+        endpoint = _select_endpoint(entry, method.upper() if method is not None else None)
+        return (endpoint, params) if endpoint is not None else None
+
+    def _lookup_path(self, port: Optional[int], path: str):
+        """
+        Get the route index entry for a path, exact paths before templates
+
+        :return: (endpoint or method -> endpoint dict, parameters by name) or None
+        """
+        entry = self._route_index.get(port, {}).get(path)
+        if entry:
+            return entry, {}
+        templates = self._template_index.get(port)
+        return templates.match(path) if templates is not None else None
+
+    def get_prepared_response(self, uri: str):
+        """
+        Get the response of a static endpoint, prepared on its first request
+        and reused until the endpoint is registered again
+        
+        Preparing on first use keeps registration cheap and leaves endpoints
+        that are never requested without a serialized response in memory.
+        Update endpoint configs through add_endpoint rather than in place.
+        
+        :param uri: URI of the endpoint
+        :return: EndpointResponse or None for command endpoints
+        """
+        response = self._responses.get(uri, _MISSING)
+        if response is _MISSING:
+            endpoint = self.endpoints.get(uri)
+            if endpoint is None:
+                return None
+            response = prepare_response(endpoint)
+            with self._lock:
+                # Unless the endpoint was replaced or deleted meanwhile
+                if self.endpoints.get(uri) is endpoint:
+                    self._responses[uri] = response
+        return response
+
+    def resolve_endpoint(self, uri: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        Resolve a concrete URI such as ``redis://redis:6379/sessions/42`` to the
+        endpoint registered for it, matching path templates; the protocol and
+        hostname must match the endpoint's
+        
+        :param uri: URI to resolve
+        :return: (endpoint info, parameters by name) or None
+        """
+        endpoint = self.endpoints.get(uri)
+        if endpoint is not None:
+            return endpoint, {}
+        parts = get_url_parts(uri)
+        hostname, port = _split_netloc(parts['netloc'])
+        match = self._lookup_path(port, parts['path'])
+        if match is None:
+            return None
+        entry, params = match
+        # Endpoints of other protocols and hosts can share the port and path
+        for endpoint in (entry,) if isinstance(entry, Endpoint) else entry.values():
+            if endpoint.protocol == parts['scheme'] and endpoint.hostname == hostname:
+                return endpoint, params
+        return None
+
+    def get_command_cache(self, uri: str) -> Optional[CommandResultCache]:
+        """
+        Get the result cache of a command endpoint configured with cache_ttl
+        
+        :param uri: URI of the endpoint
+        :return: CommandResultCache or None if results are not cached
+        """
+        return self._command_caches.get(uri)
+
+    def get_command_pool(self, uri: str) -> Optional[PersistentCommandPool]:
+        """
+        Get the warm process pool of a persistent command endpoint
+        
+        :param uri: URI of the endpoint
+        :return: PersistentCommandPool or None for spawn-mode endpoints
+        """
+        return self._command_pools.get(uri)
+
+    def close_command_pools(self) -> None:
+        """
+        Stop the processes of every persistent command endpoint
+        
+        Each pool starts again on its next request.
+        """
+        with self._lock:
+            pools = list(self._command_pools.values())
+        for pool in pools:
+            pool.close()
+
+    def get_path_methods(self, port: Optional[int], path: str) -> List[str]:
+        """
+        Get the methods registered for a path on a port
+        
+        :param port: Port to look up
+        :param path: Request path
+        :return: List of allowed methods, empty if the path is unknown
+        """
+        entry = self._route_index.get(port, {}).get(path)
+        if isinstance(entry, Endpoint):
+            return list(entry.methods)
+        if not entry:
+            templates = self._template_index.get(port)
+            match = templates.match(path) if templates is not None else None
+            entry = match[0] if match else ()
+        return list(entry)
+
+    def _index_endpoint(self, endpoint: Endpoint) -> None:
+        if template_params(endpoint.path):
+            templates = self._template_index.get(endpoint.port)
+            if templates is None:
+                templates = self._template_index[endpoint.port] = PathTemplateTrie()
+            methods = templates.setdefault(endpoint.path, {})
+        else:
+            paths = self._route_index.setdefault(endpoint.port, {})
+            methods = paths.get(endpoint.path)
+            if methods is None:
+                # Most paths have a single endpoint, stored without a methods dict
+                paths[endpoint.path] = endpoint
+                return
+            if isinstance(methods, Endpoint):
+                methods = paths[endpoint.path] = dict.fromkeys(methods.methods, methods)
+        for method in endpoint.methods:
+            methods[method] = endpoint
+
+    def _unindex_endpoint(self, endpoint: Endpoint) -> None:
+        if template_params(endpoint.path):
+            templates = self._template_index.get(endpoint.port)
+            methods = templates.get(endpoint.path) if templates is not None else None
+            if not methods:
+                return
+            for method in endpoint.methods:
+                if methods.get(method) is endpoint:
+                    del methods[method]
+            if not methods:
+                templates.remove(endpoint.path)
+            return
+        paths = self._route_index.get(endpoint.port)
+        if not paths:
+            return
+        methods = paths.get(endpoint.path)
+        if methods is endpoint:
+            del paths[endpoint.path]
+        elif isinstance(methods, dict):
+            for method in endpoint.methods:
+                if methods.get(method) is endpoint:
+                    del methods[method]
+            if not methods:
+                del paths[endpoint.path]
+        if not paths:
+            del self._route_index[endpoint.port]
 
     def match_route(self, uri: str) -> Optional[Callable]:
         """
@@ -66,22 +542,80 @@ class StreamFilterRouter:
         :param uri: URI to match
         :return: Matched handler or None
         """
-        for pattern, handler in self.routes.items():
-            if re.match(pattern, uri):
-                return handler
-        return None
+        pattern = self._match_pattern(uri)
+        return self.routes.get(pattern) if pattern is not None else None
 
-    def apply_filters(self, data: Any) -> Any:
+    def route_cache_info(self) -> Optional[Dict[str, int]]:
+        """
+        Get statistics of the match_route cache
+        
+        :return: hits, misses, size and maxsize, or None if the cache is disabled
+        """
+        return self._route_cache.info() if self._route_cache is not None else None
+
+    def _match_pattern(self, uri: str) -> Optional[str]:
+        cache = self._route_cache
+        if cache is None:
+            return self._resolve_route(uri)
+        pattern = cache.get(uri, _MISSING)
+        if pattern is not _MISSING:
+            return pattern
+        generation = self._route_generation
+        pattern = self._resolve_route(uri)
+        with self._lock:
+            if generation == self._route_generation:
+                cache.put(uri, pattern)
+        return pattern
+
+    def _resolve_route(self, uri: str) -> Optional[str]:
+        table = self._route_table
+        if table is None or len(table.patterns) != len(self.routes):
+            table = self._compile_routes()
+        order = table.match(uri)
+        if order is None:
+            return None
+        return table.patterns[order]
+
+    def _compile_routes(self) -> RouteTable:
+        with self._lock:
+            table = self._route_table
+            if table is None or len(table.patterns) != len(self.routes):
+                changed = table is not None
+                table = self._route_table = RouteTable(self.routes)
+                if changed:
+                    # self.routes was changed without add_route()
+                    self._invalidate_route_cache()
+            return table
+
+    def _invalidate_route_cache(self) -> None:
+        self._route_generation += 1
+        if self._route_cache is not None:
+            self._route_cache.clear()
+
+    def get_filter_pipeline(self, route: Optional[str] = None,
+                            mode: str = 'message') -> FilterPipeline:
+        """
+        Get the compiled filter chain for a route
+        
+        The pipeline is a snapshot: filters added or removed later are not
+        reflected in it, but are in the next call.
+        
+        :param route: Matched route pattern, None for the filters that apply to all routes
+        :param mode: 'message', 'batch' or 'stream', see FilterPipeline
+        :return: FilterPipeline returning the filtered data or DROP
+        """
+        return self._filter_set.pipeline(self.filters, route, mode)
+
+    def apply_filters(self, data: Any, route: Optional[str] = None) -> Any:
         """
         Apply registered filters to input data
         
         :param data: Input data to filter
-        :return: Filtered data
+        :param route: Matched route pattern, to include the filters limited to it
+        :return: Filtered data, or DROP if a filter discarded it
         """
-        result = data
-        for filter_name, filter_func in self.filters.items():
-            result = filter_func(result)
-        return result
+        compiled = self._compiled_routes.get(route) or self._compile_route(route)
+        return compiled[1].run(data)
 
     def process(self, uri: str, data: Any) -> Any:
         """
@@ -91,12 +625,142 @@ class StreamFilterRouter:
         :param data: Data to process
         :return: Processed result
         """
-        handler = self.match_route(uri)
+        pattern = self._match_pattern(uri)
+        if pattern is None:
+            return None
+        handler, pipeline = self._compiled_routes.get(pattern) or self._compile_route(pattern)
         if handler:
-            filtered_data = self.apply_filters(data)
+            filtered_data = pipeline.run(data)
+            if filtered_data is DROP:
+                return None
             return handler(filtered_data)
         return None
 
+    def _compile_route(self, pattern: Optional[str]) -> Tuple[Optional[Callable], FilterPipeline]:
+        """
+        Get the handler and message pipeline of a route pattern, kept until
+        routes or filters change
+        """
+        with self._lock:
+            compiled = (self.routes.get(pattern) if pattern is not None else None,
+                        self._filter_set.pipeline(self.filters, pattern))
+            self._compiled_routes[pattern] = compiled
+            return compiled
+
+    def process_batch(self, uri: str, batch: Any) -> Any:
+        """
+        Process a batch of messages for one URI
+        
+        The route is matched once and the filters run over the whole batch:
+        batch filters (see uripoint.filters.batch_filter) get the batch as it
+        is, per-message filters are applied to each message. The handler is
+        called once with the batch of messages no filter dropped.
+        
+        :param uri: URI to process
+        :param batch: List of messages, or any sequence a batch filter accepts
+        :return: Handler result, or None if no route matches or every message was dropped
+        """
+        pattern = self._match_pattern(uri)
+        if pattern is None:
+            return None
+        handler = self.routes.get(pattern)
+        if handler:
+            filtered = self._filter_set.pipeline(self.filters, pattern, 'batch').run(batch)
+            if filtered is DROP or not len(filtered):
+                return None
+            return handler(filtered)
+        return None
+
+    def process_many(self, uri: str, items: Iterable[Any]) -> Any:
+        """
+        Process messages for one URI as a single batch
+        
+        :param uri: URI to process
+        :param items: Messages to process
+        :return: Handler result for the batch, see process_batch
+        """
+        return self.process_batch(uri, items if isinstance(items, list) else list(items))
+
+    def process_stream(self, uri: str, chunks: Iterable[Any]) -> Optional[Iterator[Any]]:
+        """
+        Process a large payload for one URI as a lazy stream of chunks
+        
+        Stream filters (see uripoint.filters.stream_filter) are chained as
+        generator stages, other filters are applied chunk by chunk. A handler
+        marked with stream_filter gets the filtered iterator and its output is
+        returned; any other handler is called once per chunk. Nothing runs
+        until the returned iterator is consumed, and only the chunks in flight
+        are held in memory, however large the input is.
+        
+        :param uri: URI to process
+        :param chunks: Iterable of chunks such as lines, rows or segments
+        :return: Iterator of handler results, or None if no route matches
+        """
+        pattern = self._match_pattern(uri)
+        if pattern is None:
+            return None
+        handler = self.routes.get(pattern)
+        if not handler:
+            return None
+        filtered = self._filter_set.pipeline(self.filters, pattern, 'stream').run(chunks)
+        if is_stream_filter(handler):
+            return iter(handler(filtered))
+        return map(handler, filtered)
+
+    async def aprocess(self, uri: str, data: Any, executor=None) -> Any:
+        """
+        Process a URI with matching route and filters without blocking the event loop
+        
+        Coroutine filters and handlers are awaited. A plain handler runs in
+        executor, so I/O-bound handlers do not stall other messages; plain
+        filters are cheap transformations and run inline.
+        
+        :param uri: URI to process
+        :param data: Data to process
+        :param executor: concurrent.futures executor for plain handlers, the
+                         event loop's default if None
+        :return: Processed result
+        """
+        pattern = self._match_pattern(uri)
+        if pattern is None:
+            return None
+        handler, pipeline = self._compiled_routes.get(pattern) or self._compile_route(pattern)
+        if not handler:
+            return None
+        filtered_data = await pipeline.arun(data)
+        if filtered_data is DROP:
+            return None
+        if is_async_filter(handler):
+            return await handler(filtered_data)
+        result = await asyncio.get_running_loop().run_in_executor(executor, handler, filtered_data)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def aprocess_all(self, messages: Iterable[Tuple[str, Any]],
+                           concurrency: Optional[int] = None, executor=None) -> List[Any]:
+        """
+        Process many messages concurrently with aprocess
+        
+        :param messages: (uri, data) pairs
+        :param concurrency: Most messages in flight at once, unbounded if None
+        :param executor: Executor for plain handlers, see aprocess
+        :return: Results in the order of messages; a failed message's
+                 exception is returned in its place
+        """
+        if concurrency is not None and concurrency < 1:
+            raise ValueError(f"Invalid concurrency: {concurrency}")
+        if concurrency is None:
+            return await asyncio.gather(*(self.aprocess(uri, data, executor)
+                                          for uri, data in messages), return_exceptions=True)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(uri, data):
+            async with semaphore:
+                return await self.aprocess(uri, data, executor)
+        return await asyncio.gather(*(bounded(uri, data) for uri, data in messages),
+                                    return_exceptions=True)
+
     def get_endpoints(self) -> Dict[str, Dict[str, Any]]:
         """
         Get all registered endpoints
@@ -105,6 +769,39 @@ class StreamFilterRouter:
         """
         return self.endpoints
 
+def _split_uri(uri: str) -> Tuple[str, str, str]:
+    """
+    Split a URI into scheme, netloc and path as urlparse() would, without its
+    overhead for the plain scheme://host:port/path URIs endpoints use
+    """
+    scheme, separator, rest = uri.partition('://')
+    if (separator and scheme.isalpha() and scheme.isascii() and scheme.islower()
+            and not _URI_SPECIAL.search(rest)):
+        netloc, slash, path = rest.partition('/')
+        return scheme, netloc, slash + path
+    parsed = urlparse(uri)
+    return parsed.scheme, parsed.netloc, parsed.path
+
+def _split_netloc(netloc: str) -> Tuple[str, Optional[int]]:
+    """
+    Split a URI netloc into hostname and port, None if no port is given
+    """
+    netloc_parts = netloc.split(':')
+    hostname = netloc_parts[0]
+    port = int(netloc_parts[1]) if len(netloc_parts) > 1 else None
+    return hostname, port
+
+def _select_endpoint(entry, method: Optional[str]) -> Optional[Endpoint]:
+    """
+    Pick the endpoint for a method from a route index entry, which is either
+    an endpoint or a method -> endpoint dict; any endpoint if method is None
+    """
+    if isinstance(entry, Endpoint):
+        return entry if method is None or method in entry.methods else None
+    if method is None:
+        return next(iter(entry.values()), None)
+    return entry.get(method)
+
 def get_url_parts(url: str) -> Dict[str, str]:
     """
     Extract parts of a URL
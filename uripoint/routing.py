@@ -0,0 +1,446 @@
+"""
+Compiled route tables for StreamFilterRouter
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+
+_REGEX_META = frozenset('.^$*+?{}[]\\|()')
+_QUANTIFIERS = frozenset('*+?{')
+# Unescaped '|' anywhere in a pattern
+_ALTERNATION = re.compile(r'(?<!\\)(?:\\\\)*\|')
+# Backreferences and global flags change meaning once patterns are combined
+_NOT_COMBINABLE = re.compile(r'\\\d|\(\?P=|\(\?[aiLmsux]+\)')
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry, counting hits and misses
+    """
+    def __init__(self, maxsize: int):
+        if maxsize < 1:
+            raise ValueError(f"Invalid cache size: {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get a cached value and mark it as most recently used
+
+        :param key: Cache key
+        :param default: Returned on a miss
+        :return: Cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """
+        Cache a value, evicting the least recently used entry when full
+
+        :param key: Cache key
+        :param value: Value to cache
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all entries, keeping the counters
+        """
+        with self._lock:
+            self._data.clear()
+
+    def info(self) -> Dict[str, int]:
+        """
+        Get cache statistics
+
+        :return: hits, misses, current size and maxsize
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._data), 'maxsize': self.maxsize}
+
+def literal_prefix(pattern: str) -> Tuple[str, bool]:
+    """
+    Split off the text every match of a route pattern must start with
+
+    re.match() of a pattern without regex syntax is a plain prefix test, so
+    such patterns need no regex at all; other patterns can only match URIs
+    starting with their literal prefix.
+
+    :param pattern: Route pattern
+    :return: (literal prefix, True if the whole pattern is literal)
+    """
+    if pattern.startswith('^'):
+        # re.match() is anchored at the start already
+        pattern = pattern[1:]
+    if _ALTERNATION.search(pattern):
+        # Any alternative may match, so no prefix is certain
+        return '', False
+    chars = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or (escaped.isascii() and escaped.isalnum()):
+                break
+            step = 2
+        elif char in _REGEX_META:
+            break
+        else:
+            escaped = char
+            step = 1
+        if pattern[i + step:i + step + 1] in _QUANTIFIERS:
+            # The character may repeat or be absent
+            return ''.join(chars), False
+        chars.append(escaped)
+        i += step
+    return ''.join(chars), i == len(pattern)
+
+class _RadixNode:
+    __slots__ = ('edges', 'value')
+
+    def __init__(self):
+        # first character -> (edge label, child)
+        self.edges = {}
+        self.value = None
+
+class RadixTree:
+    """
+    Radix tree of string keys answering "which keys are prefixes of this text"
+    """
+    def __init__(self):
+        self._root = _RadixNode()
+
+    def insert(self, key: str, value) -> None:
+        """
+        Add a key, keeping the existing value if the key is already present
+
+        :param key: String key
+        :param value: Value returned by prefixes() for the key
+        """
+        node = self._root
+        i = 0
+        while i < len(key):
+            edge = node.edges.get(key[i])
+            if edge is None:
+                child = _RadixNode()
+                node.edges[key[i]] = (key[i:], child)
+                node = child
+                i = len(key)
+                break
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                # Split the edge where the new key diverges
+                middle = _RadixNode()
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[i]] = (label[:common], middle)
+                child = middle
+            node = child
+            i += common
+        if node.value is None:
+            node.value = value
+
+    def prefixes(self, text: str) -> Iterator:
+        """
+        Yield the values of all keys that are prefixes of text, shortest first
+
+        :param text: String to look up
+        """
+        node = self._root
+        i = 0
+        while True:
+            if node.value is not None:
+                yield node.value
+            if i >= len(text):
+                return
+            edge = node.edges.get(text[i])
+            if edge is None:
+                return
+            label, node = edge
+            if not text.startswith(label, i):
+                return
+            i += len(label)
+
+class RouteTable:
+    """
+    Route patterns compiled for matching in insertion order
+
+    Every pattern with a literal prefix is filed under it in a radix tree, so a
+    lookup only considers patterns whose prefix the URI starts with; fully
+    literal patterns need no regex at all. Patterns without a literal prefix
+    are tried together as one alternation regex. Those that cannot share an
+    alternation (backreferences, global flags, clashing group names) are
+    matched one by one.
+
+    Patterns added later with add() are filed the same way; only the
+    alternation regex is rebuilt, and only when the new pattern belongs in it.
+    """
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.patterns: List[str] = []
+        # prefix -> [(order, compiled regex or None for literal patterns)]
+        self._prefixed = RadixTree()
+        self._buckets: Dict[str, List[Tuple[int, Optional[re.Pattern]]]] = {}
+        # Patterns for the alternation regex
+        self._combinable: List[Tuple[int, re.Pattern]] = []
+        # (alternation regex, capturing group index -> pattern order), swapped as one
+        self._combined = None
+        self._sequential: List[Tuple[int, re.Pattern]] = []
+        # self._combinable while they cannot be combined, else empty
+        self._fallback: List[Tuple[int, re.Pattern]] = []
+
+        for pattern in patterns:
+            self._file(pattern)
+        self._combine()
+
+    def add(self, pattern: str) -> int:
+        """
+        Add a pattern after all existing ones
+
+        :param pattern: Regex pattern
+        :return: Index of the pattern in patterns
+        """
+        combinable = len(self._combinable)
+        order = self._file(pattern)
+        if len(self._combinable) != combinable:
+            self._combine()
+        return order
+
+    def _file(self, pattern: str) -> int:
+        order = len(self.patterns)
+        prefix, literal = literal_prefix(pattern)
+        compiled = None if literal else re.compile(pattern)
+        self.patterns.append(pattern)
+        if literal or prefix:
+            bucket = self._buckets.get(prefix)
+            if bucket is None:
+                bucket = self._buckets[prefix] = []
+                self._prefixed.insert(prefix, bucket)
+            bucket.append((order, compiled))
+        elif _NOT_COMBINABLE.search(pattern):
+            self._sequential.append((order, compiled))
+        else:
+            self._combinable.append((order, compiled))
+        return order
+
+    def _combine(self) -> None:
+        regexes = self._combinable
+        if len(regexes) < 2:
+            self._fallback = regexes
+            return
+        group_order = {}
+        group = 1
+        for order, compiled in regexes:
+            group_order[group] = order
+            group += compiled.groups + 1
+        try:
+            combined = re.compile('|'.join(f'({compiled.pattern})' for _, compiled in regexes))
+        except re.error:
+            self._combined = None
+            self._fallback = regexes
+            return
+        self._combined = (combined, group_order)
+        self._fallback = []
+
+    def match(self, uri: str) -> Optional[int]:
+        """
+        Find the first pattern, in insertion order, that re.match() would accept
+
+        :param uri: URI to match
+        :return: Index into patterns, or None
+        """
+        best = None
+        for bucket in self._prefixed.prefixes(uri):
+            for order, compiled in bucket:
+                if best is not None and order >= best:
+                    break
+                if compiled is None or compiled.match(uri):
+                    best = order
+                    break
+        combined = self._combined
+        if combined is not None:
+            match = combined[0].match(uri)
+            if match is not None:
+                order = combined[1][match.lastindex]
+                if best is None or order < best:
+                    best = order
+        for regexes in (self._sequential, self._fallback):
+            for order, compiled in regexes:
+                if best is not None and order > best:
+                    break
+                if compiled.match(uri):
+                    best = order
+                    break
+        return best
+
+def template_params(path: str) -> Optional[List[Optional[str]]]:
+    """
+    Parse a path template such as ``/sessions/{user_id}``
+
+    :param path: Endpoint path
+    :return: Per segment the parameter name or None for literal segments, or
+             None if the path has no parameters
+    :raises ValueError: If a parameter name is invalid or repeated
+    """
+    if '{' not in path:
+        return None
+    names = []
+    for segment in path.split('/'):
+        if segment.startswith('{') and segment.endswith('}'):
+            name = segment[1:-1]
+            if not name.isidentifier():
+                raise ValueError(f"Invalid path parameter: {segment}")
+            if name in names:
+                raise ValueError(f"Repeated path parameter: {segment}")
+            names.append(name)
+        else:
+            names.append(None)
+    return names if any(names) else None
+
+def _template_segments(template: str) -> List[Tuple[str, Optional[str]]]:
+    segments = template.split('/')
+    names = template_params(template) or [None] * len(segments)
+    return list(zip(segments, names))
+
+class _SegmentNode:
+    __slots__ = ('children', 'param', 'names', 'value')
+
+    def __init__(self):
+        # literal segment -> child
+        self.children = {}
+        # child matched by any non-empty segment
+        self.param = None
+        # parameter names of the template ending here
+        self.names = None
+        self.value = None
+
+class PathTemplateTrie:
+    """
+    Segment trie of path templates such as ``/sessions/{user_id}``
+
+    Matching walks one node per path segment and collects parameter values on
+    the way, with no regex. Literal segments win over parameters, so
+    ``/users/me`` is preferred to ``/users/{id}`` for the path ``/users/me``.
+    """
+    def __init__(self):
+        self._root = _SegmentNode()
+
+    def setdefault(self, template: str, default):
+        """
+        Get the value stored for a template, storing default if there is none
+
+        :param template: Path template
+        :param default: Value to store for a new template
+        :return: Stored value
+        :raises ValueError: If another template with the same shape but
+                            different parameter names is stored
+        """
+        segments = _template_segments(template)
+        node = self._root
+        for segment, name in segments:
+            if name is None:
+                node = node.children.setdefault(segment, _SegmentNode())
+            else:
+                if node.param is None:
+                    node.param = _SegmentNode()
+                node = node.param
+        params = tuple(name for _, name in segments if name)
+        if node.value is None:
+            node.names = params
+            node.value = default
+        elif node.names != params:
+            raise ValueError(f"Path template {template} conflicts with parameters {node.names}")
+        return node.value
+
+    def get(self, template: str):
+        """
+        Get the value stored for a template
+
+        :param template: Path template
+        :return: Stored value or None
+        """
+        node = self._find(template)
+        return node.value if node is not None else None
+
+    def remove(self, template: str) -> None:
+        """
+        Remove a template and prune nodes left without templates
+
+        :param template: Path template
+        """
+        trail = []
+        node = self._root
+        for segment, name in _template_segments(template):
+            child = node.children.get(segment) if name is None else node.param
+            if child is None:
+                return
+            trail.append((node, segment if name is None else None))
+            node = child
+        node.value = None
+        node.names = None
+        while trail and node.value is None and not node.children and node.param is None:
+            parent, segment = trail.pop()
+            if segment is None:
+                parent.param = None
+            else:
+                del parent.children[segment]
+            node = parent
+
+    def match(self, path: str) -> Optional[Tuple[Any, Dict[str, str]]]:
+        """
+        Find the template matching a path
+
+        :param path: Request path
+        :return: (stored value, parameters by name) or None
+        """
+        values = []
+        node = self._match(self._root, path.split('/'), 0, values)
+        if node is None:
+            return None
+        return node.value, {name: unquote(value) for name, value in zip(node.names, values)}
+
+    def _find(self, template: str) -> Optional[_SegmentNode]:
+        node = self._root
+        for segment, name in _template_segments(template):
+            node = node.children.get(segment) if name is None else node.param
+            if node is None:
+                return None
+        return node
+
+    def _match(self, node: _SegmentNode, segments: List[str], index: int,
+               values: List[str]) -> Optional[_SegmentNode]:
+        if index == len(segments):
+            return node if node.value is not None else None
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, values)
+            if found is not None:
+                return found
+        if node.param is not None and segment:
+            values.append(segment)
+            found = self._match(node.param, segments, index + 1, values)
+            if found is not None:
+                return found
+            values.pop()
+        return None
@@ -0,0 +1,245 @@
+"""
+Vectorized filters for numeric telemetry, built from an endpoint ``schema``
+
+Requires numpy (``pip install uripoint[numpy]``).
+"""
+import math
+import threading
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Schema types held as float64 columns; int and boolean are restored on output
+NUMERIC_TYPES = {
+    'float': float, 'double': float, 'number': float,
+    'int': int, 'integer': int,
+    'bool': bool, 'boolean': bool,
+}
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("Vectorized filters require numpy: pip install uripoint[numpy]")
+
+def numeric_fields(schema: Dict[str, str]) -> Dict[str, type]:
+    """
+    Select the numeric fields of an endpoint schema
+
+    :param schema: Field name -> type name, as in the endpoint config
+    :return: Field name -> Python type of the numeric fields
+    """
+    return {field: NUMERIC_TYPES[str(kind).lower()] for field, kind in schema.items()
+            if str(kind).lower() in NUMERIC_TYPES}
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _column(records: List[Dict[str, Any]], field: str) -> 'np.ndarray':
+    values = [record.get(field) for record in records]
+    try:
+        # None becomes NaN
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(value) for value in values), np.float64, len(values))
+
+class ColumnBatch:
+    """
+    A batch of readings held as one float64 array per numeric schema field
+
+    Iterating yields the readings as dicts again, with all fields of the
+    original messages and the (possibly filtered) numeric values, so
+    per-message filters and handlers can consume a ColumnBatch like a list.
+    """
+    def __init__(self, columns: Dict[str, 'np.ndarray'], types: Dict[str, type],
+                 source: 'np.ndarray'):
+        self.columns = columns
+        self.types = types
+        # Original messages, as an object array aligned with the columns
+        self.source = source
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]],
+                     schema: Dict[str, str]) -> 'ColumnBatch':
+        """
+        Build a batch from reading dicts
+
+        :param records: Readings
+        :param schema: Endpoint schema; its numeric fields become columns
+        :return: ColumnBatch
+        """
+        _require_numpy()
+        records = records if isinstance(records, list) else list(records)
+        types = numeric_fields(schema)
+        source = np.empty(len(records), dtype=object)
+        source[:] = records
+        return cls({field: _column(records, field) for field in types}, types, source)
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    def __getitem__(self, key: Union[str, int]) -> Any:
+        """
+        Get a field as an array, float64 for numeric fields and object
+        otherwise, or the reading dict at an integer index
+        """
+        if isinstance(key, int):
+            return self.select(np.array([key])).records()[0]
+        field = key
+        column = self.columns.get(field)
+        if column is not None:
+            return column
+        values = np.empty(len(self.source), dtype=object)
+        values[:] = [record.get(field) for record in self.source]
+        return values
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.records())
+
+    def select(self, mask: 'np.ndarray') -> 'ColumnBatch':
+        """
+        Keep the readings where mask is True
+
+        :param mask: Boolean array, one entry per reading
+        :return: New ColumnBatch
+        """
+        return ColumnBatch({field: column[mask] for field, column in self.columns.items()},
+                           self.types, self.source[mask])
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Convert the batch back to reading dicts
+
+        :return: One dict per reading; missing numeric values become None
+        """
+        fields = list(self.columns)
+        values = [_to_list(self.columns[field], self.types[field]) for field in fields]
+        return [{**record, **dict(zip(fields, row))}
+                for record, row in zip(self.source, zip(*values))]
+
+def _to_list(column: 'np.ndarray', kind: type) -> List[Any]:
+    invalid = ~np.isfinite(column)
+    if kind is float:
+        values = column.tolist()
+    else:
+        cast = np.rint(np.where(invalid, 0, column)).astype(np.int64)
+        values = cast.astype(bool).tolist() if kind is bool else cast.tolist()
+    if invalid.any():
+        for index in np.flatnonzero(invalid).tolist():
+            values[index] = None
+    return values
+
+Conversion = Union[Tuple[float, float], Callable[['np.ndarray'], 'np.ndarray']]
+
+class NumericFilter:
+    """
+    Batch filter for numeric telemetry, vectorized with numpy
+
+    Readings are turned into a ColumnBatch from the endpoint schema and then,
+    in this order:
+
+    - ``convert``: unit conversion per field, ``(scale, offset)`` applied as
+      ``value * scale + offset``, or a function taking and returning an array
+    - ``drop_invalid``: readings with a missing, non-numeric, NaN or infinite
+      value in any numeric field are dropped
+    - ``limits``: per field ``(low, high)`` thresholds in converted units,
+      either side None for unbounded; readings outside are dropped
+    - ``smooth``: per field trailing moving average over that many readings,
+      carried across batches, so use one NumericFilter per stream
+
+    Register it like any batch filter; process_many/process_batch hand it the
+    whole batch and the handler receives the resulting ColumnBatch.
+    """
+    batch = True
+
+    def __init__(self, schema: Dict[str, str],
+                 convert: Optional[Dict[str, Conversion]] = None,
+                 limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                 smooth: Optional[Dict[str, int]] = None,
+                 drop_invalid: bool = True):
+        _require_numpy()
+        self.schema = dict(schema)
+        self.types = numeric_fields(self.schema)
+        self.convert = dict(convert or {})
+        self.limits = dict(limits or {})
+        self.smooth = dict(smooth or {})
+        self.drop_invalid = drop_invalid
+        for option, fields in (('convert', self.convert), ('limits', self.limits),
+                               ('smooth', self.smooth)):
+            for field in fields:
+                if field not in self.types:
+                    raise ValueError(f"{option}: {field} is not a numeric schema field")
+        for field, window in self.smooth.items():
+            if not isinstance(window, int) or window < 1:
+                raise ValueError(f"Invalid smoothing window for {field}: {window}")
+        # field -> last window - 1 smoothed inputs of the previous batches
+        self._tails = {field: np.empty(0) for field in self.smooth}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], **options) -> 'NumericFilter':
+        """
+        Build a filter from an endpoint config with a ``schema``
+
+        :param config: Endpoint configuration
+        :param options: convert, limits, smooth and drop_invalid
+        :return: NumericFilter
+        :raises ValueError: If the config has no schema
+        """
+        schema = config.get('schema') if isinstance(config, Mapping) else None
+        if not isinstance(schema, dict):
+            raise ValueError("Endpoint config has no schema")
+        return cls(schema, **options)
+
+    def __call__(self, batch: Union[ColumnBatch, Iterable[Dict[str, Any]]]) -> ColumnBatch:
+        """
+        Filter a batch of readings
+
+        :param batch: Reading dicts or a ColumnBatch
+        :return: ColumnBatch of the readings kept
+        """
+        if not isinstance(batch, ColumnBatch):
+            batch = ColumnBatch.from_records(batch, self.schema)
+        columns = dict(batch.columns)
+        for field, conversion in self.convert.items():
+            if callable(conversion):
+                columns[field] = np.asarray(conversion(columns[field]), dtype=np.float64)
+            else:
+                scale, offset = conversion
+                columns[field] = columns[field] * scale + offset
+        batch = ColumnBatch(columns, batch.types, batch.source)
+
+        mask = None
+        if self.drop_invalid:
+            for field in self.types:
+                valid = np.isfinite(columns[field])
+                mask = valid if mask is None else mask & valid
+        for field, (low, high) in self.limits.items():
+            column = columns[field]
+            if low is not None:
+                mask = column >= low if mask is None else mask & (column >= low)
+            if high is not None:
+                mask = column <= high if mask is None else mask & (column <= high)
+        if mask is not None and not mask.all():
+            batch = batch.select(mask)
+
+        if self.smooth:
+            with self._lock:
+                for field, window in self.smooth.items():
+                    batch.columns[field] = self._moving_average(field, batch.columns[field], window)
+        return batch
+
+    def _moving_average(self, field: str, column: 'np.ndarray', window: int) -> 'np.ndarray':
+        tail = self._tails[field]
+        values = np.concatenate((tail, column))
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        end = np.arange(1, len(values) + 1)
+        start = np.maximum(end - window, 0)
+        averages = (sums[end] - sums[start]) / (end - start)
+        self._tails[field] = values[-(window - 1):] if window > 1 else values[:0]
+        return averages[len(tail):]